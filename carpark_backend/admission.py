@@ -0,0 +1,137 @@
+# Admission control for the search endpoints.
+# Each client (a known X-API-Key, or IP otherwise) gets a token bucket, and at most
+# ADMISSION_MAX_CONCURRENT requests run at once. A request that can't get a slot within
+# ADMISSION_QUEUE_TIMEOUT, or arrives when ADMISSION_MAX_QUEUE are already waiting, is shed
+# straight away with 503 rather than piling more OneMap calls onto a saturated process.
+
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException, Request
+
+from deadline import DeadlineExceeded, time_left
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "32"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "0.5"))  # seconds
+RATE_LIMIT_PER_SEC = float(os.getenv("RATE_LIMIT_PER_SEC", "5"))  # per client, 0 disables
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "20"))
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))  # buckets kept, least recent dropped
+# Keys that get their own bucket. Anything else is ignored, or a client could dodge its IP's limit by
+# sending a fresh key with every request.
+API_KEYS = frozenset(key.strip() for key in os.getenv("API_KEYS", "").split(",") if key.strip())
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity: float, now: float):
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, rate: float, capacity: float, now: float) -> float:
+        """Takes a token and returns 0, or returns the seconds until one will be available."""
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / rate
+
+
+def client_key(request: Request, api_keys: frozenset = API_KEYS) -> str:
+    api_key = request.headers.get("x-api-key")
+    if api_key and api_key in api_keys:
+        return "key:" + api_key
+    return "ip:" + (request.client.host if request.client else "unknown")
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int = ADMISSION_MAX_CONCURRENT, max_queue: int = ADMISSION_MAX_QUEUE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT, rate: float = RATE_LIMIT_PER_SEC,
+                 burst: float = RATE_LIMIT_BURST, max_clients: int = RATE_LIMIT_MAX_CLIENTS,
+                 api_keys: frozenset = API_KEYS):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.api_keys = api_keys
+        self.buckets = OrderedDict()
+        self.slots = asyncio.Semaphore(max_concurrent)
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected_rate_limited = 0
+        self.rejected_overloaded = 0
+
+    def _check_rate(self, key: str):
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(self.burst, now)
+            if len(self.buckets) > self.max_clients:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+        wait = bucket.take(self.rate, self.burst, now)
+        if wait:
+            self.rejected_rate_limited += 1
+            raise HTTPException(status_code=429, detail="Too many requests",
+                                headers={"Retry-After": str(math.ceil(wait))})
+
+    def _shed(self):
+        self.rejected_overloaded += 1
+        raise HTTPException(status_code=503, detail="Server busy, try again shortly",
+                            headers={"Retry-After": "1"})
+
+    async def _acquire(self):
+        if self.slots.locked():
+            if self.waiting >= self.max_queue:
+                self._shed()
+            try:
+                # no point queueing past the request's own deadline
+                timeout = time_left(self.queue_timeout)
+            except DeadlineExceeded:
+                self._shed()
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self.slots.acquire(), timeout)
+            except asyncio.TimeoutError:
+                self._shed()
+            finally:
+                self.waiting -= 1
+        else:
+            await self.slots.acquire()
+
+    @asynccontextmanager
+    async def admit(self, request: Request):
+        """Holds a concurrency slot for the body of the with block, or raises 429 / 503."""
+        self._check_rate(client_key(request, self.api_keys))
+        await self._acquire()
+        self.admitted += 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected_rate_limited": self.rejected_rate_limited,
+            "rejected_overloaded": self.rejected_overloaded,
+        }
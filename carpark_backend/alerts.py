@@ -0,0 +1,388 @@
+# Threshold alerts: "tell me when HG16 drops below 20 lots", "when any carpark within 500 m of here has
+# more than 50 free". Delivered to a webhook, or to an SSE channel (GET /alerts/stream?channel=).
+#
+# POST /alerts returns the alert's channel; several alerts can share one by passing it back in.
+#
+# Alerts fire when a carpark crosses the threshold (e.g. 25 -> 18 for "below 20"), not on every poll
+# while it stays there. Evaluation only looks at each poll's changes: for a carpark going from old to
+# new lots, the "below" alerts that fire are exactly those with a threshold in (new, old], and "above"
+# ones in [old, new). Thresholds are kept sorted per carpark (carpark alerts) and per grid cell (area
+# alerts, filed under each cell their circle overlaps), so each change is two bisects per index plus
+# the alerts that actually fire, however many alerts exist.
+
+import asyncio
+import bisect
+import ipaddress
+import logging
+import os
+import secrets
+import socket
+import time
+from typing import Optional
+from urllib.parse import urlparse
+
+import orjson
+import requests
+from fastapi import HTTPException
+from pydantic import BaseModel, Field
+
+from live_updates import Subscription, drain
+from response_encoder import sse_event
+from spatial_index import SpatialIndex, haversine, M_PER_DEG_LAT
+
+logger = logging.getLogger(__name__)
+
+ALERT_MAX = int(os.getenv("ALERT_MAX", "500000"))
+ALERT_CELL_M = float(os.getenv("ALERT_CELL_M", "1000"))
+ALERT_WEBHOOK_TIMEOUT = float(os.getenv("ALERT_WEBHOOK_TIMEOUT", "5"))
+ALERT_WEBHOOK_WORKERS = int(os.getenv("ALERT_WEBHOOK_WORKERS", "4"))
+ALERT_WEBHOOK_QUEUE = int(os.getenv("ALERT_WEBHOOK_QUEUE", "10000"))  # pending deliveries before dropping
+ALERT_MAX_CHANNEL_STREAMS = int(os.getenv("ALERT_MAX_CHANNEL_STREAMS", "10000"))
+# Alerts one client (API key or IP) may hold, and alerts that may deliver to one webhook host or channel:
+# without the second, anyone could point thousands of repeating alerts at somebody else's server.
+ALERT_MAX_PER_CLIENT = int(os.getenv("ALERT_MAX_PER_CLIENT", "100"))
+ALERT_MAX_PER_TARGET = int(os.getenv("ALERT_MAX_PER_TARGET", "100"))
+# If set, the only hosts webhooks may go to (comma-separated). Either way they must resolve to public addresses.
+ALERT_WEBHOOK_HOSTS = frozenset(h.strip().lower() for h in os.getenv("ALERT_WEBHOOK_HOSTS", "").split(",") if h.strip())
+
+BELOW, ABOVE = "below", "above"
+
+
+class AlertRequest(BaseModel):
+    carpark_number: Optional[str] = None
+    lat: Optional[float] = Field(None, ge=-90, le=90)
+    lng: Optional[float] = Field(None, ge=-180, le=180)
+    radius: float = Field(500, gt=0, le=5000)
+    below: Optional[int] = Field(None, ge=1)
+    above: Optional[int] = Field(None, ge=0)
+    webhook: Optional[str] = None
+    channel: Optional[str] = Field(None, min_length=8, max_length=64)
+    once: bool = True
+
+
+class Alert:
+    __slots__ = ("id", "carpark_number", "lat", "lng", "radius", "condition", "threshold", "webhook", "channel",
+                 "once", "cells", "created", "fired", "owner")
+
+    def to_dict(self) -> dict:
+        alert = {"id": self.id, "condition": self.condition, "threshold": self.threshold, "once": self.once,
+                 "created": self.created, "fired": self.fired}
+        if self.carpark_number:
+            alert["carpark_number"] = self.carpark_number
+        else:
+            alert.update(lat=self.lat, lng=self.lng, radius=self.radius)
+        alert.update({"webhook": self.webhook} if self.webhook else {"channel": self.channel})
+        return alert
+
+
+class ThresholdIndex:
+    """key -> thresholds in ascending order, with the alert id for each."""
+
+    def __init__(self):
+        self.keys = {}
+
+    def add(self, key, threshold: int, alert_id: str):
+        thresholds, ids = self.keys.setdefault(key, ([], []))
+        i = bisect.bisect_right(thresholds, threshold)
+        thresholds.insert(i, threshold)
+        ids.insert(i, alert_id)
+
+    def remove(self, key, threshold: int, alert_id: str):
+        thresholds, ids = self.keys[key]
+        i = bisect.bisect_left(thresholds, threshold)
+        while ids[i] != alert_id:
+            i += 1
+        del thresholds[i], ids[i]
+        if not thresholds:
+            del self.keys[key]
+
+    def crossed(self, key, condition: str, old: Optional[int], new: int) -> list:
+        """Ids whose threshold was crossed going from old to new lots (old None: whatever new satisfies)."""
+        entry = self.keys.get(key)
+        if entry is None:
+            return []
+        thresholds, ids = entry
+        if condition == BELOW:  # new < T <= old
+            lo = bisect.bisect_right(thresholds, new)
+            hi = len(thresholds) if old is None else bisect.bisect_right(thresholds, old)
+        else:  # old <= T < new
+            lo = 0 if old is None else bisect.bisect_left(thresholds, old)
+            hi = bisect.bisect_left(thresholds, new)
+        return ids[lo:hi]
+
+
+def _lots(available_lots) -> Optional[int]:
+    try:
+        return int(available_lots)
+    except (TypeError, ValueError):
+        return None
+
+
+def _public(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%")[0])  # drop an IPv6 zone
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def check_webhook(url: str, resolve: bool = True, allowed_hosts: frozenset = ALERT_WEBHOOK_HOSTS):
+    """
+    Raises ValueError unless url is http(s) to a host that is allowed and only resolves to public addresses
+    (not loopback, private, link-local, reserved, cloud metadata...), so alerts can't be aimed inside our network.
+    With resolve=False only IP-literal hosts are checked for their address, so it never blocks.
+    """
+    url = urlparse(url)
+    if url.scheme not in ("http", "https") or not url.hostname:
+        raise ValueError("webhook must be an http(s) URL")
+    host = url.hostname.lower()
+    if allowed_hosts and host not in allowed_hosts:
+        raise ValueError("webhook host is not allowed")
+    try:
+        addresses = [str(ipaddress.ip_address(host))]
+    except ValueError:
+        if not resolve:
+            return
+        try:
+            infos = socket.getaddrinfo(host, url.port or url.scheme, type=socket.SOCK_STREAM)
+            addresses = [info[4][0] for info in infos]
+        except (socket.gaierror, UnicodeError):
+            raise ValueError("webhook host does not resolve")
+    if not addresses or not all(_public(address) for address in addresses):
+        raise ValueError("webhook must be a public address")
+
+
+def _target(alert) -> str:
+    """Where an alert delivers to, as counted against ALERT_MAX_PER_TARGET: the webhook's host, or the channel."""
+    return "webhook:" + urlparse(alert.webhook).hostname.lower() if alert.webhook else "channel:" + alert.channel
+
+
+def _satisfied(condition: str, threshold: int, lots: Optional[int]) -> bool:
+    return lots is not None and (lots < threshold if condition == BELOW else lots > threshold)
+
+
+def _post_webhook(url: str, event: dict) -> requests.Response:
+    # Checked again at send time: the host's DNS may have changed since the alert was registered.
+    # No redirects, or a public host could bounce the request somewhere internal.
+    check_webhook(url)
+    return requests.post(url, json=event, timeout=ALERT_WEBHOOK_TIMEOUT, allow_redirects=False)
+
+
+class AlertEngine:
+    def __init__(self, service, max_alerts: int = ALERT_MAX, cell_m: float = ALERT_CELL_M,
+                 max_per_client: int = ALERT_MAX_PER_CLIENT, max_per_target: int = ALERT_MAX_PER_TARGET):
+        self.service = service
+        self.max_alerts = max_alerts
+        self.max_per_client = max_per_client
+        self.max_per_target = max_per_target
+        self.counts = {}  # owner / _target key -> alerts registered under it
+        self.grid = SpatialIndex(cell_m)  # only its cell maths is used
+        self.alerts = {}
+        self.by_carpark = {BELOW: ThresholdIndex(), ABOVE: ThresholdIndex()}
+        self.by_cell = {BELOW: ThresholdIndex(), ABOVE: ThresholdIndex()}
+        self.last = {}  # carpark_number -> lots as of the last change seen, None if not a number
+        self.channels = {}  # channel -> set of Subscription
+        self.webhooks = asyncio.Queue(ALERT_WEBHOOK_QUEUE)
+        self.fired = 0
+        self.webhook_sent = 0
+        self.webhook_failed = 0
+        self.dropped = 0
+
+    # --- registration ---------------------------------------------------------------------------
+
+    def _cells(self, lat: float, lng: float, radius: float) -> list:
+        dlat = radius / M_PER_DEG_LAT
+        dlng = radius / self.grid.m_per_deg_lng
+        x0, y0 = self.grid._cell(lat - dlat, lng - dlng)
+        x1, y1 = self.grid._cell(lat + dlat, lng + dlng)
+        return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+    def _count(self, key: str, delta: int):
+        count = self.counts.get(key, 0) + delta
+        if count:
+            self.counts[key] = count
+        else:
+            del self.counts[key]
+
+    def add(self, request: AlertRequest, owner: str = "") -> Alert:
+        """
+        Registers an alert for owner (400 if the request is malformed, 429 if owner or its webhook host / channel
+        has too many); fires at once if the condition already holds.
+        """
+        if (request.below is None) == (request.above is None):
+            raise HTTPException(status_code=400, detail="Exactly one of below / above is required")
+        if bool(request.carpark_number) == (request.lat is not None and request.lng is not None):
+            raise HTTPException(status_code=400, detail="Give either carpark_number or lat and lng")
+        if request.webhook is not None and request.channel is not None:
+            raise HTTPException(status_code=400, detail="Give webhook or channel, not both")
+        if request.webhook is not None:
+            try:
+                check_webhook(request.webhook, resolve=False)  # resolving is check_webhook_host's job
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        if request.carpark_number and request.carpark_number not in self.service.carpark_data:
+            raise HTTPException(status_code=404, detail="Carpark not found")
+        if len(self.alerts) >= self.max_alerts:
+            raise HTTPException(status_code=503, detail="Alert capacity reached", headers={"Retry-After": "60"})
+
+        alert = Alert()
+        alert.id = secrets.token_urlsafe(12)  # also what deleting it takes, so it mustn't be guessable
+        alert.carpark_number = request.carpark_number
+        alert.lat, alert.lng, alert.radius = request.lat, request.lng, request.radius
+        alert.condition = BELOW if request.below is not None else ABOVE
+        alert.threshold = request.below if request.below is not None else request.above
+        alert.webhook, alert.once = request.webhook, request.once
+        # No webhook: deliver on a channel, a fresh unguessable one unless the client is reusing its own
+        alert.channel = None if request.webhook else request.channel or secrets.token_urlsafe(16)
+        alert.created = time.time()
+        alert.fired = 0
+        alert.owner = "client:" + owner
+        if self.counts.get(alert.owner, 0) >= self.max_per_client:
+            raise HTTPException(status_code=429, detail="Too many alerts for this client, delete some first")
+        if self.counts.get(_target(alert), 0) >= self.max_per_target:
+            raise HTTPException(status_code=429, detail="Too many alerts for this webhook host or channel")
+
+        if alert.carpark_number:
+            alert.cells = ()
+            watched = [alert.carpark_number]
+        else:
+            alert.cells = tuple(self._cells(alert.lat, alert.lng, alert.radius))
+            watched = [cp for _, cp in self.service.spatial_index.within_radius(alert.lat, alert.lng, alert.radius)]
+
+        # Conditions that already hold fire straight away; after that only crossings do
+        for cp_number in watched:
+            lots = self.last.setdefault(cp_number, self._current(cp_number))
+            if _satisfied(alert.condition, alert.threshold, lots):
+                self._fire(alert, cp_number, lots, None, "current")
+                if alert.once:
+                    return alert
+
+        self.alerts[alert.id] = alert
+        self._count(alert.owner, 1)
+        self._count(_target(alert), 1)
+        if alert.carpark_number:
+            self.by_carpark[alert.condition].add(alert.carpark_number, alert.threshold, alert.id)
+        for cell in alert.cells:
+            self.by_cell[alert.condition].add(cell, alert.threshold, alert.id)
+        return alert
+
+    async def check_webhook_host(self, url: str):
+        """400 unless url's host resolves to public addresses only. DNS runs off the event loop."""
+        try:
+            await asyncio.to_thread(check_webhook, url)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    def remove(self, alert_id: str) -> bool:
+        alert = self.alerts.pop(alert_id, None)
+        if alert is None:
+            return False
+        self._count(alert.owner, -1)
+        self._count(_target(alert), -1)
+        if alert.carpark_number:
+            self.by_carpark[alert.condition].remove(alert.carpark_number, alert.threshold, alert.id)
+        for cell in alert.cells:
+            self.by_cell[alert.condition].remove(cell, alert.threshold, alert.id)
+        return True
+
+    def _current(self, cp_number: str) -> Optional[int]:
+        _, available_lots = self.service._availability(cp_number, self.service.carpark_data[cp_number]["type"])
+        return _lots(available_lots)
+
+    # --- evaluation -------------------------------------------------------------------------------
+
+    def on_update(self, source: str, changes: dict):
+        """Availability listener: fires the alerts whose threshold a changed carpark crossed."""
+        if not self.alerts:
+            for cp_number, (_, available_lots) in changes.items():
+                self.last[cp_number] = _lots(available_lots)
+            return
+        for cp_number, (_, available_lots) in changes.items():
+            new = _lots(available_lots)
+            old = self.last.get(cp_number)
+            self.last[cp_number] = new
+            if new is None or new == old:
+                continue
+            for condition in (BELOW, ABOVE):
+                for alert_id in self.by_carpark[condition].crossed(cp_number, condition, old, new):
+                    self._fire(self.alerts[alert_id], cp_number, new, old, source)
+                for alert in self._area_alerts(cp_number, condition, old, new):
+                    self._fire(alert, cp_number, new, old, source)
+
+    def _area_alerts(self, cp_number: str, condition: str, old: Optional[int], new: int) -> list:
+        lat, lng = self.service.carpark_data.get(cp_number, {}).get("coordinates", (None, None))
+        if lat is None or lng is None:
+            return []
+        matches = []
+        for alert_id in self.by_cell[condition].crossed(self.grid._cell(lat, lng), condition, old, new):
+            alert = self.alerts.get(alert_id)
+            if alert is not None and haversine(lat, lng, alert.lat, alert.lng) <= alert.radius:
+                matches.append(alert)
+        return matches
+
+    def _fire(self, alert: Alert, cp_number: str, lots: int, previous: Optional[int], source: str):
+        if alert.once and alert.fired:
+            return  # already fired for another carpark in the same poll
+        alert.fired += 1
+        self.fired += 1
+        event = {
+            "alert_id": alert.id, "carpark_number": cp_number, "condition": alert.condition,
+            "threshold": alert.threshold, "available_lots": lots, "previous_lots": previous,
+            "source": source, "time": time.time(),
+        }
+        if alert.webhook:
+            try:
+                self.webhooks.put_nowait((alert.webhook, event))
+            except asyncio.QueueFull:
+                self.dropped += 1
+        else:
+            frame = sse_event("alert", orjson.dumps(event))
+            for subscription in self.channels.get(alert.channel, ()):
+                subscription.offer(frame)
+        if alert.once:
+            self.remove(alert.id)
+
+    # --- delivery ---------------------------------------------------------------------------------
+
+    def start(self, workers: int = ALERT_WEBHOOK_WORKERS) -> list:
+        """Starts the webhook senders; call from the running event loop."""
+        return [asyncio.create_task(self._send_webhooks()) for _ in range(workers)]
+
+    async def _send_webhooks(self):
+        while True:
+            url, event = await self.webhooks.get()
+            try:
+                response = await asyncio.to_thread(_post_webhook, url, event)
+                response.raise_for_status()
+                self.webhook_sent += 1
+            except Exception as e:
+                self.webhook_failed += 1
+                logger.warning(f"Alert {event['alert_id']} webhook to {url} failed: {e}")
+
+    def channel_full(self) -> bool:
+        return sum(len(subs) for subs in self.channels.values()) >= ALERT_MAX_CHANNEL_STREAMS
+
+    async def stream(self, channel: str):
+        """SSE "alert" events for every alert registered with channel, for as long as the client listens."""
+        subscription = Subscription(frozenset())
+        self.channels.setdefault(channel, set()).add(subscription)
+        try:
+            yield b": listening\n\n"
+            async for frame in drain(subscription):
+                yield frame
+        finally:
+            subscriptions = self.channels.get(channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.channels[channel]
+
+    def stats(self) -> dict:
+        return {
+            "alerts": len(self.alerts),
+            "fired": self.fired,
+            "webhooks_sent": self.webhook_sent,
+            "webhooks_failed": self.webhook_failed,
+            "webhooks_pending": self.webhooks.qsize(),
+            "webhooks_dropped": self.dropped,
+            "channel_streams": sum(len(subs) for subs in self.channels.values()),
+        }
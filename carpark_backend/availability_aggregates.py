@@ -0,0 +1,209 @@
+# Lot totals per map area, for the heatmap / dashboards: GET /availability/heatmap.
+# Carparks are bucketed once at load into grid cells at each of HEATMAP_CELL_SIZES (a small pyramid:
+# 250 m, 500 m, ... cells) and into URA planning areas, if a boundary file is available. Each group keeps
+# running sums (carparks, reporting carparks, total and available lots of those reporting), and each
+# applied poll adds the deltas of the carparks it changed. A heatmap request then reads the cells in its
+# bounding box at the requested size, without touching individual carparks.
+#
+# Planning areas come from PLANNING_AREAS_FILE: GeoJSON of polygons, e.g. URA's Master Plan 2019
+# Planning Area Boundary from data.gov.sg. The area name is the PLANNING_AREA_PROPERTY property
+# (or, in the data.gov.sg KML-derived files, the PLN_AREA_N row of the Description table).
+
+import json
+import logging
+import os
+import re
+from typing import Optional
+
+import numpy as np
+
+from spatial_index import SpatialIndex, M_PER_DEG_LAT
+
+logger = logging.getLogger(__name__)
+
+HEATMAP_CELL_SIZES = tuple(int(m) for m in os.getenv("HEATMAP_CELL_SIZES", "250,500,1000,2000,4000").split(","))
+HEATMAP_MAX_CELLS = int(os.getenv("HEATMAP_MAX_CELLS", "20000"))  # per response; use a larger cell_m past this
+PLANNING_AREAS_FILE = os.getenv("PLANNING_AREAS_FILE", "./data/planning_areas.geojson")
+PLANNING_AREA_PROPERTY = os.getenv("PLANNING_AREA_PROPERTY", "PLN_AREA_N")
+
+_DESCRIPTION_NAME = re.compile(r"<th>\s*PLN_AREA_N\s*</th>\s*<td>\s*([^<]+?)\s*</td>", re.I)
+
+
+def load_planning_areas(path: str = PLANNING_AREAS_FILE, name_property: str = PLANNING_AREA_PROPERTY) -> list:
+    """[(name, [ring, ...])] from a GeoJSON file, rings as (k, 2) arrays of (lng, lat). [] if there's no file."""
+    if not path or not os.path.exists(path):
+        logger.info(f"No planning area file at {path}, heatmap has grid cells only")
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        features = json.load(f).get("features", [])
+
+    areas = {}
+    for feature in features:
+        properties = feature.get("properties") or {}
+        name = properties.get(name_property) or properties.get("name")
+        if not name:
+            match = _DESCRIPTION_NAME.search(properties.get("Description", ""))
+            name = match.group(1) if match else None
+        geometry = feature.get("geometry") or {}
+        if not name or geometry.get("type") not in ("Polygon", "MultiPolygon"):
+            continue
+        polygons = [geometry["coordinates"]] if geometry["type"] == "Polygon" else geometry["coordinates"]
+        rings = areas.setdefault(name.strip().upper(), [])
+        for polygon in polygons:
+            rings.extend(np.asarray(ring, dtype=np.float64)[:, :2] for ring in polygon)
+    logger.info(f"Loaded {len(areas)} planning areas from {path}")
+    return sorted(areas.items())
+
+
+def _inside(lng: np.ndarray, lat: np.ndarray, rings: list) -> np.ndarray:
+    """Even-odd point-in-polygon over all rings at once, so holes and multi-part areas just work."""
+    inside = np.zeros(len(lng), dtype=bool)
+    for ring in rings:
+        x1, y1 = ring[:, 0], ring[:, 1]
+        x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+        for start in range(0, len(lng), 1000):  # bounds the (points x edges) temporaries
+            px, py = lng[start:start + 1000, None], lat[start:start + 1000, None]
+            straddles = (y1 > py) != (y2 > py)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                crosses_x = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+            inside[start:start + 1000] ^= (np.count_nonzero(straddles & (px < crosses_x), axis=1) % 2).astype(bool)
+    return inside
+
+
+def _lots(available_lots) -> Optional[int]:
+    try:
+        return int(available_lots)
+    except (TypeError, ValueError):
+        return None
+
+
+class Rollup:
+    """Running sums per group; group[i] is carpark i's group, -1 for none."""
+
+    def __init__(self, group: np.ndarray, n_groups: int):
+        self.group = group
+        grouped = group >= 0
+        self.carparks = np.bincount(group[grouped], minlength=n_groups).astype(np.int32)
+        self.reporting = np.zeros(n_groups, dtype=np.int32)
+        self.total_lots = np.zeros(n_groups, dtype=np.int64)
+        self.available_lots = np.zeros(n_groups, dtype=np.int64)
+
+    def add(self, idx: np.ndarray, d_reporting: np.ndarray, d_total: np.ndarray, d_available: np.ndarray):
+        group = self.group[idx]
+        grouped = group >= 0
+        group = group[grouped]
+        np.add.at(self.reporting, group, d_reporting[grouped])
+        np.add.at(self.total_lots, group, d_total[grouped])
+        np.add.at(self.available_lots, group, d_available[grouped])
+
+    def row(self, g: int) -> dict:
+        return {"carparks": int(self.carparks[g]), "reporting": int(self.reporting[g]),
+                "total_lots": int(self.total_lots[g]), "available_lots": int(self.available_lots[g])}
+
+
+class AvailabilityAggregates:
+    def __init__(self, carpark_data: dict, areas: list = (), cell_sizes=HEATMAP_CELL_SIZES):
+        self.index = {cp_number: i for i, cp_number in enumerate(carpark_data)}
+        self.types = [cp_info.get("type") for cp_info in carpark_data.values()]
+        coords = [cp_info.get("coordinates") or (None, None) for cp_info in carpark_data.values()]
+        located = np.array([lat is not None and lng is not None for lat, lng in coords], dtype=bool)
+        lat = np.array([c[0] if ok else 0.0 for c, ok in zip(coords, located)], dtype=np.float64)
+        lng = np.array([c[1] if ok else 0.0 for c, ok in zip(coords, located)], dtype=np.float64)
+
+        # Per-carpark contribution: total and available lots if it reports a number, else nothing
+        self.reporting = np.zeros(len(self.index), dtype=np.int32)
+        self.total_lots = np.zeros(len(self.index), dtype=np.int64)
+        self.available_lots = np.zeros(len(self.index), dtype=np.int64)
+
+        self.levels = {}  # cell_m -> (grid, cell x array, cell y array, Rollup)
+        for cell_m in cell_sizes:
+            grid = SpatialIndex(cell_m)
+            cells, group = {}, np.full(len(self.index), -1, dtype=np.int32)
+            for i in np.flatnonzero(located):
+                group[i] = cells.setdefault(grid._cell(lat[i], lng[i]), len(cells))
+            xy = np.array(list(cells), dtype=np.int64).reshape(-1, 2)
+            self.levels[cell_m] = (grid, xy[:, 0], xy[:, 1], Rollup(group, len(cells)))
+
+        self.area_names = [name for name, _ in areas]
+        area_group = np.full(len(self.index), -1, dtype=np.int32)
+        self.area_bounds = np.zeros((len(areas), 4))  # min_lat, min_lng, max_lat, max_lng of the boundary
+        for a, (_, rings) in enumerate(areas):
+            points = np.concatenate(rings)
+            min_lng, min_lat = points.min(axis=0)
+            max_lng, max_lat = points.max(axis=0)
+            self.area_bounds[a] = (min_lat, min_lng, max_lat, max_lng)
+            # First area wins where boundaries overlap; only unassigned carparks in the bounding box are tested
+            candidates = np.flatnonzero(located & (area_group < 0) & (lat >= min_lat) & (lat <= max_lat)
+                                        & (lng >= min_lng) & (lng <= max_lng))
+            area_group[candidates[_inside(lng[candidates], lat[candidates], rings)]] = a
+        self.areas = Rollup(area_group, len(areas))
+        if areas:
+            logger.info(f"{np.count_nonzero(area_group >= 0)} of {len(self.index)} carparks in a planning area")
+
+        self.apply(None, {cp_number: (cp_info.get("total_lots", 0), cp_info.get("available_lots"))
+                          for cp_number, cp_info in carpark_data.items()})
+
+    def apply(self, source: Optional[str], changes: dict):
+        """
+        Applies a poll's {carpark_number: (total_lots, available_lots)} changes to every rollup. Changes for
+        carparks of the other type are ignored, as the served availability comes from their own source.
+        """
+        idx, reporting, total, available = [], [], [], []
+        for cp_number, (total_lots, available_lots) in changes.items():
+            i = self.index.get(cp_number)
+            if i is None or (source is not None and self.types[i] != source):
+                continue
+            lots = _lots(available_lots)
+            idx.append(i)
+            reporting.append(lots is not None)
+            total.append((_lots(total_lots) or 0) if lots is not None else 0)
+            available.append(lots if lots is not None else 0)
+        if not idx:
+            return
+        idx = np.array(idx, dtype=np.int64)
+        d_reporting = np.array(reporting, dtype=np.int32) - self.reporting[idx]
+        d_total = np.array(total, dtype=np.int64) - self.total_lots[idx]
+        d_available = np.array(available, dtype=np.int64) - self.available_lots[idx]
+        self.reporting[idx] += d_reporting
+        self.total_lots[idx] += d_total
+        self.available_lots[idx] += d_available
+        for _, _, _, rollup in self.levels.values():
+            rollup.add(idx, d_reporting, d_total, d_available)
+        self.areas.add(idx, d_reporting, d_total, d_available)
+
+    def heatmap(self, bbox: tuple, cell_m: int) -> dict:
+        """
+        Cells of size cell_m (one of the configured sizes, else KeyError) with a carpark inside
+        bbox = (min_lat, min_lng, max_lat, max_lng), and the planning areas whose boundary overlaps it.
+        ValueError if that's more than HEATMAP_MAX_CELLS cells.
+        """
+        grid, cell_x, cell_y, rollup = self.levels[cell_m]
+        min_lat, min_lng, max_lat, max_lng = bbox
+        x0, y0 = grid._cell(min_lat, min_lng)
+        x1, y1 = grid._cell(max_lat, max_lng)
+        selected = np.flatnonzero((cell_x >= x0) & (cell_x <= x1) & (cell_y >= y0) & (cell_y <= y1))
+        if len(selected) > HEATMAP_MAX_CELLS:
+            raise ValueError(f"{len(selected)} cells in bbox, more than {HEATMAP_MAX_CELLS}")
+
+        south = cell_y[selected] * (cell_m / M_PER_DEG_LAT)
+        west = cell_x[selected] * (cell_m / grid.m_per_deg_lng)
+        columns = zip(south.tolist(), west.tolist(), (south + cell_m / M_PER_DEG_LAT).tolist(),
+                      (west + cell_m / grid.m_per_deg_lng).tolist(), rollup.carparks[selected].tolist(),
+                      rollup.reporting[selected].tolist(), rollup.total_lots[selected].tolist(),
+                      rollup.available_lots[selected].tolist())
+        cells = [{"bounds": [s, w, n, e], "carparks": carparks, "reporting": reporting, "total_lots": total,
+                  "available_lots": available}
+                 for s, w, n, e, carparks, reporting, total, available in columns]
+
+        bounds = self.area_bounds
+        overlapping = np.flatnonzero((bounds[:, 0] <= max_lat) & (bounds[:, 2] >= min_lat)
+                                     & (bounds[:, 1] <= max_lng) & (bounds[:, 3] >= min_lng))
+        areas = [{"name": self.area_names[a], **self.areas.row(a)} for a in overlapping]
+
+        totals = {
+            "carparks": int(rollup.carparks[selected].sum()),
+            "reporting": int(rollup.reporting[selected].sum()),
+            "total_lots": int(rollup.total_lots[selected].sum()),
+            "available_lots": int(rollup.available_lots[selected].sum()),
+        }
+        return {"cell_m": cell_m, "bbox": list(bbox), "totals": totals, "cells": cells, "areas": areas}
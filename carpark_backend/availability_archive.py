@@ -0,0 +1,323 @@
+# On-disk archive of every applied availability poll, for months of history without a database.
+# Each poll appends its changes as rows of three columns (carpark slot, poll time, stored lots: lots + 1,
+# 0 for 'N/A', as in availability_history), plus the poll time itself, so polls that changed nothing
+# are kept too. Rows are buffered in memory and written every ARCHIVE_FLUSH_SECONDS as a compressed
+# segment (numpy .npz) under a directory per day. Once a day is over its segments are compacted into
+# one file per day, and days older than ARCHIVE_RETENTION_DAYS are deleted:
+#
+#   ARCHIVE_DIR/2026-10-18.npz               compacted day
+#   ARCHIVE_DIR/2026-10-19/1760832000123.npz today's segments, named by their first poll time (ms)
+#
+# Only changes are stored, so a carpark that stays put for days has no row in them. To make any point in
+# time readable on its own, the first poll after startup and the first poll of each day are written as
+# keyframes: a row for every carpark with its lots as of that poll. Reading from time T starts at the
+# latest keyframe at or before T.
+#
+# Every file carries its own carpark table (slot -> carpark number), so files written with different
+# datasets still read back correctly. Writes happen off the event loop; the poll path only appends to a list.
+# scan() reads a time range back, day by day; on startup the service replays recent days into
+# availability history (and the forecast profiles), so restarts don't lose them.
+#
+#   python availability_archive.py export --from 2026-10-01 --to 2026-10-08 [--carpark HG16] > lots.csv
+#   python availability_archive.py compact
+
+import argparse
+import asyncio
+import csv
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "./data/archive")  # empty disables the archive
+ARCHIVE_FLUSH_SECONDS = float(os.getenv("ARCHIVE_FLUSH_SECONDS", "300"))
+ARCHIVE_RETENTION_DAYS = int(os.getenv("ARCHIVE_RETENTION_DAYS", "180"))
+# Rows held in memory if writes keep failing (disk full, ...); past this the oldest batches are dropped
+ARCHIVE_MAX_PENDING_ROWS = int(os.getenv("ARCHIVE_MAX_PENDING_ROWS", "5000000"))
+
+DAY_FORMAT = "%Y-%m-%d"
+
+
+def _day(t: float) -> date:
+    return datetime.fromtimestamp(t).date()
+
+
+def _write(path: str, carparks: np.ndarray, polls: np.ndarray, t: np.ndarray, slot: np.ndarray, lots: np.ndarray,
+           keyframes: np.ndarray):
+    """Writes one archive file atomically: a crash leaves either the old file or the whole new one."""
+    tmp = path + ".tmp"
+    slot = slot.astype(np.min_scalar_type(max(len(carparks) - 1, 0)))
+    with open(tmp, "wb") as f:
+        np.savez_compressed(f, carparks=carparks, polls=polls, t=t, slot=slot, lots=lots, keyframes=keyframes)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _read(path: str) -> tuple:
+    with np.load(path) as f:
+        keyframes = f["keyframes"] if "keyframes" in f.files else np.zeros(0, dtype=np.float64)
+        return f["carparks"], f["polls"], f["t"], f["slot"].astype(np.int64), f["lots"], keyframes
+
+
+def _merge(parts: list) -> tuple:
+    """Concatenates (carparks, polls, t, slot, lots, keyframes) parts in time order, onto one carpark table."""
+    carparks = sorted(set().union(*(part[0].tolist() for part in parts)))
+    table = {cp_number: i for i, cp_number in enumerate(carparks)}
+    slots = [np.array([table[cp] for cp in part[0].tolist()], dtype=np.int64)[part[3]] for part in parts]
+    polls = np.concatenate([part[1] for part in parts])
+    t = np.concatenate([part[2] for part in parts])
+    slot = np.concatenate(slots) if slots else np.zeros(0, dtype=np.int64)
+    lots = np.concatenate([part[4] for part in parts])
+    keyframes = np.concatenate([part[5] for part in parts])
+    order = np.argsort(t, kind="stable")  # parts are each sorted; this only matters if they overlap
+    return np.array(carparks), np.sort(polls), t[order], slot[order], lots[order], np.sort(keyframes)
+
+
+class AvailabilityArchive:
+    def __init__(self, directory: str, carpark_numbers, retention_days: int = ARCHIVE_RETENTION_DAYS):
+        self.directory = directory
+        self.carparks = np.array(list(carpark_numbers))
+        self.retention_days = retention_days
+        os.makedirs(directory, exist_ok=True)
+        # Polls since the last flush: [(poll time, slots, stored lots, is a keyframe)]. append runs on the event
+        # loop and flush in a worker thread, so both go through _lock; _flush_lock keeps flushes one at a time.
+        self.pending = []
+        self.pending_rows = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.state = np.zeros(len(self.carparks), dtype=np.uint16)  # stored lots as of the last append
+        self.last_day = None  # day of the last append; None until the first, which is a keyframe
+        self.segments_written = 0
+        self.rows_written = 0
+        self.dropped_rows = 0
+        self.last_flush = None
+        self.compacted_through = None  # last day known to be compacted
+
+    def append(self, now: float, columns: np.ndarray, values: np.ndarray):
+        """Queues a poll's changes (availability_history.columns() output, in this archive's slot order)."""
+        self.state[columns] = values
+        day = _day(now)
+        if day != self.last_day:
+            self.last_day = day
+            columns, values = np.arange(len(self.state), dtype=np.uint32), self.state.copy()
+            keyframe = True
+        else:
+            keyframe = False
+        with self._lock:
+            self.pending.append((now, columns, values, keyframe))
+            self.pending_rows += len(columns) + 1
+
+    # --- writing ----------------------------------------------------------------------------------
+
+    def _segment_path(self, first: float) -> str:
+        day_dir = os.path.join(self.directory, _day(first).strftime(DAY_FORMAT))
+        os.makedirs(day_dir, exist_ok=True)
+        return os.path.join(day_dir, f"{int(first * 1000)}.npz")
+
+    def write_batch(self, batch: list):
+        """Writes queued polls as segments, one per day they fall on."""
+        by_day = {}
+        for poll in batch:
+            by_day.setdefault(_day(poll[0]), []).append(poll)
+        for polls in by_day.values():
+            times = np.round(np.array([poll[0] for poll in polls], dtype=np.float64), 3)
+            t = np.repeat(times, [len(poll[1]) for poll in polls])
+            slot = np.concatenate([poll[1] for poll in polls]).astype(np.int64)
+            lots = np.concatenate([poll[2] for poll in polls]).astype(np.uint16)
+            keyframes = times[[poll[3] for poll in polls]]
+            _write(self._segment_path(times[0]), self.carparks, times, t, slot, lots, keyframes)
+            self.segments_written += 1
+            self.rows_written += len(t)
+
+    def flush(self):
+        """Writes everything queued so far. Synchronous: call via asyncio.to_thread from the event loop."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self.pending, rows = self.pending, [], self.pending_rows
+                self.pending_rows = 0
+            if not batch:
+                return
+            try:
+                self.write_batch(batch)
+                self.last_flush = time.time()
+            except OSError as e:
+                logger.error(f"Archive write failed, keeping {rows} rows for the next flush: {e}")
+                with self._lock:
+                    self.pending = batch + self.pending
+                    self.pending_rows += rows
+                    while self.pending_rows > ARCHIVE_MAX_PENDING_ROWS and len(self.pending) > 1:
+                        columns = self.pending.pop(0)[1]
+                        self.pending_rows -= len(columns) + 1
+                        self.dropped_rows += len(columns) + 1
+
+    def compact(self, today: date = None):
+        """Merges the segments of every day before today into one file per day; deletes expired days."""
+        today = today or date.today()
+        expired_before = today - timedelta(days=self.retention_days)
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            try:
+                day = datetime.strptime(name.removesuffix(".npz"), DAY_FORMAT).date()
+            except ValueError:
+                continue
+            if day < expired_before:
+                shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+                logger.info(f"Archive: deleted {name} (older than {self.retention_days} days)")
+            elif os.path.isdir(path) and day < today:
+                self._compact_day(path, day)
+        self.compacted_through = today - timedelta(days=1)
+
+    def _compact_day(self, day_dir: str, day: date):
+        segments = sorted((os.path.join(day_dir, f) for f in os.listdir(day_dir) if f.endswith(".npz")),
+                          key=lambda p: int(os.path.basename(p).removesuffix(".npz")))
+        daily = os.path.join(self.directory, day.strftime(DAY_FORMAT) + ".npz")
+        parts = ([_read(daily)] if os.path.exists(daily) else []) + [_read(s) for s in segments]
+        if parts:
+            _write(daily, *_merge(parts))
+        shutil.rmtree(day_dir)
+        logger.info(f"Archive: compacted {len(segments)} segments of {day}")
+
+    async def run(self, flush_seconds: float = ARCHIVE_FLUSH_SECONDS):
+        """Background task: flushes every flush_seconds, compacts when the day rolls over."""
+        while True:
+            try:
+                await asyncio.sleep(flush_seconds)
+                await asyncio.to_thread(self.flush)
+                if self.compacted_through != date.today() - timedelta(days=1):
+                    await asyncio.to_thread(self.compact)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Archive task error: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "pending_rows": self.pending_rows,
+            "rows_written": self.rows_written,
+            "segments_written": self.segments_written,
+            "dropped_rows": self.dropped_rows,
+            "last_flush": self.last_flush,
+        }
+
+    # --- reading ----------------------------------------------------------------------------------
+
+    def _files(self, day: date) -> list:
+        name = day.strftime(DAY_FORMAT)
+        files = [os.path.join(self.directory, name + ".npz")]
+        day_dir = os.path.join(self.directory, name)
+        if os.path.isdir(day_dir):
+            files += sorted((os.path.join(day_dir, f) for f in os.listdir(day_dir) if f.endswith(".npz")),
+                            key=lambda p: int(os.path.basename(p).removesuffix(".npz")))
+        return [f for f in files if os.path.exists(f)]
+
+    def _read_files(self, day: date):
+        for path in self._files(day):
+            try:
+                yield _read(path)
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"Archive: skipping unreadable {path}: {e}")
+
+    def scan(self, start: float, end: float):
+        """
+        Archived polls between start and end (epoch seconds), oldest first, one file at a time:
+        (carparks, polls, t, slot, lots) with carpark number carparks[slot[i]] at lots[i] (stored value) from
+        the poll at t[i]; polls lists every poll time, including polls that changed nothing.
+        Only files for the days in range are opened, and rows are cut to the range by binary search.
+        """
+        day = _day(start)
+        while day <= _day(end):
+            for carparks, polls, t, slot, lots, _ in self._read_files(day):
+                lo, hi = np.searchsorted(t, start, "left"), np.searchsorted(t, end, "right")
+                p_lo, p_hi = np.searchsorted(polls, start, "left"), np.searchsorted(polls, end, "right")
+                if p_hi > p_lo:
+                    yield carparks, polls[p_lo:p_hi], t[lo:hi], slot[lo:hi], lots[lo:hi]
+            day += timedelta(days=1)
+
+    def keyframe_before(self, t: float) -> float:
+        """Time of the latest keyframe at or before t, or None if there isn't one in the archive."""
+        days = []
+        for name in os.listdir(self.directory):
+            try:
+                days.append(datetime.strptime(name.removesuffix(".npz"), DAY_FORMAT).date())
+            except ValueError:
+                continue
+        if not days:
+            return None
+        earliest, day = min(days), _day(t)
+        while day >= earliest:
+            found = [keyframes[keyframes <= t].max() for *_, keyframes in self._read_files(day)
+                     if (keyframes <= t).any()]
+            if found:
+                return float(max(found))
+            day -= timedelta(days=1)
+        return None
+
+    def replay(self, start: float, end: float, index: dict):
+        """
+        Archived polls between start and end as (poll time, columns, stored values), columns in `index`
+        (carpark_number -> column, e.g. AvailabilityHistory.index) order; carparks not in it are left out.
+        Reading starts at the latest keyframe at or before start; what the polls before start add up to is
+        yielded first, as one poll at start covering every carpark with a reading by then.
+        """
+        keyframe = self.keyframe_before(start)
+        state = np.zeros(len(index), dtype=np.uint16) if keyframe is not None and keyframe < start else None
+        for carparks, polls, t, slot, lots in self.scan(start if keyframe is None else keyframe, end):
+            to_column = np.array([index.get(cp_number, -1) for cp_number in carparks.tolist()], dtype=np.int64)
+            column = to_column[slot]
+            bounds_lo = np.searchsorted(t, polls, "left")
+            bounds_hi = np.searchsorted(t, polls, "right")
+            for poll, lo, hi in zip(polls.tolist(), bounds_lo.tolist(), bounds_hi.tolist()):
+                columns, values = column[lo:hi], lots[lo:hi]
+                known = columns >= 0
+                if state is not None:
+                    if poll < start:
+                        state[columns[known]] = values[known]
+                        continue
+                    yield start, np.arange(len(state), dtype=np.uint32), state
+                    state = None
+                yield poll, columns[known].astype(np.uint32), values[known]
+        if state is not None:
+            yield start, np.arange(len(state), dtype=np.uint32), state
+
+
+def _epoch(day: str) -> float:
+    return datetime.strptime(day, DAY_FORMAT).timestamp()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Availability archive tools")
+    parser.add_argument("--dir", default=ARCHIVE_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write archived rows as CSV (time, carpark_number, available_lots)")
+    export.add_argument("--from", dest="start", required=True, help="YYYY-MM-DD")
+    export.add_argument("--to", dest="end", required=True, help="YYYY-MM-DD (inclusive)")
+    export.add_argument("--carpark", action="append", help="only these carparks (repeatable)")
+    commands.add_parser("compact", help="compact finished days and apply retention now")
+    args = parser.parse_args(argv)
+
+    archive = AvailabilityArchive(args.dir, [])
+    if args.command == "compact":
+        archive.compact()
+        return
+    writer = csv.writer(sys.stdout)
+    writer.writerow(["time", "carpark_number", "available_lots"])
+    wanted = set(args.carpark or ())
+    for carparks, _, t, slot, lots in archive.scan(_epoch(args.start), _epoch(args.end) + 86400 - 0.001):
+        numbers = carparks[slot]
+        keep = np.isin(numbers, list(wanted)) if wanted else np.ones(len(numbers), dtype=bool)
+        for when, cp_number, value in zip(t[keep].tolist(), numbers[keep].tolist(), lots[keep].tolist()):
+            writer.writerow([datetime.fromtimestamp(when).isoformat(timespec="seconds"), cp_number,
+                             "N/A" if value == 0 else value - 1])
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
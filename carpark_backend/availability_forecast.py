@@ -0,0 +1,71 @@
+# Forecast of available lots at a future arrival time.
+# Each carpark has a weekly profile: mean available lots per (day of week, FORECAST_BIN_MINUTES slot),
+# with public holidays counted as Sundays. Profiles are running means, folded in from every finished
+# availability_history bucket, capped so they follow roughly the last FORECAST_WEEKS weeks.
+# A forecast is that profile at the arrival slot, plus today's deviation from the profile right now,
+# fading out over FORECAST_DECAY_HOURS: someone arriving in 20 minutes mostly sees the current count,
+# someone arriving tomorrow the usual count. Profiles are (slot, carpark) arrays, so forecasting every
+# carpark for one arrival time is a handful of numpy ops on two rows.
+
+import math
+import os
+
+import numpy as np
+
+from day_calendar import day_type_calendar, singapore_time
+
+FORECAST_BIN_MINUTES = int(os.getenv("FORECAST_BIN_MINUTES", "30"))
+FORECAST_WEEKS = float(os.getenv("FORECAST_WEEKS", "4"))
+FORECAST_DECAY_HOURS = float(os.getenv("FORECAST_DECAY_HOURS", "2"))
+# Arrivals sooner than this just get the current count
+FORECAST_MIN_LEAD_MINUTES = float(os.getenv("FORECAST_MIN_LEAD_MINUTES", "15"))
+
+SUNDAY = 6
+
+
+class AvailabilityForecast:
+    def __init__(self, n_carparks: int = 0, sample_seconds: int = 300, bin_minutes: int = FORECAST_BIN_MINUTES,
+                 weeks: float = FORECAST_WEEKS, decay_hours: float = FORECAST_DECAY_HOURS):
+        self.bin_minutes = bin_minutes
+        self.bins_per_day = 24 * 60 // bin_minutes
+        self.decay_hours = decay_hours
+        # Samples one slot gets in `weeks` weeks; past that the mean starts forgetting old weeks
+        self.max_count = int(min(255, max(1, weeks * bin_minutes * 60 / sample_seconds)))
+        self.mean = np.zeros((7 * self.bins_per_day, n_carparks), dtype=np.float32)
+        self.count = np.zeros((7 * self.bins_per_day, n_carparks), dtype=np.uint8)
+        self.version = 0  # bumped by every observe, for callers caching forecasts
+
+    @property
+    def nbytes(self) -> int:
+        return self.mean.nbytes + self.count.nbytes
+
+    def slot(self, t: float) -> int:
+        when = singapore_time(t)
+        day = SUNDAY if when.date() in day_type_calendar.holidays else when.weekday()
+        return day * self.bins_per_day + (when.hour * 60 + when.minute) // self.bin_minutes
+
+    def observe(self, stored: np.ndarray, t: float):
+        """Folds one history row (availability_history stored values: lots + 1, 0 = no reading) taken at t."""
+        slot = self.slot(t)
+        seen = stored > 0
+        count = np.minimum(self.count[slot][seen].astype(np.uint16) + 1, self.max_count)
+        mean = self.mean[slot]
+        mean[seen] += ((stored[seen].astype(np.float32) - 1) - mean[seen]) / count
+        self.count[slot][seen] = count
+        self.version += 1
+
+    def predict(self, arrival: float, now: float, current: np.ndarray) -> np.ndarray:
+        """
+        Forecast available lots for every carpark arriving at `arrival`, given the current stored values.
+        NaN where there's neither a profile nor a current reading.
+        """
+        at, here = self.slot(arrival), self.slot(now)
+        have_profile = self.count[at] > 0
+        have_current = current > 0
+        current_lots = current.astype(np.float32) - 1
+
+        fade = math.exp(-max(0.0, arrival - now) / 3600 / self.decay_hours) if self.decay_hours > 0 else 0.0
+        deviation = np.where(have_current & (self.count[here] > 0), current_lots - self.mean[here], 0)
+        forecast = np.where(have_profile, self.mean[at] + fade * deviation,
+                            np.where(have_current, current_lots, np.nan))
+        return np.maximum(forecast, 0)
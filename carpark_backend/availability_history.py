@@ -0,0 +1,94 @@
+# Recent availability per carpark, for "how full does this get at 6pm" questions.
+# One numpy ring buffer for all carparks: a row per time bucket (HISTORY_RESOLUTION seconds),
+# a column per carpark, HISTORY_DAYS of buckets. Every applied poll writes the current lot counts
+# into its bucket's row, so memory is fixed at startup: 2 bytes x carparks x buckets
+# (2,918 carparks x 2,016 five-minute buckets ~ 12 MB; 100k carparks ~ 400 MB, reached as the week fills).
+
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DAYS = float(os.getenv("HISTORY_DAYS", "7"))
+# Default is the URA poll interval, the slower source, so every bucket has a reading from both
+HISTORY_RESOLUTION = int(os.getenv("HISTORY_RESOLUTION", "300"))  # seconds per sample
+
+NO_READING = 0  # stored values are lots + 1, so zeroed memory means "no reading"
+MAX_LOTS = np.iinfo(np.uint16).max - 1
+
+
+def stored_value(available_lots) -> int:
+    """Lot count as stored: lots + 1, or NO_READING for 'N/A'. URA sends lotsAvailable as a string."""
+    try:
+        lots = int(available_lots)
+    except (TypeError, ValueError):
+        return NO_READING
+    return min(max(lots, 0), MAX_LOTS) + 1
+
+
+class AvailabilityHistory:
+    def __init__(self, carpark_numbers=(), days: float = HISTORY_DAYS, resolution: int = HISTORY_RESOLUTION):
+        self.resolution = resolution
+        self.slots = max(1, int(days * 86400 // resolution))
+        self.index = {cp_number: i for i, cp_number in enumerate(carpark_numbers)}
+        self.current = np.zeros(len(self.index), dtype=np.uint16)
+        # np.zeros is lazily backed by the OS, so memory grows row by row up to the full week
+        self.samples = np.zeros((self.slots, len(self.index)), dtype=np.uint16)
+        # Bucket number (time // resolution) each row holds, -1 if never written
+        self.slot_bucket = np.full(self.slots, -1, dtype=np.int64)
+        self.last_bucket = None
+
+    @property
+    def nbytes(self) -> int:
+        return self.samples.nbytes + self.current.nbytes + self.slot_bucket.nbytes
+
+    def columns(self, changes: dict) -> tuple:
+        """A poll's {carpark_number: (total_lots, available_lots)} changes as (columns, stored values) arrays."""
+        columns, values = [], []
+        for cp_number, (_, available_lots) in changes.items():
+            i = self.index.get(cp_number)
+            if i is not None:
+                columns.append(i)
+                values.append(stored_value(available_lots))
+        return np.array(columns, dtype=np.uint32), np.array(values, dtype=np.uint16)
+
+    def record(self, changes: dict, now: float):
+        """
+        Applies a poll's {carpark_number: (total_lots, available_lots)} changes and stores the bucket for now.
+        Returns the previous bucket number if this poll started a new bucket (so that one is final), else None.
+        """
+        return self.record_stored(*self.columns(changes), now)
+
+    def record_stored(self, columns: np.ndarray, values: np.ndarray, now: float):
+        """record() with the changes already converted by columns(), e.g. read back from the archive."""
+        self.current[columns] = values
+        bucket = int(now // self.resolution)
+        slot = bucket % self.slots
+        self.slot_bucket[slot] = bucket
+        self.samples[slot] = self.current  # several polls in one bucket: the last one wins
+        finished, self.last_bucket = self.last_bucket, bucket
+        return finished if finished is not None and finished != bucket else None
+
+    def row(self, bucket: int) -> np.ndarray:
+        """Stored values of every carpark for bucket (only meaningful if it's still in the buffer)."""
+        return self.samples[bucket % self.slots]
+
+    def history(self, cp_number: str, start: float, end: float) -> list:
+        """
+        [(bucket start time, available lots or None)] for cp_number between start and end (epoch seconds),
+        oldest first. Buckets with no poll (or older than the buffer) are left out. KeyError if unknown.
+        """
+        column = self.index[cp_number]
+        last = int(end // self.resolution)
+        first = max(int(start // self.resolution), last - self.slots + 1)
+        if first > last:
+            return []
+        buckets = np.arange(first, last + 1, dtype=np.int64)
+        slots = buckets % self.slots
+        recorded = self.slot_bucket[slots] == buckets
+        buckets, slots = buckets[recorded], slots[recorded]
+        values = self.samples[slots, column]
+        return [(int(bucket) * self.resolution, None if value == NO_READING else int(value) - 1)
+                for bucket, value in zip(buckets, values)]
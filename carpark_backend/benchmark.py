@@ -0,0 +1,218 @@
+# Benchmark suite: how the service scales with dataset size.
+# For each scale (multiple of the real dataset), generates synthetic input files (synthetic_data.py),
+# then times the startup.py loaders, CarparkService.load_dataset, find_nearest_carpark,
+# find_cheapest_carpark and calc_cost. Results go to a JSON file so runs on different commits can be
+# compared with --compare.
+#
+#   python benchmark.py --scales 1,10,100 --output bench.json
+#   python benchmark.py --scales 1,10 --compare bench.json
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time as timer
+from datetime import datetime, timezone
+
+import rate_engine_harness as harness
+import synthetic_data
+from calc_rates import calc_cost
+from carpark_service import CarparkService
+from startup import load_HDB_carpark_data, load_URA_carpark_data
+
+
+def _percentile(sorted_samples: list, q: float) -> float:
+    return sorted_samples[min(len(sorted_samples) - 1, int(q * len(sorted_samples)))]
+
+
+def _result(scale: float, n_carparks: int, name: str, samples: list, unit_ops: int = 1) -> dict:
+    """samples are per-op durations in seconds; unit_ops is how many items each op processed."""
+    samples = sorted(samples)
+    total = sum(samples)
+    return {
+        "scale": scale,
+        "carparks": n_carparks,
+        "benchmark": name,
+        "ops": len(samples),
+        "seconds": total,
+        "ops_per_sec": len(samples) / total if total else float("inf"),
+        "items_per_sec": len(samples) * unit_ops / total if total else float("inf"),
+        "p50_ms": _percentile(samples, 0.5) * 1000,
+        "p99_ms": _percentile(samples, 0.99) * 1000,
+    }
+
+
+def _timed(fn, *args):
+    start = timer.perf_counter()
+    value = fn(*args)
+    return timer.perf_counter() - start, value
+
+
+def _query_points(rng: random.Random, service: CarparkService, n: int) -> list:
+    """Search points near random carparks, as real searches are (a postcode or a mall near carparks)."""
+    coords = [cp["coordinates"] for cp in service.carpark_data.values() if cp["coordinates"][0] is not None]
+    points = []
+    for _ in range(n):
+        lat, lng = rng.choice(coords)
+        points.append((lat + rng.gauss(0, 0.005), lng + rng.gauss(0, 0.005)))
+    return points
+
+
+async def _time_async(calls: list) -> list:
+    samples = []
+    for fn, args in calls:
+        start = timer.perf_counter()
+        await fn(*args)
+        samples.append(timer.perf_counter() - start)
+    return samples
+
+
+def run_scale(scale: float, queries: int, cost_cases: int, seed: int, workdir: str) -> list:
+    rng = random.Random(seed)
+    hdb_rows, ura_features = synthetic_data.generate(scale, seed)
+    hdb_path, ura_path = synthetic_data.write_files(hdb_rows, ura_features, workdir)
+    results = []
+
+    seconds, data = _timed(load_HDB_carpark_data, hdb_path, {})
+    results.append(_result(scale, len(data), "load_HDB_carpark_data", [seconds], len(hdb_rows)))
+    seconds, data = _timed(load_URA_carpark_data, ura_path, data)
+    results.append(_result(scale, len(data), "load_URA_carpark_data", [seconds], len(ura_features)))
+    n = len(data)
+
+    data_file = os.path.join(workdir, "combined_carpark_data.json")
+    with open(data_file, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    del data
+
+    service = CarparkService(None, data_file)
+    seconds, _ = _timed(service.load_dataset)
+    results.append(_result(scale, n, "CarparkService.load_dataset", [seconds], n))
+    results[-1]["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    # Some lots reported, so min_available_lots has something to filter
+    for cp_number, cp in service.hdb_data.items():
+        cp["available_lots"] = rng.randint(0, 50)
+
+    points = _query_points(rng, service, queries)
+    for limit, min_lots in ((10, None), (50, None), (10, 20)):
+        calls = [(service.find_nearest_carpark, (lat, lng, limit, min_lots)) for lat, lng in points]
+        name = f"find_nearest_carpark[limit={limit}" + (f",min_lots={min_lots}]" if min_lots else "]")
+        results.append(_result(scale, n, name, asyncio.run(_time_async(calls))))
+
+    windows = [harness.random_window(rng) for _ in range(max(1, queries // 10))]
+    windows = [(start, end) for start, end in windows if end > start] or [harness.random_window(rng)]
+    calls = [(service.find_cheapest_carpark, (lat, lng, 10, *rng.choice(windows), 1000))
+             for lat, lng in points[:max(1, queries // 10)]]
+    results.append(_result(scale, n, "find_cheapest_carpark[radius=1000]", asyncio.run(_time_async(_tolerate_404(calls)))))
+
+    codes = list(service.carpark_data)
+    samples = []
+    for _ in range(cost_cases):
+        cp = service.carpark_data[rng.choice(codes)]
+        start, end = harness.random_window(rng)
+        begin = timer.perf_counter()
+        try:
+            calc_cost(cp, start, end)
+        except Exception:
+            pass  # bad URA data raises; still a measured evaluation
+        samples.append(timer.perf_counter() - begin)
+    results.append(_result(scale, n, "calc_cost", samples))
+    return results
+
+
+def _tolerate_404(calls: list) -> list:
+    # A search point with no priced carpark within the radius raises 404; that's still a completed search
+    async def call(fn, *args):
+        try:
+            await fn(*args)
+        except Exception:
+            pass
+    return [(call, (fn, *args)) for fn, args in calls]
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: list, baseline: list, threshold: float) -> list:
+    """Prints ops/s change per benchmark; returns the (scale, benchmark) pairs slower than threshold."""
+    previous = {(r["scale"], r["benchmark"]): r for r in baseline}
+    regressions = []
+    print(f"{'scale':>6} {'benchmark':<42} {'before':>12} {'after':>12} {'change':>8}")
+    for r in current:
+        old = previous.get((r["scale"], r["benchmark"]))
+        if not old:
+            continue
+        change = r["ops_per_sec"] / old["ops_per_sec"] - 1
+        print(f"{r['scale']:>6g} {r['benchmark']:<42} {old['ops_per_sec']:>12,.1f} {r['ops_per_sec']:>12,.1f} "
+              f"{change:>+7.1%}")
+        if change < -threshold:
+            regressions.append((r["scale"], r["benchmark"]))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark loaders, search and pricing at several dataset sizes")
+    parser.add_argument("--scales", default="1,10,100", help="comma-separated multiples of the real dataset")
+    parser.add_argument("--queries", type=int, default=2000, help="searches per find_nearest_carpark benchmark")
+    parser.add_argument("--cost-cases", type=int, default=20000, help="calc_cost evaluations")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON here")
+    parser.add_argument("--compare", help="earlier --output file to compare against")
+    parser.add_argument("--fail-threshold", type=float, default=0.2,
+                        help="with --compare, exit 1 if any benchmark is this much slower (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    results = []
+    for scale in (float(s) for s in args.scales.split(",")):
+        with tempfile.TemporaryDirectory() as workdir:
+            print(f"Scale {scale:g}x ...", flush=True)
+            results += run_scale(scale, args.queries, args.cost_cases, args.seed, workdir)
+
+    print(f"{'scale':>6} {'carparks':>9} {'benchmark':<42} {'ops/s':>12} {'p50 ms':>9} {'p99 ms':>9}")
+    for r in results:
+        print(f"{r['scale']:>6g} {r['carparks']:>9} {r['benchmark']:<42} {r['ops_per_sec']:>12,.1f} "
+              f"{r['p50_ms']:>9.3f} {r['p99_ms']:>9.3f}")
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "queries": args.queries,
+            "cost_cases": args.cost_cases,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        settings = ("seed", "queries", "cost_cases")
+        if any(baseline["meta"].get(k) != report["meta"][k] for k in settings):
+            print(f"Warning: {args.compare} was run with different {'/'.join(settings)}, results may not be comparable")
+        regressions = compare(results, baseline["results"], args.fail_threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmarks regressed by more than {args.fail_threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
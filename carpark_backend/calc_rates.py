@@ -1,5 +1,6 @@
 from datetime import datetime, time, date, timedelta # Ensure these are imported
 import math
+from day_calendar import day_type_calendar
 
 # Use datetime for parsing and manipulating time strings, currently using time which cannot be subtracted
 
@@ -58,16 +59,9 @@ def parse_rate_str_to_float(rate_str: str) -> float:
 
 # 4. Helper to determine day type from a datetime object
 def get_day_type(dt_obj: datetime) -> str:
-    """Returns 'weekday', 'saturday', or 'sunday_ph' based on datetime."""
-    if dt_obj.weekday() < 5: # Monday is 0, Friday is 4
-        # Need to check for Public Holidays too. This would require a list of PH.
-        # For simplicity now, just check weekday.
-        return "weekday"
-    elif dt_obj.weekday() == 5: # Saturday is 5
-        return "saturday"
-    else: # Sunday is 6
-        # Need to check for Public Holidays.
-        return "sunday_ph"
+    """Returns 'weekday', 'saturday', or 'sunday_ph' based on datetime. Public holidays count as 'sunday_ph'."""
+    # Precomputed per-day table (see day_calendar.py), so this is one indexed lookup
+    return day_type_calendar.day_type(dt_obj)
 
 # 5. Helper to get the correct rate from a rule based on day type
 def get_rate_for_day(rate_rule: dict, day_type: str) -> dict:
@@ -167,6 +161,9 @@ def calc_ura_cost(carpark: dict, start_time: datetime, end_time: datetime, veh_c
 
     return round(total_cost, 2)
 
+# Day type (from get_day_type) -> key in special_rates_HDB
+HDB_DAY_KEYS = {"weekday": "weekdays", "saturday": "saturdays", "sunday_ph": "sundays"}
+
 special_rates_HDB = {
     "ACB": {
         "weekdays": [
@@ -502,9 +499,8 @@ def calc_hdb_cost(carpark, start_time, end_time, overnight=False): # call separa
         return 0.0
     
     # assume end time is always after start time (ie no overnight parking)
-    # get the day type for the start time
-    day_of_week_int = start_time.weekday()
-    day = "weekdays" if day_of_week_int < 5 else "saturdays" if day_of_week_int == 5 else "sundays"
+    # get the day type for the start time (public holidays use the Sunday rates)
+    day = HDB_DAY_KEYS[get_day_type(start_time)]
     rate_per_half_hour = 0.60
     rate_per_minute = rate_per_half_hour / 30.0
     
@@ -1,5 +1,5 @@
 import requests, math, json, os, asyncio, logging, time
-from datetime import datetime
+from datetime import datetime, date, timedelta
 from fastapi import HTTPException
 
 logging.basicConfig(level=logging.INFO)
@@ -9,18 +9,74 @@ from startup import load_HDB_carpark_data, update_realtime_availability_task, pa
 from ura_availability import get_access_token, update_URA_availability
 from token_manager import OneMapTokenManager
 from calc_rates import calc_cost
+from rate_engine import compile_tariffs, bulk_cost
+from pricing_pool import PricingPool, rank_by_cost
+from spatial_index import SpatialIndex, haversine, route_length
+from response_encoder import CarparkEncoder, sse_event
+from result_cache import ResultCache, CachedResult, quantize_location, time_key
+from search_cursor import encode_cursor, decode_cursor
+from circuit_breaker import CircuitOpenError, fetch_json, onemap_breaker, ONEMAP_BASE_URL
+from deadline import DeadlineExceeded, current_deadline
+from profiling import current_profile, stage
+from availability_history import AvailabilityHistory, NO_READING
+from availability_forecast import AvailabilityForecast, FORECAST_MIN_LEAD_MINUTES, FORECAST_WEEKS
+from day_calendar import SINGAPORE_TZ, in_singapore, singapore_time
+from availability_archive import AvailabilityArchive, ARCHIVE_DIR
+from availability_aggregates import AvailabilityAggregates, load_planning_areas
+from walking_graph import WalkingGraph, WALKING_SHORTLIST
+from collections import OrderedDict
+from metrics import (TOKEN_SECONDS, GEOCODE_SECONDS, NEAREST_SECONDS, PRICING_SECONDS, SERIALIZATION_SECONDS,
+                     monitor_event_loop_lag)
 import copy
+import heapq
 from typing import Optional
 
+GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", "10000"))
+DEADLINE_COST_NOTE = "Cost not estimated: request deadline exceeded"
+SEARCH_MAX_RADIUS_M = 5000
+ROUTE_MAX_LENGTH_M = float(os.getenv("ROUTE_MAX_LENGTH_KM", "200")) * 1000
+# Grid cells a route search may look at: a 200 km route with the widest corridor needs well under 100k, a route
+# zigzagging across itself can ask for millions. 150k is about 0.3 s of work.
+ROUTE_MAX_CELLS = int(os.getenv("ROUTE_MAX_CELLS", "150000"))
+# Heatmap bbox when none is given, and where a paging cursor may point: all of Singapore
+SINGAPORE_BBOX = (1.15, 103.6, 1.48, 104.1)
+# Availability older than this (no successful poll) is reported as stale
+AVAILABILITY_STALE_AFTER = float(os.getenv("AVAILABILITY_STALE_AFTER", "600"))
+DATA_FILE = os.getenv("CARPARK_DATA_FILE", "./data/combined_carpark_data.json")
+
+
 class CarparkService:
-    def __init__(self, token_manager: OneMapTokenManager, data_file: str = "./data/combined_carpark_data.json"):
+    def __init__(self, token_manager: OneMapTokenManager, data_file: str = DATA_FILE):
         self.token_manager = token_manager
         self.data_file = data_file
         self.carpark_data = {}
         self.hdb_data = {}
         self.ura_data = {}
+        self.tariffs = {}
+        self.spatial_index = SpatialIndex()
+        self.pricing_pool = None
+        self.encoder = CarparkEncoder()
+        self.result_cache = ResultCache()
+        # Bumped every time a poll changes any lot count; cached results from older versions are stale
+        self.snapshot_version = 0
+        self._availability_listeners = []
+        # Last successful poll per source ("HDB" / "URA"), time.time()
+        self.availability_updated = {}
+        # Search text -> (lat, lng). OneMap results for an address don't change, and these keep
+        # repeat searches working while OneMap is down
+        self.geocode_cache = OrderedDict()
+        self.geocode_hits = 0
+        self.geocode_misses = 0
+        self.history = AvailabilityHistory()
+        self.archive = None
+        self._archive_task = None
+        self.walking_graph = None
+        self.aggregates = AvailabilityAggregates({})
+        self.forecast = AvailabilityForecast()
+        self._forecasts = {}  # (arrival slot, lead, versions) -> forecast for every carpark
 
-    async def startup(self):
+    def load_dataset(self):
+        """Loads self.data_file and builds everything derived from it. No background tasks or processes."""
         if os.path.exists(self.data_file):
             with open(self.data_file, "r", encoding="utf-8") as f:
                 self.carpark_data = json.load(f)
@@ -28,87 +84,638 @@ class CarparkService:
         else:
             logger.warning(f"Data file {self.data_file} not found")
 
+        # Parse rates and bucket coordinates once, so per-request ranking doesn't have to
+        self.tariffs = compile_tariffs(self.carpark_data)
+        self.spatial_index = SpatialIndex.from_carparks(self.carpark_data)
+        self.encoder.load(self.carpark_data)
+        self.history = AvailabilityHistory(self.carpark_data)
+        self.forecast = AvailabilityForecast(len(self.history.index), self.history.resolution)
+        self._forecasts = {}
+        self.aggregates = AvailabilityAggregates(self.carpark_data, load_planning_areas())
+        if self.walking_graph is None:
+            self.walking_graph = WalkingGraph.load()
+        if self.walking_graph is not None:
+            self.walking_graph.attach(self.carpark_data)
+        logger.info(f"Availability history: {self.history.slots} x {self.history.resolution}s samples per carpark, "
+                    f"up to {self.history.nbytes / 2**20:.1f} MB; forecast profiles {self.forecast.nbytes / 2**20:.1f} MB")
+
         # Use deepcopy to isolate availability states
         self.hdb_data = copy.deepcopy(self.carpark_data)
         self.ura_data = copy.deepcopy(self.carpark_data)
 
-        asyncio.create_task(update_realtime_availability_task(self.hdb_data))
-        asyncio.create_task(update_URA_availability(self.ura_data))
+    async def startup(self):
+        self.load_dataset()
+        self.pricing_pool = PricingPool(self.data_file, self.carpark_data,
+                                        max_candidates=self.spatial_index.max_within(SEARCH_MAX_RADIUS_M))
+        self.pricing_pool.warm_up()
+        if ARCHIVE_DIR:
+            self.archive = AvailabilityArchive(ARCHIVE_DIR, self.history.index)
+            await asyncio.to_thread(self.restore_availability)
+            self._archive_task = asyncio.create_task(self.archive.run())
+
+        asyncio.create_task(update_realtime_availability_task(self.hdb_data, self._on_availability_update))
+        asyncio.create_task(update_URA_availability(self.ura_data, self._on_availability_update))
+        asyncio.create_task(monitor_event_loop_lag())
+
+    def add_availability_listener(self, listener):
+        """listener(source, changes) runs after each applied poll; changes is {carpark_number: (total, available)}."""
+        self._availability_listeners.append(listener)
+
+    def _on_availability_update(self, source: str, changes: dict):
+        now = time.time()
+        self.availability_updated[source] = now
+        # Recorded even when nothing changed: an unchanged poll is still a sample
+        columns, values = self.history.columns(changes)
+        self._record(columns, values, now)
+        if self.archive is not None:
+            self.archive.append(now, columns, values)
+        if not changes:
+            return
+        self.aggregates.apply(source, changes)
+        self.snapshot_version += 1
+        for listener in self._availability_listeners:
+            try:
+                listener(source, changes)
+            except Exception as e:
+                logger.error(f"Availability listener {listener} failed: {e}")
+
+    def _record(self, columns, values, now: float):
+        finished = self.history.record_stored(columns, values, now)
+        if finished is not None:
+            self.forecast.observe(self.history.row(finished), finished * self.history.resolution)
+
+    def restore_availability(self, now: Optional[float] = None):
+        """
+        Replays archived polls into history and the forecast profiles, far enough back to fill both.
+        Lot counts themselves start as 'N/A' until the first live polls, as the archive's may be stale.
+        """
+        now = now or time.time()
+        days = max(self.history.slots * self.history.resolution / 86400, FORECAST_WEEKS * 7)
+        started, polls = time.perf_counter(), 0
+        for t, columns, values in self.archive.replay(now - days * 86400, now, self.history.index):
+            self._record(columns, values, t)
+            polls += 1
+        self.history.current[:] = NO_READING
+        logger.info(f"Replayed {polls} archived polls into history in {time.perf_counter() - started:.1f}s")
+
+    def availability_age(self) -> dict:
+        """Seconds since each source's last successful poll; None if it hasn't succeeded since startup."""
+        now = time.time()
+        return {
+            source: (round(now - self.availability_updated[source]) if source in self.availability_updated else None)
+            for source in ("HDB", "URA")
+        }
+
+    def stale_sources(self) -> list:
+        return [source for source, age in self.availability_age().items()
+                if age is None or age > AVAILABILITY_STALE_AFTER]
+
+    async def shutdown(self):
+        if self.pricing_pool:
+            self.pricing_pool.shutdown()
+        if self._archive_task is not None:
+            self._archive_task.cancel()
+            await asyncio.to_thread(self.archive.flush)
 
     async def find_coord(self, query: str) -> tuple:
-        token = await self.token_manager.get_token()
-        headers = {"Authorization": f"Bearer {token}"}
-        url = f"https://www.onemap.gov.sg/api/common/elastic/search?searchVal={query}&returnGeom=Y&getAddrDetails=Y&pageNum=1"
+        key = " ".join(query.lower().split())
+        coords = self.geocode_cache.get(key)
+        if coords is not None:
+            self.geocode_cache.move_to_end(key)
+            self.geocode_hits += 1
+            return coords
+        self.geocode_misses += 1
 
+        url = f"{ONEMAP_BASE_URL}/api/common/elastic/search"
+        params = {"searchVal": query, "returnGeom": "Y", "getAddrDetails": "Y", "pageNum": 1}
         try:
-            resp = requests.get(url, headers=headers)
-            resp.raise_for_status()
-            data = resp.json()
-            if not data.get("results"):
-                raise HTTPException(status_code=404, detail="Location not found")
-            coords = data["results"][0]
-            return float(coords["LATITUDE"]), float(coords["LONGITUDE"])
+            with TOKEN_SECONDS.time(), stage("onemap_token"):
+                token = await self.token_manager.get_token()
+            headers = {"Authorization": f"Bearer {token}"}
+            with GEOCODE_SECONDS.time(), stage("onemap_search"):
+                data = await fetch_json(onemap_breaker, url, params=params, headers=headers)
+        except CircuitOpenError as e:
+            raise HTTPException(status_code=503, detail="Geocoding temporarily unavailable",
+                                headers={"Retry-After": str(max(1, round(e.retry_after)))})
+        except DeadlineExceeded:
+            # Nothing useful to return without a location
+            raise HTTPException(status_code=504, detail="Request deadline exceeded while geocoding")
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"OneMap error: {e}")
             raise HTTPException(status_code=500, detail="Failed to geocode location")
 
-    async def find_nearest_carpark(self, user_lat: float, user_lng: float, limit: int) -> list:
+        if not data.get("results"):
+            raise HTTPException(status_code=404, detail="Location not found")
+        try:
+            result = data["results"][0]
+            coords = float(result["LATITUDE"]), float(result["LONGITUDE"])
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"OneMap error: {e}")
+            raise HTTPException(status_code=500, detail="Failed to geocode location")
+
+        self.geocode_cache[key] = coords
+        if len(self.geocode_cache) > GEOCODE_CACHE_SIZE:
+            self.geocode_cache.popitem(last=False)
+        return coords
+
+    def _availability(self, cp_number: str, cp_type: str) -> tuple:
+        source = self.hdb_data if cp_type == "HDB" else self.ura_data if cp_type == "URA" else {}
+        cp = source.get(cp_number, {})
+        return cp.get("total_lots", 0), cp.get("available_lots", "N/A")
+
+    @staticmethod
+    def _has_lots(available_lots, min_available_lots: Optional[int]) -> bool:
+        if min_available_lots is None:
+            return True
+        # URA reports lotsAvailable as a string; 'N/A' never qualifies
+        try:
+            return int(available_lots) >= min_available_lots
+        except (TypeError, ValueError):
+            return False
+
+    async def find_nearest_carpark(self, user_lat: float, user_lng: float, limit: int,
+                                   min_available_lots: Optional[int] = None, after: Optional[tuple] = None) -> list:
+        """
+        Nearest carparks as result dicts: carpark_number plus the per-request fields
+        (total_lots, available_lots, distance). Static fields are added by self.encoder at response time.
+        after=(distance, carpark_number) continues a previous page just past that carpark.
+        """
         results = []
-        for cp_number, cp_info in self.carpark_data.items():
-            carpark = cp_info.copy()
-
-            if carpark["type"] == "HDB":
-                carpark["total_lots"] = self.hdb_data.get(cp_number, {}).get("total_lots", 0)
-                carpark["available_lots"] = self.hdb_data.get(cp_number, {}).get("available_lots", "N/A")
-            elif carpark["type"] == "URA":
-                carpark["total_lots"] = self.ura_data.get(cp_number, {}).get("total_lots", 0)
-                carpark["available_lots"] = self.ura_data.get(cp_number, {}).get("available_lots", "N/A")
-
-            lat, lng = carpark["coordinates"]
-            if lat is None or lng is None:
+        for distance, cp_number in self.spatial_index.nearest(user_lat, user_lng, after):
+            cp_info = self.carpark_data[cp_number]
+            if cp_info["type"] in ("HDB", "URA"):
+                total_lots, available_lots = self._availability(cp_number, cp_info["type"])
+            else:
+                total_lots, available_lots = cp_info.get("total_lots", 0), cp_info.get("available_lots", "N/A")
+            if not self._has_lots(available_lots, min_available_lots):
                 continue
+            results.append({
+                "carpark_number": cp_number,
+                "total_lots": total_lots,
+                "available_lots": available_lots,
+                "distance": distance,
+            })
+            if len(results) == limit:
+                break
+
+        # Running off the end of a later page is just the end of the list
+        if not results and after is None:
+            raise HTTPException(status_code=404, detail="No suitable carparks found")
 
-            carpark["distance"] = self._haversine(user_lat, user_lng, lat, lng)
-            results.append(carpark)
+        return results
 
-        if not results:
+    async def find_nearest_by_walking(self, user_lat: float, user_lng: float, limit: int,
+                                      min_available_lots: Optional[int] = None) -> list:
+        """
+        find_nearest_carpark results re-ranked by walking_distance over the pedestrian graph: the nearest
+        WALKING_SHORTLIST x limit by straight line, walked, best `limit` kept. Carparks with no walk within
+        WALKING_MAX_M (or off the graph) come after, nearest first, with walking_distance None.
+        """
+        shortlist = await self.find_nearest_carpark(user_lat, user_lng, limit * WALKING_SHORTLIST, min_available_lots)
+        with stage("walking_rerank", shortlist=len(shortlist)):
+            walks = self.walking_graph.walking_distances(
+                user_lat, user_lng, [cp["carpark_number"] for cp in shortlist], enough=limit
+            )
+        for cp in shortlist:
+            cp["walking_distance"] = walks.get(cp["carpark_number"])
+        shortlist.sort(key=lambda cp: (cp["walking_distance"] is None,
+                                       cp["distance"] if cp["walking_distance"] is None else cp["walking_distance"]))
+        return shortlist[:limit]
+
+    async def find_cheapest_carpark(
+        self,
+        user_lat: float,
+        user_lng: float,
+        limit: int,
+        start_time: datetime,
+        end_time: datetime,
+        radius: float,
+        min_available_lots: Optional[int] = None,
+    ) -> list:
+        """
+        Ranks every carpark within radius (metres) by estimated cost for the window, nearest first on ties.
+        Carparks whose cost can't be estimated are left out, since they can't be ranked.
+        """
+        candidates = {}
+        with stage("within_radius"):
+            for distance, cp_number in self.spatial_index.within_radius(user_lat, user_lng, radius):
+                cp_type = self.carpark_data[cp_number]["type"]
+                total_lots, available_lots = self._availability(cp_number, cp_type)
+                if self._has_lots(available_lots, min_available_lots):
+                    candidates[cp_number] = (distance, total_lots, available_lots)
+
+        cp_numbers = list(candidates)
+        distances = [candidates[cp_number][0] for cp_number in cp_numbers]
+        deadline = current_deadline()
+        if deadline is not None and deadline.expired():
+            raise DeadlineExceeded("request deadline exceeded before pricing")
+        ranked = None
+        # A profiled request prices inline, so the profile shows the work
+        if (self.pricing_pool and self.pricing_pool.should_offload(len(cp_numbers))
+                and current_profile() is None):
+            # Big job: price in a worker process so other requests on this event loop aren't blocked
+            try:
+                ranked = await asyncio.wait_for(
+                    self.pricing_pool.rank_by_cost(cp_numbers, distances, start_time, end_time, limit),
+                    deadline.remaining() if deadline else None,
+                )
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded("request deadline exceeded while pricing")
+            except Exception as e:
+                # A worker died (BrokenProcessPool) or the job failed: price inline rather than fail the request
+                logger.error(f"Pricing pool job failed, ranking inline: {e!r}")
+        if ranked is None:
+            with stage("rank_by_cost", candidates=len(cp_numbers)):
+                ranked = rank_by_cost(self.tariffs, cp_numbers, distances, start_time, end_time, limit)
+        if not ranked:
             raise HTTPException(status_code=404, detail="No suitable carparks found")
 
-        return sorted(results, key=lambda c: c["distance"])[:limit] 
+        results = []
+        for cost, distance, i in ranked:
+            cp_number = cp_numbers[i]
+            _, total_lots, available_lots = candidates[cp_number]
+            results.append({
+                "carpark_number": cp_number,
+                "total_lots": total_lots,
+                "available_lots": available_lots,
+                "distance": distance,
+                "cost": cost,
+            })
+        return results
 
     async def find_carpark(
         self, 
         query: str, 
         limit: int = 10, 
         start_time: Optional[datetime] = None, 
-        end_time: Optional[datetime] = None
+        end_time: Optional[datetime] = None,
+        sort: str = "distance",
+        radius: float = 1000,
+        min_available_lots: Optional[int] = None,
     ) -> list:
+        self._check_sort(sort, start_time, end_time)
+
         # Step 1: Find User's coordinates
         user_lat, user_lng = await self.find_coord(query)
 
         # Step 2: Find nearest carparks
+        return await self._find_at(user_lat, user_lng, limit, start_time, end_time, sort, radius, min_available_lots)
+
+    async def find_carpark_cached(
+        self,
+        query: str,
+        limit: int = 10,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        sort: str = "distance",
+        radius: float = 1000,
+        min_available_lots: Optional[int] = None,
+        fields: Optional[tuple] = None,
+        cursor: Optional[str] = None,
+    ) -> CachedResult:
+        """
+        Encoded find_carpark response, served from self.result_cache when a search from (about) the same
+        point, with the same params and exactly the same time window, already ran on the current
+        availability snapshot. fields (see response_encoder.parse_fields) trims each result.
+
+        A full page of sort=distance results gets a next_cursor; passing it back as cursor returns the
+        following page from the same point without geocoding query again.
+        """
+        self._check_sort(sort, start_time, end_time)
+
+        user_lat, user_lng, after = await self._search_point(query, sort, cursor)
+        key = (
+            quantize_location(user_lat, user_lng), limit, time_key(start_time), time_key(end_time),
+            sort, radius, min_available_lots, fields, cursor,
+        )
+        version = self.snapshot_version
+        profile = current_profile()
+        if profile is not None:
+            # What the cost depends on, so a slow request can be re-run as it was
+            profile.context.update(search_point=[user_lat, user_lng], snapshot_version=version,
+                                   availability_age=self.availability_age())
+        else:
+            cached = self.result_cache.get(key, version)
+            if cached is not None:
+                return cached
+
+        results = await self._find_at(
+            user_lat, user_lng, limit, start_time, end_time, sort, radius, min_available_lots, after
+        )
+        self.add_forecasts(results, start_time)
+        with SERIALIZATION_SECONDS.time(), stage("serialization"):
+            entry = CachedResult(self.encode_results(results, fields), version)
+        if sort == "distance":
+            entry.next_cursor = self._next_cursor(user_lat, user_lng, results, limit)
+        deadline = current_deadline()
+        # never cache a result cut short by a deadline, or a profiled run (it skipped the cache on purpose)
+        if profile is None and (deadline is None or not deadline.partial):
+            self.result_cache.put(key, entry)
+        return entry
+
+    async def find_carpark_stream(
+        self,
+        query: Optional[str],
+        limit: int = 10,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        min_available_lots: Optional[int] = None,
+        fields: Optional[tuple] = None,
+        cursor: Optional[str] = None,
+    ) -> tuple:
+        """
+        Streaming find_carpark (sort=distance only). Returns (next_cursor, events) where events is an
+        async generator of SSE frames: a "carpark" event per nearest carpark (no cost yet), then a "cost"
+        event per carpark as each estimate is computed, then "done".
+        Geocoding and the distance search run before this returns, so their errors are still plain HTTP errors.
+        """
+        user_lat, user_lng, after = await self._search_point(query, "distance", cursor)
         if not self.carpark_data:
             raise HTTPException(status_code=500, detail="Carpark data not loaded")
-        
-        list_of_carparks = await self.find_nearest_carpark(user_lat, user_lng, limit)
+        with NEAREST_SECONDS.time():
+            results = await self.find_nearest_carpark(user_lat, user_lng, limit, min_available_lots, after)
+        self.add_forecasts(results, start_time)
+        next_cursor = self._next_cursor(user_lat, user_lng, results, limit)
+        return next_cursor, self._stream_events(results, start_time, end_time, fields)
+
+    async def _stream_events(self, results: list, start_time: Optional[datetime], end_time: Optional[datetime],
+                             fields: Optional[tuple]):
+        for cp in results:
+            yield sse_event("carpark", self.encoder.encode_one(cp, fields))
+
+        if fields is None or "cost" in fields or "cost_note" in fields:
+            for cp in results:
+                update = {"carpark_number": cp["carpark_number"]}
+                if start_time and end_time:
+                    try:
+                        update["cost"] = calc_cost(self.carpark_data[cp["carpark_number"]], start_time, end_time)
+                    except Exception as e:
+                        update["cost_note"] = f"Error calculating cost: {e}"
+                else:
+                    update["cost_note"] = "Provide start & end time to estimate cost"
+                yield sse_event("cost", self.encoder.encode_update(update, fields))
+                await asyncio.sleep(0)  # let other requests run between estimates
+
+        yield sse_event("done", b"{}")
+
+    def _check_sort(self, sort: str, start_time: Optional[datetime], end_time: Optional[datetime]):
+        if sort == "cost" and not (start_time and end_time):
+            raise HTTPException(status_code=400, detail="sort=cost requires start_time and end_time")
+        if sort == "walking" and self.walking_graph is None:
+            raise HTTPException(status_code=400, detail="sort=walking is not available: no pedestrian graph loaded")
+
+    async def _search_point(self, query: Optional[str], sort: str, cursor: Optional[str]) -> tuple:
+        """(lat, lng, after): decoded from cursor when paging, otherwise geocoded from query."""
+        if not cursor:
+            with stage("find_coord"):
+                user_lat, user_lng = await self.find_coord(query)
+            return user_lat, user_lng, None
+        if sort != "distance":
+            raise HTTPException(status_code=400, detail="cursor paging is only supported for sort=distance")
+        try:
+            lat, lng, after = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        min_lat, min_lng, max_lat, max_lng = SINGAPORE_BBOX
+        if not (min_lat <= lat <= max_lat and min_lng <= lng <= max_lng):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        return lat, lng, after
+
+    @staticmethod
+    def _next_cursor(user_lat: float, user_lng: float, results: list, limit: int) -> Optional[str]:
+        if len(results) < limit:
+            return None
+        last = results[-1]
+        return encode_cursor(user_lat, user_lng, last["distance"], last["carpark_number"])
+
+    async def _find_at(
+        self,
+        user_lat: float,
+        user_lng: float,
+        limit: int,
+        start_time: Optional[datetime],
+        end_time: Optional[datetime],
+        sort: str,
+        radius: float,
+        min_available_lots: Optional[int],
+        after: Optional[tuple] = None,
+    ) -> list:
+        if not self.carpark_data:
+            raise HTTPException(status_code=500, detail="Carpark data not loaded")
+
+        deadline = current_deadline()
+        if sort == "cost":
+            try:
+                with PRICING_SECONDS.time(), stage("find_cheapest_carpark"):
+                    return await self.find_cheapest_carpark(
+                        user_lat, user_lng, limit, start_time, end_time, radius, min_available_lots
+                    )
+            except DeadlineExceeded:
+                # Out of time to rank by cost: fall back to the nearest carparks, unpriced
+                deadline.partial = True
+                start_time = end_time = None
+
+        with NEAREST_SECONDS.time(), stage("find_nearest_carpark"):
+            if sort == "walking":
+                list_of_carparks = await self.find_nearest_by_walking(user_lat, user_lng, limit, min_available_lots)
+            else:
+                list_of_carparks = await self.find_nearest_carpark(user_lat, user_lng, limit, min_available_lots, after)
         # modify carparks in place to include rates
-        if start_time and end_time:
+        if deadline is not None and deadline.partial:
             for cp in list_of_carparks:
-                try:
-                    cp["cost"] = calc_cost(cp, start_time, end_time)
-                except Exception as e:
-                    cp["cost_note"] = f"Error calculating cost: {e}"
+                cp["cost_note"] = DEADLINE_COST_NOTE
+        elif start_time and end_time:
+            with PRICING_SECONDS.time():
+                for cp in list_of_carparks:
+                    if deadline is not None and deadline.expired():
+                        deadline.partial = True
+                        cp["cost_note"] = DEADLINE_COST_NOTE
+                        continue
+                    try:
+                        with stage("calc_cost", carpark_number=cp["carpark_number"]):
+                            cp["cost"] = calc_cost(self.carpark_data[cp["carpark_number"]], start_time, end_time)
+                    except Exception as e:
+                        cp["cost_note"] = f"Error calculating cost: {e}"
         else:
             for cp in list_of_carparks:
                 cp["cost_note"] = "Provide start & end time to estimate cost"
         
         return list_of_carparks
 
-    def _haversine(self, lat1, lon1, lat2, lon2) -> float:
-        R = 6371e3
-        φ1, φ2 = math.radians(lat1), math.radians(lat2)
-        dφ = math.radians(lat2 - lat1)
-        dλ = math.radians(lon2 - lon1)
+    async def find_along_route(self, points: list, corridor: float, limit: int, start_time: Optional[datetime] = None,
+                               end_time: Optional[datetime] = None, min_available_lots: Optional[int] = None) -> list:
+        """
+        Carparks within corridor metres of the route through points [(lat, lng), ...], ordered by route_position
+        (metres along the route). If more than limit qualify, the limit closest to the route are kept.
+        Priced for start_time..end_time if given, with compiled tariffs, as routes can pass hundreds of carparks.
+        """
+        if not self.carpark_data:
+            raise HTTPException(status_code=500, detail="Carpark data not loaded")
+        if route_length(points) > ROUTE_MAX_LENGTH_M:
+            raise HTTPException(status_code=400, detail=f"Route longer than {ROUTE_MAX_LENGTH_M / 1000:.0f} km")
+
+        results = []
+        with stage("along_route", points=len(points)):
+            try:
+                hits = await asyncio.to_thread(self.spatial_index.along_route, points, corridor, ROUTE_MAX_CELLS)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=f"{e}, use fewer points or a narrower corridor")
+            for route_position, distance, cp_number in hits:
+                total_lots, available_lots = self._availability(cp_number, self.carpark_data[cp_number]["type"])
+                if self._has_lots(available_lots, min_available_lots):
+                    results.append({
+                        "carpark_number": cp_number,
+                        "total_lots": total_lots,
+                        "available_lots": available_lots,
+                        "distance": distance,
+                        "route_position": route_position,
+                    })
+        if len(results) > limit:
+            closest = heapq.nsmallest(limit, range(len(results)), key=lambda i: results[i]["distance"])
+            results = [results[i] for i in sorted(closest)]
 
-        a = math.sin(dφ / 2) ** 2 + math.cos(φ1) * math.cos(φ2) * math.sin(dλ / 2) ** 2
-        return R * (2 * math.atan2(math.sqrt(a), math.sqrt(1 - a)))
+        if start_time and end_time:
+            with PRICING_SECONDS.time(), stage("bulk_cost", carparks=len(results)):
+                costs = bulk_cost(self.tariffs, [cp["carpark_number"] for cp in results], start_time, end_time)
+            for cp in results:
+                cost = costs.get(cp["carpark_number"])
+                if cost is None:
+                    cp["cost_note"] = "Error calculating cost: Unknown carpark type"
+                elif isinstance(cost, Exception):
+                    cp["cost_note"] = f"Error calculating cost: {cost}"
+                else:
+                    cp["cost"] = cost
+        else:
+            for cp in results:
+                cp["cost_note"] = "Provide start & end time to estimate cost"
+        self.add_forecasts(results, start_time)
+        return results
+
+    def forecast_all(self, arrival: datetime, now: float = None):
+        """
+        Forecast available lots for every carpark (in self.history.index order) arriving at arrival.
+        Shared by every request for the same arrival slot until the next poll, so it's one numpy pass per slot.
+        """
+        now = time.time() if now is None else now
+        arrival_ts = in_singapore(arrival).timestamp()
+        lead = round((arrival_ts - now) / 60 / self.forecast.bin_minutes)
+        key = (self.forecast.slot(arrival_ts), lead, self.forecast.version, self.snapshot_version)
+        forecast = self._forecasts.get(key)
+        if forecast is None:
+            if len(self._forecasts) >= 64:
+                self._forecasts.clear()
+            forecast = self._forecasts[key] = self.forecast.predict(arrival_ts, now, self.history.current)
+        return forecast
+
+    def add_forecasts(self, results: list, start_time: Optional[datetime]):
+        """Sets forecast_available_lots on each result when start_time is far enough ahead to differ from now."""
+        if not start_time or not results:
+            return
+        now = time.time()
+        if in_singapore(start_time).timestamp() - now < FORECAST_MIN_LEAD_MINUTES * 60:
+            return
+        with stage("forecast"):
+            forecast = self.forecast_all(start_time, now)
+            for cp in results:
+                i = self.history.index.get(cp["carpark_number"])
+                lots = forecast[i] if i is not None else math.nan
+                cp["forecast_available_lots"] = None if math.isnan(lots) else int(round(float(lots)))
+
+    def encode_results(self, results: list, fields: Optional[tuple] = None) -> bytes:
+        """JSON array of carpark objects for results from find_carpark, full unless fields is given."""
+        return self.encoder.encode(results, fields)
+
+    async def best_start_times(self, cp_number: str, day: date, duration: int, step: int = 15) -> dict:
+        """Cost of parking for duration minutes at every step-th start time of day, plus the cheapest start."""
+        tariff = self.tariffs.get(cp_number)
+        if tariff is None:
+            raise HTTPException(status_code=404, detail="Carpark not found")
+
+        day_start = datetime.combine(day, datetime.min.time())
+        costs = []
+        for start_min, cost in tariff.sweep(day, duration, step):
+            costs.append({
+                "start_time": day_start + timedelta(minutes=start_min),
+                "cost": None if isinstance(cost, Exception) else cost,
+            })
+
+        priced = [c for c in costs if c["cost"] is not None]
+        if not priced:
+            raise HTTPException(status_code=422, detail="Unable to estimate cost for this carpark")
+        cheapest = min(priced, key=lambda c: c["cost"])  # earliest start on ties
+        return {
+            "carpark_number": cp_number,
+            "day": day,
+            "duration": duration,
+            "step": step,
+            "cheapest": cheapest,
+            "costs": costs,
+        }
+
+    def watch_set(self, carparks: Optional[str], lat: Optional[float], lng: Optional[float],
+                  radius: float, max_carparks: int) -> list:
+        """
+        Carpark numbers for a live subscription: the known ones in the comma-separated carparks, plus every
+        carpark within radius metres of (lat, lng) if given. 400 / 404 if that's too many / none.
+        """
+        watched = {cp.strip() for cp in (carparks or "").split(",") if cp.strip() in self.carpark_data}
+        if lat is not None and lng is not None:
+            watched.update(cp_number for _, cp_number in self.spatial_index.within_radius(lat, lng, radius))
+        if not watched:
+            raise HTTPException(status_code=404, detail="No known carparks to watch")
+        if len(watched) > max_carparks:
+            raise HTTPException(status_code=400, detail=f"Too many carparks to watch ({len(watched)} > {max_carparks})")
+        return sorted(watched)
+
+    def current_lots(self, cp_numbers: list) -> list:
+        """[{carpark_number, total_lots, available_lots}] as of the last applied polls."""
+        snapshot = []
+        for cp_number in cp_numbers:
+            total_lots, available_lots = self._availability(cp_number, self.carpark_data[cp_number]["type"])
+            snapshot.append({"carpark_number": cp_number, "total_lots": total_lots, "available_lots": available_lots})
+        return snapshot
+
+    def heatmap(self, bbox: Optional[str], cell_m: int) -> dict:
+        """Lot totals per cell_m grid cell and per planning area within bbox ("min_lat,min_lng,max_lat,max_lng")."""
+        if bbox:
+            try:
+                box = tuple(float(v) for v in bbox.split(","))
+            except ValueError:
+                box = ()
+            if len(box) != 4 or box[0] > box[2] or box[1] > box[3]:
+                raise HTTPException(status_code=400, detail="bbox must be min_lat,min_lng,max_lat,max_lng")
+        else:
+            box = SINGAPORE_BBOX
+        if cell_m not in self.aggregates.levels:
+            sizes = ", ".join(str(m) for m in self.aggregates.levels)
+            raise HTTPException(status_code=400, detail=f"cell_m must be one of {sizes}")
+        try:
+            return self.aggregates.heatmap(box, cell_m)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"{e}, use a larger cell_m or a smaller bbox")
+
+    def availability_history(self, cp_number: str, start: Optional[datetime] = None,
+                             end: Optional[datetime] = None) -> dict:
+        """Recorded available_lots for cp_number between start and end (default: the last 24 hours)."""
+        if cp_number not in self.history.index:
+            raise HTTPException(status_code=404, detail="Carpark not found")
+        end = in_singapore(end) if end else datetime.now(SINGAPORE_TZ)
+        start = in_singapore(start) if start else end - timedelta(days=1)
+        if start > end:
+            raise HTTPException(status_code=400, detail="from must be before to")
+
+        samples = self.history.history(cp_number, start.timestamp(), end.timestamp())
+        total_lots, _ = self._availability(cp_number, self.carpark_data[cp_number]["type"])
+        return {
+            "carpark_number": cp_number,
+            "from": start,
+            "to": end,
+            "resolution": self.history.resolution,
+            "total_lots": total_lots,
+            "samples": [{"time": singapore_time(t), "available_lots": lots} for t, lots in samples],
+        }
+
+    def _haversine(self, lat1, lon1, lat2, lon2) -> float:
+        return haversine(lat1, lon1, lat2, lon2)
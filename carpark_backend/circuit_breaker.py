@@ -0,0 +1,137 @@
+# Circuit breakers for the government APIs we depend on (OneMap, data.gov.sg, URA).
+# Every upstream call goes through its breaker with a timeout, and runs in a thread so a slow
+# upstream never blocks the event loop. After BREAKER_FAILURES consecutive failures the breaker
+# opens and calls fail fast with CircuitOpenError for BREAKER_RESET_SECONDS; then a single trial
+# call is let through, and its outcome closes or re-opens the breaker.
+# Callers fall back to cached geocodes / last-known availability while a breaker is open.
+
+import asyncio
+import logging
+import os
+import time
+
+import requests
+
+from deadline import DeadlineExceeded, time_left
+
+logger = logging.getLogger(__name__)
+
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+
+# Base URLs, overridable so tests and load tests can point at local stand-ins (mock_upstreams.py)
+ONEMAP_BASE_URL = os.getenv("ONEMAP_BASE_URL", "https://www.onemap.gov.sg").rstrip("/")
+DATAGOV_BASE_URL = os.getenv("DATAGOV_BASE_URL", "https://api.data.gov.sg").rstrip("/")
+URA_BASE_URL = os.getenv("URA_BASE_URL", "https://eservice.ura.gov.sg").rstrip("/")
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} circuit is open")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, timeout: float, failure_threshold: int = BREAKER_FAILURES,
+                 reset_timeout: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.timeout = timeout  # seconds allowed per call
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self.calls = 0
+        self.errors = 0
+        self.short_circuited = 0
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        if self.state == OPEN and self.retry_after() == 0:
+            self.state = HALF_OPEN
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def record_success(self):
+        if self.state != CLOSED:
+            logger.info(f"{self.name} circuit closed")
+        self.state = CLOSED
+        self.failures = 0
+        self._trial_running = False
+
+    def record_failure(self):
+        self.errors += 1
+        self.failures += 1
+        self._trial_running = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                logger.warning(f"{self.name} circuit opened after {self.failures} failures")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    async def call(self, fn, *args, **kwargs):
+        """Runs fn(*args, **kwargs) in a thread; any exception counts as a failure."""
+        if not self.allow():
+            self.short_circuited += 1
+            raise CircuitOpenError(self.name, self.retry_after())
+        self.calls += 1
+        try:
+            result = await asyncio.to_thread(fn, *args, **kwargs)
+        except DeadlineExceeded:  # our budget ran out, not the upstream's fault
+            self._trial_running = False
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+        except BaseException:  # cancelled: no verdict on the upstream
+            self._trial_running = False
+            raise
+        self.record_success()
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "calls": self.calls,
+            "errors": self.errors,
+            "short_circuited": self.short_circuited,
+        }
+
+
+def _request_json(method: str, url: str, timeout: float, deadline_capped: bool, **kwargs):
+    try:
+        response = requests.request(method, url, timeout=timeout, **kwargs)
+    except requests.exceptions.Timeout as e:
+        if deadline_capped:
+            raise DeadlineExceeded("request deadline exceeded") from e
+        raise
+    response.raise_for_status()
+    return response.json()
+
+
+async def fetch_json(breaker: CircuitBreaker, url: str, method: str = "GET", timeout: float = None, **kwargs):
+    """
+    HTTP request through breaker; timeouts, connection errors, HTTP errors and bad JSON all count as failures.
+    The timeout is capped to what's left of the request deadline (deadline.py), and running out of that
+    raises DeadlineExceeded without counting against the upstream.
+    """
+    timeout = timeout or breaker.timeout
+    capped = time_left(timeout)
+    return await breaker.call(_request_json, method, url, capped, capped < timeout, **kwargs)
+
+
+onemap_breaker = CircuitBreaker("onemap", timeout=float(os.getenv("ONEMAP_TIMEOUT", "3")))
+datagov_breaker = CircuitBreaker("datagov", timeout=float(os.getenv("DATAGOV_TIMEOUT", "10")))
+ura_breaker = CircuitBreaker("ura", timeout=float(os.getenv("URA_TIMEOUT", "10")))
+breakers = (onemap_breaker, datagov_breaker, ura_breaker)
@@ -0,0 +1,103 @@
+# Day-type calendar: weekday / saturday / sunday_ph for any date, public holidays included.
+# Holidays are loaded from a CSV (same layout as the data.gov.sg "Public Holidays" dataset: date,day,holiday)
+# and compiled into one byte per day, so resolving a day type is a single indexed lookup.
+# Days, and times given without a zone, are Singapore's whatever zone the server runs in.
+
+import csv
+import logging
+import os
+from datetime import date, datetime
+from typing import NamedTuple
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+DAY_TYPES = ("weekday", "saturday", "sunday_ph")
+WEEKDAY, SATURDAY, SUNDAY_PH = range(3)
+SINGAPORE_TZ = ZoneInfo("Asia/Singapore")
+
+PUBLIC_HOLIDAYS_FILE = os.getenv(
+    "PUBLIC_HOLIDAYS_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "public_holidays.csv"),
+)
+
+
+def load_public_holidays(file_path: str) -> set:
+    """Reads holiday dates (YYYY-MM-DD in a 'date' column). A missing file means no holidays."""
+    holidays = set()
+    try:
+        with open(file_path, mode="r", encoding="utf-8") as file:
+            for row in csv.DictReader(file):
+                try:
+                    holidays.add(date.fromisoformat(row["date"].strip()))
+                except (KeyError, ValueError):
+                    logger.warning(f"Skipping malformed public holiday row: {row}")
+    except FileNotFoundError:
+        logger.warning(f"Public holiday file {file_path} not found, only Sundays will use Sunday/PH rates")
+    return holidays
+
+
+def in_singapore(dt: datetime) -> datetime:
+    """dt as a Singapore time; a naive dt is taken to already be one, not the server's local time."""
+    return dt.replace(tzinfo=SINGAPORE_TZ) if dt.tzinfo is None else dt.astimezone(SINGAPORE_TZ)
+
+
+def singapore_time(t: float) -> datetime:
+    return datetime.fromtimestamp(t, SINGAPORE_TZ)
+
+
+def _weekday_type(d: date) -> int:
+    weekday = d.weekday()
+    return WEEKDAY if weekday < 5 else SATURDAY if weekday == 5 else SUNDAY_PH
+
+
+class _Days(NamedTuple):
+    holidays: frozenset
+    base: int  # ordinal of the table's first date
+    table: bytes  # day type code per date from base
+
+
+class DayTypeCalendar:
+    """
+    Precomputed day type for every date from first_year to last_year (inclusive).
+    Dates outside the table fall back to the plain weekday rule plus the holiday set.
+    """
+
+    def __init__(self, holidays=(), first_year: int = None, last_year: int = None):
+        self.load(holidays, first_year, last_year)
+
+    def load(self, holidays, first_year: int = None, last_year: int = None):
+        holidays = frozenset(holidays)
+        this_year = date.today().year
+        years = [d.year for d in holidays]
+        first_year = first_year or min(years + [this_year - 1])
+        last_year = last_year or max(years + [this_year + 5])
+
+        base = date(first_year, 1, 1).toordinal()
+        table = bytearray(date(last_year, 12, 31).toordinal() - base + 1)
+        for i in range(len(table)):
+            table[i] = _weekday_type(date.fromordinal(base + i))
+        for d in holidays:
+            if 0 <= d.toordinal() - base < len(table):
+                table[d.toordinal() - base] = SUNDAY_PH
+
+        # One immutable object assigned once, so a reader during a reload sees the old calendar or the new one
+        self.days = _Days(holidays, base, bytes(table))
+
+    @property
+    def holidays(self) -> frozenset:
+        return self.days.holidays
+
+    def day_type_code(self, d: date) -> int:
+        """Day type as an int index into DAY_TYPES. Accepts date or datetime."""
+        days = self.days  # the same calendar throughout, even if load() runs meanwhile
+        i = d.toordinal() - days.base
+        if 0 <= i < len(days.table):
+            return days.table[i]
+        return SUNDAY_PH if date.fromordinal(d.toordinal()) in days.holidays else _weekday_type(d)
+
+    def day_type(self, d: date) -> str:
+        return DAY_TYPES[self.day_type_code(d)]
+
+
+day_type_calendar = DayTypeCalendar(load_public_holidays(PUBLIC_HOLIDAYS_FILE))
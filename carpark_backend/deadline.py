@@ -0,0 +1,61 @@
+# Per-request latency budget.
+# main.py starts a Deadline for every search request (X-Request-Timeout-Ms header, else REQUEST_DEADLINE_MS),
+# and it is carried in a context variable so every stage can see it without passing it through each call:
+# upstream calls use the remaining time as their timeout, and pricing is cut short once it runs out,
+# leaving partial results (carparks without costs) rather than a timed-out request.
+
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+REQUEST_DEADLINE_MS = int(os.getenv("REQUEST_DEADLINE_MS", "8000"))
+REQUEST_DEADLINE_MAX_MS = int(os.getenv("REQUEST_DEADLINE_MAX_MS", "30000"))
+DEADLINE_HEADER = "x-request-timeout-ms"
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+        self.partial = False  # set when a stage gave up early because of this deadline
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+
+_current = ContextVar("request_deadline", default=None)
+
+
+def start_deadline(header_value: Optional[str] = None) -> Deadline:
+    """Deadline for the current request, from the header value in ms if it's a valid positive int."""
+    ms = REQUEST_DEADLINE_MS
+    if header_value:
+        try:
+            ms = min(max(int(header_value), 1), REQUEST_DEADLINE_MAX_MS)
+        except ValueError:
+            pass
+    deadline = Deadline(ms / 1000)
+    _current.set(deadline)
+    return deadline
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+def time_left(timeout: float) -> float:
+    """timeout capped to what's left of the current request's deadline; raises DeadlineExceeded if none is."""
+    deadline = _current.get()
+    if deadline is None:
+        return timeout
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        raise DeadlineExceeded("request deadline exceeded")
+    return min(timeout, remaining)
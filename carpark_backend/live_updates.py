@@ -0,0 +1,126 @@
+# Live lot-count updates for watched carparks, pushed as server-sent events.
+# A client subscribes to a set of carparks (by number, or everything within a radius of a point)
+# and gets an event each time a poll changes any of them, instead of re-running /find-carpark.
+# LiveHub keeps an index from carpark number to subscriptions, so a poll costs time proportional
+# to the carparks it changed (and the subscriptions watching them), not to the number of clients.
+# Each subscription has a bounded queue; a client too slow to drain it is disconnected rather than
+# buffering without limit, and reconnects to get a fresh snapshot.
+
+import asyncio
+import os
+
+import orjson
+
+from response_encoder import sse_event
+
+LIVE_MAX_SUBSCRIPTIONS = int(os.getenv("LIVE_MAX_SUBSCRIPTIONS", "10000"))
+LIVE_MAX_CARPARKS = int(os.getenv("LIVE_MAX_CARPARKS", "2000"))  # per subscription
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "100"))  # undelivered events before a client is dropped
+LIVE_HEARTBEAT_SECONDS = float(os.getenv("LIVE_HEARTBEAT_SECONDS", "15"))
+
+OVERFLOW = object()  # queued in place of the event that didn't fit
+
+
+class Subscription:
+    def __init__(self, carparks: frozenset, queue_size: int = LIVE_QUEUE_SIZE):
+        self.carparks = carparks
+        self.queue = asyncio.Queue(queue_size)
+        self.closed = False
+
+    def offer(self, event: bytes):
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too far behind: drop what's queued and tell the stream to end
+            self.closed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(OVERFLOW)
+
+
+class LiveHub:
+    def __init__(self, max_subscriptions: int = LIVE_MAX_SUBSCRIPTIONS):
+        self.max_subscriptions = max_subscriptions
+        self.watchers = {}  # carpark_number -> set of Subscription
+        self.subscriptions = set()
+        self.events_sent = 0
+        self.dropped = 0
+
+    def full(self) -> bool:
+        return len(self.subscriptions) >= self.max_subscriptions
+
+    def subscribe(self, carparks) -> Subscription:
+        subscription = Subscription(frozenset(carparks))
+        self.subscriptions.add(subscription)
+        for cp_number in subscription.carparks:
+            self.watchers.setdefault(cp_number, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        if subscription not in self.subscriptions:
+            return
+        self.subscriptions.discard(subscription)
+        for cp_number in subscription.carparks:
+            watchers = self.watchers.get(cp_number)
+            if watchers is not None:
+                watchers.discard(subscription)
+                if not watchers:
+                    del self.watchers[cp_number]
+
+    def publish(self, source: str, changes: dict):
+        """Availability listener: one "update" event per subscription watching any changed carpark."""
+        if not self.watchers:
+            return
+        batches = {}
+        for cp_number, (total_lots, available_lots) in changes.items():
+            watchers = self.watchers.get(cp_number)
+            if watchers:
+                update = {"carpark_number": cp_number, "total_lots": total_lots, "available_lots": available_lots}
+                for subscription in watchers:
+                    batches.setdefault(subscription, []).append(update)
+        for subscription, updates in batches.items():
+            subscription.offer(sse_event("update", orjson.dumps({"source": source, "changes": updates})))
+            if subscription.closed:
+                self.dropped += 1
+                self.unsubscribe(subscription)
+            else:
+                self.events_sent += 1
+
+    def stats(self) -> dict:
+        return {
+            "subscriptions": len(self.subscriptions),
+            "watched_carparks": len(self.watchers),
+            "events_sent": self.events_sent,
+            "dropped_slow_clients": self.dropped,
+        }
+
+    async def stream(self, carparks: list, snapshot, heartbeat: float = LIVE_HEARTBEAT_SECONDS):
+        """
+        SSE frames for a subscription to carparks: a "snapshot" (snapshot(carparks), the current counts), then
+        an "update" per poll that changed a watched carpark, with a comment line every heartbeat seconds to keep
+        proxies from timing out. Subscribes on first iteration, so no update between the snapshot and the
+        first event is lost, and unsubscribes when the client goes away (the generator is closed / cancelled).
+        """
+        subscription = self.subscribe(carparks)
+        try:
+            yield sse_event("snapshot", orjson.dumps(snapshot(carparks)))
+            async for frame in drain(subscription, heartbeat):
+                yield frame
+        finally:
+            self.unsubscribe(subscription)
+
+
+async def drain(subscription: Subscription, heartbeat: float = LIVE_HEARTBEAT_SECONDS):
+    """Frames queued for subscription as they arrive, keepalive comments in between, until it overflows."""
+    while True:
+        try:
+            event = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+        except asyncio.TimeoutError:
+            yield b": keepalive\n\n"
+            continue
+        if event is OVERFLOW:
+            yield sse_event("overflow", b'{"detail":"Client too slow, reconnect for a fresh snapshot"}')
+            return
+        yield event
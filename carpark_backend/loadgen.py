@@ -0,0 +1,227 @@
+# Load generator for /find-carpark: closed-loop virtual users at one or more concurrency levels,
+# reporting throughput and latency percentiles per level.
+# --spawn starts mock_upstreams.py and main:app (uvicorn) locally with the upstream base URLs
+# pointed at the mocks, so end-to-end capacity can be measured with no network or credentials.
+#
+#   python loadgen.py --spawn --concurrency 1,8,32 --duration 20 --onemap-latency-ms 40
+#   python loadgen.py --target http://127.0.0.1:8000 --concurrency 16 --duration 60
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time as timer
+from collections import Counter
+from datetime import datetime, timedelta
+
+import httpx
+
+import mock_upstreams
+
+
+def _percentile(sorted_samples: list, q: float) -> float:
+    if not sorted_samples:
+        return None
+    return sorted_samples[min(len(sorted_samples) - 1, int(q * len(sorted_samples)))]
+
+
+def summarize(concurrency: int, seconds: float, samples: list) -> dict:
+    """samples are (status, latency seconds) per request; status 0 means the request itself failed."""
+    latencies = sorted(latency * 1000 for _, latency in samples)
+    statuses = Counter(status for status, _ in samples)
+    ok = sum(count for status, count in statuses.items() if 200 <= status < 400)
+    return {
+        "concurrency": concurrency,
+        "seconds": seconds,
+        "requests": len(samples),
+        "ok": ok,
+        "throughput_rps": len(samples) / seconds if seconds else 0.0,
+        "ok_rps": ok / seconds if seconds else 0.0,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "p50_ms": _percentile(latencies, 0.5),
+        "p90_ms": _percentile(latencies, 0.9),
+        "p99_ms": _percentile(latencies, 0.99),
+        "max_ms": latencies[-1] if latencies else None,
+    }
+
+
+def make_queries(n: int, seed: int) -> list:
+    """n distinct search strings (6-digit postcodes); fewer means more geocode / result cache hits."""
+    rng = random.Random(seed)
+    return [f"{rng.randint(10000, 829999):06d}" for _ in range(n)]
+
+
+def make_params(rng: random.Random, queries: list, cost_share: float, limit: int) -> dict:
+    params = {"search_query": rng.choice(queries), "limit": limit}
+    if rng.random() < cost_share:
+        start = datetime.now().replace(second=0, microsecond=0) + timedelta(minutes=rng.randint(0, 7 * 24 * 60))
+        params.update(sort="cost", start_time=start.isoformat(),
+                      end_time=(start + timedelta(minutes=rng.randint(30, 480))).isoformat())
+    return params
+
+
+async def _user(client: httpx.AsyncClient, rng: random.Random, stop_at: float, remaining: list, samples: list,
+                queries: list, cost_share: float, limit: int):
+    while timer.perf_counter() < stop_at and remaining[0] != 0:
+        remaining[0] -= 1
+        params = make_params(rng, queries, cost_share, limit)
+        started = timer.perf_counter()
+        try:
+            response = await client.get("/find-carpark", params=params)
+            status = response.status_code
+        except httpx.HTTPError:
+            status = 0
+        samples.append((status, timer.perf_counter() - started))
+
+
+async def run_level(target: str, concurrency: int, duration: float, requests: int, queries: list,
+                    cost_share: float = 0.2, limit: int = 10, seed: int = 0, headers: dict = None,
+                    warmup: float = 0) -> dict:
+    """Runs concurrency users against target until duration passes or requests are sent (-1: no cap)."""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=target, headers=headers, limits=limits, timeout=60) as client:
+        if warmup:
+            await asyncio.gather(*(
+                _user(client, random.Random(seed - i - 1), timer.perf_counter() + warmup, [-1], [], queries,
+                      cost_share, limit)
+                for i in range(concurrency)))
+        samples = []
+        remaining = [requests]
+        started = timer.perf_counter()
+        await asyncio.gather(*(
+            _user(client, random.Random(seed + i), started + duration, remaining, samples, queries, cost_share, limit)
+            for i in range(concurrency)))
+        return summarize(concurrency, timer.perf_counter() - started, samples)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_until_up(url: str, process: subprocess.Popen, timeout: float):
+    stop_at = timer.monotonic() + timeout
+    while timer.monotonic() < stop_at:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode} before it came up")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        timer.sleep(0.2)
+    raise RuntimeError(f"{url} didn't come up within {timeout}s")
+
+
+def spawn(args) -> tuple:
+    """Starts the mocks and main:app; returns (app base url, [processes])."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    mock_port, app_port = _free_port(), _free_port()
+    mock_url = f"http://127.0.0.1:{mock_port}"
+    mock_argv = [sys.executable, "mock_upstreams.py", "--port", str(mock_port), "--seed", str(args.seed),
+                 "--dataset", args.dataset, "--search-results", str(args.search_results),
+                 "--error-status", str(args.error_status)]
+    for name in mock_upstreams.UPSTREAMS:
+        for setting in ("latency_ms", "jitter_ms", "error_rate"):
+            mock_argv += [f"--{name}-{setting.replace('_', '-')}", str(getattr(args, f"{name}_{setting}"))]
+    for flag, value in (("--hdb-carparks", args.hdb_carparks), ("--ura-carparks", args.ura_carparks)):
+        if value is not None:
+            mock_argv += [flag, str(value)]
+
+    env = dict(os.environ,
+               ONEMAP_BASE_URL=mock_url, DATAGOV_BASE_URL=mock_url, URA_BASE_URL=mock_url,
+               ONEMAP_USERNAME="loadgen", ONEMAP_PASSWORD="loadgen", URA_ACCESS_KEY="loadgen",
+               CARPARK_DATA_FILE=args.dataset, RATE_LIMIT_PER_SEC="0")
+    for setting in args.app_env:
+        key, _, value = setting.partition("=")
+        env[key] = value
+
+    processes = [subprocess.Popen(mock_argv, cwd=here)]
+    try:
+        _wait_until_up(f"{mock_url}/mock/stats", processes[0], 60)
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port), "--log-level", "warning"],
+            cwd=here, env=env))
+        app_url = f"http://127.0.0.1:{app_port}"
+        _wait_until_up(f"{app_url}/health", processes[1], 300)
+    except Exception:
+        stop(processes)
+        raise
+    return app_url, processes
+
+
+def stop(processes: list):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Drive /find-carpark and report throughput / latency percentiles")
+    parser.add_argument("--target", default="http://127.0.0.1:8000", help="base URL of a running main:app")
+    parser.add_argument("--spawn", action="store_true", help="start mock upstreams and main:app locally instead")
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="with --spawn, extra environment for main:app (e.g. ADMISSION_MAX_CONCURRENT=64)")
+    parser.add_argument("--concurrency", default="8", help="comma-separated virtual user counts, one run each")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per concurrency level")
+    parser.add_argument("--requests", type=int, default=-1, help="stop each level after this many requests")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds of unmeasured load before each level")
+    parser.add_argument("--distinct-queries", type=int, default=1000, help="size of the search_query pool")
+    parser.add_argument("--cost-share", type=float, default=0.2, help="share of requests with sort=cost")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--api-key", help="sent as X-API-Key (admission control rate-limits per key, if it is in the server's API_KEYS)")
+    parser.add_argument("--output", help="write results as JSON here")
+    parser.add_argument("--seed", type=int, default=0)
+    mock_upstreams.add_profile_args(parser)
+    args = parser.parse_args(argv)
+
+    processes = []
+    target = args.target
+    if args.spawn:
+        target, processes = spawn(args)
+        print(f"Spawned main:app at {target} against mock upstreams", flush=True)
+
+    headers = {"X-API-Key": args.api_key} if args.api_key else None
+    queries = make_queries(args.distinct_queries, args.seed)
+    results = []
+    try:
+        for concurrency in (int(c) for c in args.concurrency.split(",")):
+            print(f"Concurrency {concurrency} ...", flush=True)
+            results.append(asyncio.run(run_level(target, concurrency, args.duration, args.requests, queries,
+                                                 args.cost_share, args.limit, args.seed, headers, args.warmup)))
+        upstream_stats = None
+        if args.spawn:
+            try:
+                upstream_stats = httpx.get(f"{target}/health", timeout=5).json().get("upstreams")
+            except (httpx.HTTPError, ValueError):
+                pass
+    finally:
+        stop(processes)
+
+    print(f"{'users':>6} {'requests':>9} {'ok':>8} {'req/s':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} "
+          f"{'max ms':>9}  statuses")
+    for r in results:
+        print(f"{r['concurrency']:>6} {r['requests']:>9} {r['ok']:>8} {r['throughput_rps']:>9.1f} "
+              f"{r['p50_ms'] or 0:>9.1f} {r['p90_ms'] or 0:>9.1f} {r['p99_ms'] or 0:>9.1f} {r['max_ms'] or 0:>9.1f}"
+              f"  {r['statuses']}")
+
+    if args.output:
+        report = {"settings": {k: v for k, v in vars(args).items() if k != "api_key"},
+                  "upstreams": upstream_stats, "results": results}
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
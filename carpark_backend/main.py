@@ -1,14 +1,29 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse
 import requests, math, json, os, asyncio, logging, time
-from datetime import datetime
+import orjson
+from datetime import datetime, date
 from dotenv import load_dotenv
 from startup import update_realtime_availability_task, load_HDB_carpark_data, load_URA_carpark_data, parse_ura_feature
 from ura_availability import update_URA_availability
 from token_manager import OneMapTokenManager
-from carpark_service import CarparkService
+from carpark_service import CarparkService, SEARCH_MAX_RADIUS_M
+from spatial_index import decode_polyline
+from response_encoder import CarparkJSONResponse, parse_fields, COMPRESS_MIN_BYTES, COMPRESS_LEVEL
+from result_cache import RESULT_CACHE_TTL, etag_matches, make_etag
+from admission import AdmissionController, client_key
+from circuit_breaker import breakers
+from deadline import DEADLINE_HEADER, start_deadline
+from metrics import REQUEST_SECONDS, ServiceCollector
+from live_updates import LiveHub, LIVE_MAX_CARPARKS
+from alerts import AlertEngine, AlertRequest
+from profiling import check_key, get_report, profile_request, requested_key
+from prometheus_client import REGISTRY, CONTENT_TYPE_LATEST, generate_latest
 from contextlib import asynccontextmanager
-from typing import Optional
+from typing import List, Optional, Tuple
+from pydantic import BaseModel, Field
 
 
 load_dotenv()
@@ -20,14 +35,26 @@ onemap_manager = OneMapTokenManager(
     os.getenv("ONEMAP_PASSWORD"),
 )
 carpark_service = CarparkService(onemap_manager)
+admission = AdmissionController()
+live_hub = LiveHub()
+carpark_service.add_availability_listener(live_hub.publish)
+alert_engine = AlertEngine(carpark_service)
+carpark_service.add_availability_listener(alert_engine.on_update)
+REGISTRY.register(ServiceCollector(carpark_service, admission, breakers))
+
+ROUTE_MAX_POINTS = int(os.getenv("ROUTE_MAX_POINTS", "10000"))
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     await carpark_service.startup()
+    webhook_senders = alert_engine.start()
     yield
-    # Shutdown (if needed)
+    # Shutdown
+    for task in webhook_senders:
+        task.cancel()
+    await carpark_service.shutdown()
     
 app = FastAPI(
     title="Singapore Carpark Finder API",
@@ -48,22 +75,226 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "X-Availability-Age", "X-Availability-Stale", "Retry-After", "X-Partial-Result",
+                    "Server-Timing", "X-Profile-Id"],
 )
+# Full results at limit=50 (URA rate blocks especially) are large; gzip anything over the threshold
+app.add_middleware(GZipMiddleware, minimum_size=COMPRESS_MIN_BYTES, compresslevel=COMPRESS_LEVEL)
+
+
+def availability_headers() -> dict:
+    # Availability is last-known data; say how old it is, and which sources haven't polled lately
+    ages = carpark_service.availability_age()
+    headers = {"X-Availability-Age": ", ".join(
+        f"{source}={'unknown' if age is None else age}" for source, age in ages.items()
+    )}
+    stale = carpark_service.stale_sources()
+    if stale:
+        headers["X-Availability-Stale"] = ", ".join(stale)
+    return headers
 
 
 @app.get("/find-carpark")
-async def find_carpark(search_query: str, limit: int = Query(10, gt=0, le=50), start_time: Optional[datetime] = None, 
-        end_time: Optional[datetime] = None):
-    logger.info(f"search_query:  {search_query}")
-    logger.info(f"Start time: {start_time}, End time: {end_time}")
-    res = await carpark_service.find_carpark(search_query, limit, start_time, end_time)
+async def find_carpark(request: Request, search_query: Optional[str] = None, limit: int = Query(10, gt=0, le=50), start_time: Optional[datetime] = None, 
+        end_time: Optional[datetime] = None, sort: str = Query("distance", pattern="^(distance|cost|walking)$"),
+        radius: float = Query(1000, gt=0, le=SEARCH_MAX_RADIUS_M), min_available_lots: Optional[int] = Query(None, ge=0),
+        fields: Optional[str] = None, cursor: Optional[str] = None):
+    logger.debug(f"search_query: {search_query}, start time: {start_time}, end time: {end_time}")
+    if not search_query and not cursor:
+        raise HTTPException(status_code=400, detail="search_query or cursor is required")
+    try:
+        projection = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    deadline = start_deadline(request.headers.get(DEADLINE_HEADER))
+    profile = None
+    try:
+        with profile_request(request, "find_carpark") as profile:
+            with REQUEST_SECONDS.labels("find_carpark").time():
+                async with admission.admit(request):
+                    res = await carpark_service.find_carpark_cached(
+                        search_query, limit, start_time, end_time, sort, radius, min_available_lots, projection, cursor
+                    )
+    except HTTPException as e:
+        if profile is not None:
+            e.headers = {**(e.headers or {}), "X-Profile-Id": profile.id}
+        raise
     # logger.info(res)
-    return res
+    headers = {"ETag": res.etag, "Cache-Control": f"public, max-age={RESULT_CACHE_TTL}", **availability_headers()}
+    if profile is not None:
+        headers.update({"Server-Timing": profile.server_timing(), "X-Profile-Id": profile.id,
+                        "Cache-Control": "no-store"})
+    if res.next_cursor:
+        headers["X-Next-Cursor"] = res.next_cursor
+    if deadline.partial:
+        headers["X-Partial-Result"] = "cost"
+        headers["Cache-Control"] = "no-store"
+    if etag_matches(request.headers.get("if-none-match"), res.etag):
+        return Response(status_code=304, headers=headers)
+    return CarparkJSONResponse(res.body, headers=headers)
+
+
+@app.get("/find-carpark/stream")
+async def find_carpark_stream(request: Request, search_query: Optional[str] = None, limit: int = Query(10, gt=0, le=50),
+        start_time: Optional[datetime] = None, end_time: Optional[datetime] = None,
+        min_available_lots: Optional[int] = Query(None, ge=0), fields: Optional[str] = None,
+        cursor: Optional[str] = None):
+    """Same search as /find-carpark (sort=distance), as server-sent events: carparks first, costs as they come."""
+    if not search_query and not cursor:
+        raise HTTPException(status_code=400, detail="search_query or cursor is required")
+    try:
+        projection = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    start_deadline(request.headers.get(DEADLINE_HEADER))
+    # Only the geocode + search hold a slot; the cost events are priced one at a time after that
+    with REQUEST_SECONDS.labels("find_carpark_stream").time():
+        async with admission.admit(request):
+            next_cursor, events = await carpark_service.find_carpark_stream(
+                search_query, limit, start_time, end_time, min_available_lots, projection, cursor
+            )
+    headers = {"Cache-Control": "no-cache", **availability_headers()}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return StreamingResponse(events, media_type="text/event-stream", headers=headers)
+
+
+class RouteRequest(BaseModel):
+    points: Optional[List[Tuple[float, float]]] = None  # [[lat, lng], ...]
+    polyline: Optional[str] = None  # encoded polyline, as returned by Google Directions / OSRM
+    precision: int = Field(5, ge=5, le=6)
+    corridor: float = Field(300, gt=0, le=2000)
+    limit: int = Field(50, gt=0, le=500)
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    min_available_lots: Optional[int] = Field(None, ge=0)
+    fields: Optional[str] = None
+
+
+@app.post("/find-carpark/route")
+async def find_carpark_route(request: Request, route: RouteRequest):
+    """Carparks within `corridor` metres of a route, in the order the route passes them."""
+    if (route.points is None) == (route.polyline is None):
+        raise HTTPException(status_code=400, detail="Exactly one of points / polyline is required")
+    try:
+        points = route.points if route.points is not None else decode_polyline(route.polyline, route.precision)
+        projection = parse_fields(route.fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not 1 <= len(points) <= ROUTE_MAX_POINTS:
+        raise HTTPException(status_code=400, detail=f"A route needs 1 to {ROUTE_MAX_POINTS} points")
+    if any(not (-90 <= lat <= 90 and -180 <= lng <= 180) for lat, lng in points):
+        raise HTTPException(status_code=400, detail="Route points must be [lat, lng]")
+
+    with REQUEST_SECONDS.labels("find_carpark_route").time():
+        async with admission.admit(request):
+            results = await carpark_service.find_along_route(
+                points, route.corridor, route.limit, route.start_time, route.end_time, route.min_available_lots
+            )
+    return CarparkJSONResponse(carpark_service.encode_results(results, projection),
+                               headers={"Cache-Control": "no-store", **availability_headers()})
+
+
+@app.get("/availability/live")
+async def live_availability(carparks: Optional[str] = None, lat: Optional[float] = Query(None, ge=-90, le=90),
+        lng: Optional[float] = Query(None, ge=-180, le=180), radius: float = Query(1000, gt=0, le=5000)):
+    """Server-sent lot-count changes for the given carparks and/or every carpark within radius of lat/lng."""
+    if not carparks and (lat is None or lng is None):
+        raise HTTPException(status_code=400, detail="carparks or lat and lng are required")
+    watched = carpark_service.watch_set(carparks, lat, lng, radius, LIVE_MAX_CARPARKS)
+    if live_hub.full():
+        raise HTTPException(status_code=503, detail="Too many live subscriptions, try again later",
+                            headers={"Retry-After": "30"})
+    events = live_hub.stream(watched, carpark_service.current_lots)
+    return StreamingResponse(events, media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/availability/heatmap")
+async def availability_heatmap(request: Request, bbox: Optional[str] = None, cell_m: int = 1000):
+    """Total and available lots per grid cell and per planning area in bbox, kept up to date as polls arrive."""
+    # Tagged by content, not snapshot_version: that counter restarts with the process and differs between
+    # workers, so the same number could stand for different data. Building the body takes a few ms at most.
+    body = orjson.dumps(carpark_service.heatmap(bbox, cell_m))
+    etag = make_etag(body)
+    headers = {"ETag": etag, "Cache-Control": "no-cache", **availability_headers()}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return CarparkJSONResponse(body, headers=headers)
+
+
+@app.post("/alerts", status_code=201)
+async def create_alert(request: Request, alert: AlertRequest):
+    """
+    Alert when carpark_number (or any carpark within radius of lat/lng) drops below / rises above a lot count.
+    Delivered as a POST to webhook, or as "alert" events on GET /alerts/stream?channel=.
+    """
+    async with admission.admit(request):
+        if alert.webhook is not None:
+            await alert_engine.check_webhook_host(alert.webhook)
+        return alert_engine.add(alert, client_key(request, admission.api_keys)).to_dict()
+
+
+@app.delete("/alerts/{alert_id}", status_code=204)
+async def delete_alert(alert_id: str):
+    if not alert_engine.remove(alert_id):
+        raise HTTPException(status_code=404, detail="Alert not found")
+
+
+@app.get("/alerts/stream")
+async def alert_stream(channel: str = Query(..., min_length=8, max_length=64)):
+    """Server-sent "alert" events for every alert delivered to channel."""
+    if alert_engine.channel_full():
+        raise HTTPException(status_code=503, detail="Too many alert streams, try again later",
+                            headers={"Retry-After": "30"})
+    return StreamingResponse(alert_engine.stream(channel), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/carparks/{carpark_number}/best-start-time")
+async def best_start_time(request: Request, carpark_number: str, day: date, duration: int = Query(..., gt=0, le=1440),
+        step: int = Query(15, ge=1, le=60)):
+    """Cost for every start time on `day` for a stay of `duration` minutes, and the cheapest start."""
+    with REQUEST_SECONDS.labels("best_start_time").time():
+        async with admission.admit(request):
+            return await carpark_service.best_start_times(carpark_number, day, duration, step)
+
+
+@app.get("/carparks/{carpark_number}/history")
+async def availability_history(carpark_number: str, start: Optional[datetime] = Query(None, alias="from"),
+        end: Optional[datetime] = Query(None, alias="to")):
+    """Available lots recorded for the carpark between from and to (default: the last 24 hours)."""
+    return carpark_service.availability_history(carpark_number, start, end)
+
+
+@app.get("/admin/profiles/{profile_id}")
+async def profile_report(request: Request, profile_id: str):
+    """Full report for a request profiled with X-Profile-Key: stage timings, sampled hot functions, context."""
+    check_key(requested_key(request))
+    report = get_report(profile_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return report
 
 
 @app.get("/health")
 async def health():
-    return {"status": "ok", "timestamp": datetime.now().isoformat()}
+    return {
+        "status": "ok",
+        "timestamp": datetime.now().isoformat(),
+        "admission": admission.stats(),
+        "upstreams": {breaker.name: breaker.stats() for breaker in breakers},
+        "availability_age": carpark_service.availability_age(),
+        "live": live_hub.stats(),
+        "alerts": alert_engine.stats(),
+        "archive": carpark_service.archive.stats() if carpark_service.archive else None,
+        "walking": carpark_service.walking_graph.stats() if carpark_service.walking_graph else None,
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,98 @@
+# Prometheus metrics, served at /metrics.
+# Latency histograms are observed where the work happens (search stages, pollers, event loop);
+# counters that other components already keep (caches, breakers, admission, availability age)
+# are read at scrape time by ServiceCollector instead of being counted twice.
+
+import asyncio
+import time
+
+from prometheus_client import Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REQUEST_SECONDS = Histogram(
+    "carpark_request_seconds", "End-to-end handler latency per endpoint", ["endpoint"], buckets=LATENCY_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    "carpark_stage_seconds", "Latency of each find_carpark stage", ["stage"], buckets=LATENCY_BUCKETS
+)
+TOKEN_SECONDS = STAGE_SECONDS.labels("token")
+GEOCODE_SECONDS = STAGE_SECONDS.labels("geocode")
+NEAREST_SECONDS = STAGE_SECONDS.labels("nearest")
+PRICING_SECONDS = STAGE_SECONDS.labels("pricing")
+SERIALIZATION_SECONDS = STAGE_SECONDS.labels("serialization")
+
+POLL_SECONDS = Histogram(
+    "carpark_poll_seconds", "Availability poller durations", ["source", "phase"], buckets=LATENCY_BUCKETS
+)
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "carpark_event_loop_lag_seconds", "How late a periodic event-loop timer fires",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+
+async def monitor_event_loop_lag(interval: float = 0.5):
+    """Anything blocking the loop (sync I/O, big CPU jobs) shows up as the sleep overshooting."""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG_SECONDS.observe(max(0.0, time.perf_counter() - start - interval))
+
+
+class ServiceCollector:
+    """Reads the counters kept by CarparkService, the circuit breakers and admission control at scrape time."""
+
+    def __init__(self, service, admission, breakers):
+        self.service = service
+        self.admission = admission
+        self.breakers = breakers
+
+    def collect(self):
+        age = GaugeMetricFamily("carpark_availability_age_seconds",
+                                "Seconds since the last successful availability poll", labels=["source"])
+        for source, seconds in self.service.availability_age().items():
+            if seconds is not None:
+                age.add_metric([source], seconds)
+        yield age
+
+        hits = CounterMetricFamily("carpark_cache_hits", "Cache hits", labels=["cache"])
+        misses = CounterMetricFamily("carpark_cache_misses", "Cache misses", labels=["cache"])
+        hits.add_metric(["result"], self.service.result_cache.hits)
+        misses.add_metric(["result"], self.service.result_cache.misses)
+        hits.add_metric(["geocode"], self.service.geocode_hits)
+        misses.add_metric(["geocode"], self.service.geocode_misses)
+        yield hits
+        yield misses
+
+        calls = CounterMetricFamily("carpark_upstream_calls", "Calls made to each upstream", labels=["upstream"])
+        errors = CounterMetricFamily("carpark_upstream_errors", "Failed upstream calls", labels=["upstream"])
+        short = CounterMetricFamily("carpark_upstream_short_circuited",
+                                    "Calls refused while the circuit was open", labels=["upstream"])
+        open_ = GaugeMetricFamily("carpark_upstream_circuit_open", "1 if the circuit is open or half-open",
+                                  labels=["upstream"])
+        for breaker in self.breakers:
+            stats = breaker.stats()
+            calls.add_metric([breaker.name], stats["calls"])
+            errors.add_metric([breaker.name], stats["errors"])
+            short.add_metric([breaker.name], stats["short_circuited"])
+            open_.add_metric([breaker.name], 0 if stats["state"] == "closed" else 1)
+        yield calls
+        yield errors
+        yield short
+        yield open_
+
+        stats = self.admission.stats()
+        admitted = CounterMetricFamily("carpark_admission_admitted", "Requests admitted")
+        admitted.add_metric([], stats["admitted"])
+        rejected = CounterMetricFamily("carpark_admission_rejected", "Requests rejected", labels=["reason"])
+        rejected.add_metric(["rate_limited"], stats["rejected_rate_limited"])
+        rejected.add_metric(["overloaded"], stats["rejected_overloaded"])
+        in_flight = GaugeMetricFamily("carpark_admission_in_flight", "Requests holding a slot",
+                                      value=stats["in_flight"])
+        waiting = GaugeMetricFamily("carpark_admission_waiting", "Requests queued for a slot",
+                                    value=stats["waiting"])
+        yield admitted
+        yield rejected
+        yield in_flight
+        yield waiting
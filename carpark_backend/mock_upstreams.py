@@ -0,0 +1,194 @@
+# Local stand-ins for the upstream APIs, for load tests and CI without network access or credentials.
+# One app serves OneMap (getToken, elastic/search), data.gov.sg (carpark-availability) and URA
+# (insertNewToken, Car_Park_Availability) under their real paths, so pointing ONEMAP_BASE_URL,
+# DATAGOV_BASE_URL and URA_BASE_URL at it is all main:app needs. Each upstream has its own latency
+# (mean + gaussian jitter) and error rate; payload sizes are set by the dataset the availability
+# feeds are built from (plus padding entries) and the number of geocode results per search.
+#
+#   python mock_upstreams.py --port 9000 --onemap-latency-ms 40 --datagov-error-rate 0.1
+#   ONEMAP_BASE_URL=http://127.0.0.1:9000 DATAGOV_BASE_URL=http://127.0.0.1:9000 \
+#       URA_BASE_URL=http://127.0.0.1:9000 uvicorn main:app
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import zlib
+
+from fastapi import FastAPI, HTTPException, Request
+from pyproj import Transformer
+
+UPSTREAMS = ("onemap", "datagov", "ura")
+DATASET = "./data/combined_carpark_data.json"
+MOCK_TOKEN = "mock-token"
+
+wgs84_to_svy21 = Transformer.from_crs("EPSG:4326", "EPSG:3414", always_xy=True)
+
+
+class UpstreamProfile:
+    """How one stand-in behaves: latency_ms +- jitter_ms per response, and the share of requests that fail."""
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0, error_status: int = 503):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = 0
+        self.errors = 0
+
+    async def respond(self, rng: random.Random):
+        """Sleeps for this request's latency, then raises the configured error for error_rate of requests."""
+        self.requests += 1
+        delay = max(0.0, rng.gauss(self.latency_ms, self.jitter_ms) if self.jitter_ms else self.latency_ms)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+        if self.error_rate and rng.random() < self.error_rate:
+            self.errors += 1
+            raise HTTPException(status_code=self.error_status, detail="Mock upstream error")
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "errors": self.errors, "latency_ms": self.latency_ms,
+                "jitter_ms": self.jitter_ms, "error_rate": self.error_rate}
+
+
+def _load_carparks(dataset: str) -> tuple:
+    """(hdb, ura) lists of (carpark_number, lat, lng, total_lots) from a combined_carpark_data.json."""
+    hdb, ura = [], []
+    with open(dataset, "r", encoding="utf-8") as f:
+        for cp in json.load(f).values():
+            lat, lng = cp["coordinates"]
+            if lat is None:
+                continue
+            entry = (cp["carpark_number"], lat, lng, cp.get("total_lots") or 0)
+            (hdb if cp["type"] == "HDB" else ura).append(entry)
+    return hdb, ura
+
+
+def _padded(carparks: list, size: int, prefix: str) -> list:
+    """carparks cut or padded to size entries; padding uses numbers the service won't know, so it's only payload."""
+    if size is None or size == len(carparks):
+        return carparks
+    if size < len(carparks):
+        return carparks[:size]
+    lat, lng = (carparks[0][1], carparks[0][2]) if carparks else (1.3, 103.8)
+    return carparks + [(f"{prefix}{i:07d}", lat, lng, 0) for i in range(size - len(carparks))]
+
+
+def create_app(dataset: str = DATASET, profiles: dict = None, hdb_size: int = None, ura_size: int = None,
+               search_results: int = 1, token_ttl: float = 3 * 24 * 3600, seed: int = 0) -> FastAPI:
+    """
+    profiles maps "onemap" / "datagov" / "ura" to an UpstreamProfile (missing ones respond instantly).
+    hdb_size / ura_size set how many carparks the availability feeds report (default: all in dataset).
+    """
+    profiles = {name: (profiles or {}).get(name) or UpstreamProfile() for name in UPSTREAMS}
+    hdb, ura = _load_carparks(dataset)
+    hdb, ura = _padded(hdb, hdb_size, "MH"), _padded(ura, ura_size, "MU")
+    search_points = (hdb + ura) or [("", 1.3, 103.8, 0)]
+    rng = random.Random(seed)
+    app = FastAPI(title="Mock upstreams")
+
+    @app.post("/api/auth/post/getToken")
+    async def onemap_token():
+        await profiles["onemap"].respond(rng)
+        return {"access_token": MOCK_TOKEN, "expiry_timestamp": str(int((time.time() + token_ttl) * 1000))}
+
+    @app.get("/api/common/elastic/search")
+    async def onemap_search(searchVal: str, pageNum: int = 1):
+        await profiles["onemap"].respond(rng)
+        if searchVal.strip().upper() == "NOTFOUND":
+            return {"found": 0, "totalNumPages": 0, "pageNum": pageNum, "results": []}
+        # Same query, same place: a point near one of the carparks, picked by the query text
+        query_rng = random.Random(zlib.crc32(searchVal.encode()))
+        results = []
+        for i in range(search_results):
+            _, lat, lng, _ = query_rng.choice(search_points)
+            lat, lng = lat + query_rng.gauss(0, 0.002), lng + query_rng.gauss(0, 0.002)
+            x, y = wgs84_to_svy21.transform(lng, lat)
+            address = f"{i + 1} MOCK ROAD {searchVal.upper()} SINGAPORE"
+            results.append({
+                "SEARCHVAL": searchVal.upper(), "BLK_NO": str(i + 1), "ROAD_NAME": "MOCK ROAD", "BUILDING": "NIL",
+                "ADDRESS": address, "POSTAL": searchVal if searchVal.isdigit() else "NIL",
+                "X": f"{x:.4f}", "Y": f"{y:.4f}", "LATITUDE": f"{lat:.7f}", "LONGITUDE": f"{lng:.7f}",
+            })
+        return {"found": len(results), "totalNumPages": 1, "pageNum": pageNum, "results": results}
+
+    @app.get("/v1/transport/carpark-availability")
+    async def datagov_availability():
+        await profiles["datagov"].respond(rng)
+        now = time.strftime("%Y-%m-%dT%H:%M:%S")
+        carpark_data = []
+        for number, _, _, total in hdb:
+            total = total or rng.randint(50, 600)
+            carpark_data.append({
+                "carpark_info": [{"total_lots": str(total), "lot_type": "C",
+                                  "lots_available": str(rng.randint(0, total))}],
+                "carpark_number": number,
+                "update_datetime": now,
+            })
+        return {"items": [{"timestamp": now + "+08:00", "carpark_data": carpark_data}],
+                "api_info": {"status": "healthy"}}
+
+    @app.get("/uraDataService/insertNewToken/v1")
+    async def ura_token(request: Request):
+        await profiles["ura"].respond(rng)
+        if not request.headers.get("AccessKey"):
+            return {"Status": "Failed", "Message": "Missing AccessKey", "Result": None}
+        return {"Status": "Success", "Message": "", "Result": MOCK_TOKEN}
+
+    @app.get("/uraDataService/invokeUraDS/v1")
+    async def ura_availability(request: Request, service: str):
+        await profiles["ura"].respond(rng)
+        if service != "Car_Park_Availability" or not request.headers.get("Token"):
+            return {"Status": "Failed", "Message": "Invalid request", "Result": []}
+        result = []
+        for number, lat, lng, _ in ura:
+            x, y = wgs84_to_svy21.transform(lng, lat)
+            result.append({"carparkNo": number, "geometries": [{"coordinates": f"{x:.4f},{y:.4f}"}],
+                           "lotsAvailable": str(rng.randint(0, 200)), "lotType": "C"})
+        return {"Status": "Success", "Message": "", "Result": result}
+
+    @app.get("/mock/stats")
+    async def stats():
+        return {name: profile.stats() for name, profile in profiles.items()}
+
+    return app
+
+
+def profiles_from_args(args) -> dict:
+    return {
+        name: UpstreamProfile(getattr(args, f"{name}_latency_ms"), getattr(args, f"{name}_jitter_ms"),
+                              getattr(args, f"{name}_error_rate"), args.error_status)
+        for name in UPSTREAMS
+    }
+
+
+def add_profile_args(parser: argparse.ArgumentParser):
+    for name in UPSTREAMS:
+        parser.add_argument(f"--{name}-latency-ms", type=float, default=0)
+        parser.add_argument(f"--{name}-jitter-ms", type=float, default=0)
+        parser.add_argument(f"--{name}-error-rate", type=float, default=0, help="0-1, share of requests failing")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status for injected errors")
+    parser.add_argument("--dataset", default=DATASET, help="combined_carpark_data.json the feeds are built from")
+    parser.add_argument("--hdb-carparks", type=int, help="carparks in the data.gov.sg feed (default: dataset's)")
+    parser.add_argument("--ura-carparks", type=int, help="carparks in the URA feed (default: dataset's)")
+    parser.add_argument("--search-results", type=int, default=1, help="results per OneMap search response")
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve local stand-ins for OneMap, data.gov.sg and URA")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--seed", type=int, default=0)
+    add_profile_args(parser)
+    args = parser.parse_args(argv)
+
+    app = create_app(args.dataset, profiles_from_args(args), args.hdb_carparks, args.ura_carparks,
+                     args.search_results, seed=args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# Process pool for CPU-heavy pricing / ranking, so big jobs don't block the event loop.
+# Each worker loads and compiles the carpark dataset once (initializer), and per-job inputs
+# (candidate slots + distances) are handed over through shared memory rather than pickled.
+# Jobs below PRICING_POOL_THRESHOLD candidates are cheaper to run inline and never reach the pool, and if no
+# search can reach the threshold the pool isn't started at all.
+
+import asyncio
+import heapq
+import json
+import logging
+import multiprocessing
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import shared_memory
+from typing import Optional
+
+from rate_engine import compile_tariffs, bulk_cost
+
+logger = logging.getLogger(__name__)
+
+PRICING_POOL_WORKERS = int(os.getenv("PRICING_POOL_WORKERS", "2"))
+# Measured on the shipped dataset: ranking inline takes 0.4 ms for 940 candidates (about the most any 5 km search
+# sees) and 1.7 ms for all 2,900 carparks, while the pool's round trip is 1.1 and 3.2 ms. So the pool never wins
+# on latency here, and the default is out of reach: it's for datasets far bigger than today's, where an inline
+# ranking would hold the event loop for tens of milliseconds.
+PRICING_POOL_THRESHOLD = int(os.getenv("PRICING_POOL_THRESHOLD", "2000"))
+
+
+def rank_by_cost(tariffs: dict, cp_numbers: list, distances: list, start_time: datetime, end_time: datetime,
+                 limit: int) -> list:
+    """
+    Cheapest `limit` carparks as [(cost, distance, index into cp_numbers)], nearest first on ties.
+    Carparks whose cost can't be estimated are left out. Used inline and inside pool workers.
+    """
+    costs = bulk_cost(tariffs, cp_numbers, start_time, end_time)
+    priced = []
+    for i, cp_number in enumerate(cp_numbers):
+        cost = costs.get(cp_number)
+        if cost is not None and not isinstance(cost, Exception):
+            priced.append((cost, distances[i], i))
+    return heapq.nsmallest(limit, priced)
+
+
+# --- worker side ---
+
+_worker_codes = []
+_worker_tariffs = {}
+
+
+def _init_worker(data_file: str):
+    global _worker_codes, _worker_tariffs
+    with open(data_file, "r", encoding="utf-8") as f:
+        carpark_data = json.load(f)
+    _worker_codes = list(carpark_data)
+    _worker_tariffs = compile_tariffs(carpark_data)
+
+
+def _read_inputs(buf, n: int) -> tuple:
+    # Layout: n float64 distances, then n int32 slots
+    distances = list(struct.unpack_from(f"{n}d", buf, 0))
+    slots = list(struct.unpack_from(f"{n}i", buf, 8 * n))
+    return slots, distances
+
+
+def _rank_job(shm_name: str, n: int, start_time: datetime, end_time: datetime, limit: int) -> Optional[list]:
+    try:
+        shm = shared_memory.SharedMemory(name=shm_name)
+    except FileNotFoundError:
+        return None  # the request gave up on this job before it started; nobody is waiting for it
+    try:
+        slots, distances = _read_inputs(shm.buf, n)
+    finally:
+        shm.close()
+    cp_numbers = [_worker_codes[slot] for slot in slots]
+    return rank_by_cost(_worker_tariffs, cp_numbers, distances, start_time, end_time, limit)
+
+
+# --- parent side ---
+
+def _release(shm: shared_memory.SharedMemory):
+    shm.close()
+    shm.unlink()
+
+
+class PricingPool:
+    """
+    Owns the worker processes. Slots are positions in the dataset file, which the parent and every
+    worker load in the same order, so only small ints cross the process boundary.
+    """
+
+    def __init__(self, data_file: str, carpark_data: dict, workers: int = PRICING_POOL_WORKERS,
+                 threshold: int = PRICING_POOL_THRESHOLD, max_candidates: Optional[int] = None):
+        """max_candidates: the most candidates one search can have, if known. Below threshold, no pool is started."""
+        self.data_file = data_file
+        self.threshold = threshold
+        self.codes = list(carpark_data)
+        self.slots = {cp_number: i for i, cp_number in enumerate(self.codes)}
+        self.workers = workers
+        self.executor = None
+        if workers > 0 and max_candidates is not None and max_candidates < threshold:
+            logger.info(f"Pricing pool not started: searches have at most {max_candidates} candidates, "
+                        f"threshold is {threshold}")
+        elif workers > 0 and self.codes:
+            # spawn: forking a process that's running an event loop (and maybe threads) isn't safe
+            self.executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(data_file,),
+            )
+            logger.info(f"Pricing pool started with {workers} workers (threshold {threshold} candidates)")
+
+    def should_offload(self, n_candidates: int) -> bool:
+        return self.executor is not None and n_candidates >= self.threshold
+
+    async def rank_by_cost(self, cp_numbers: list, distances: list, start_time: datetime, end_time: datetime,
+                           limit: int) -> list:
+        """
+        Same result as rank_by_cost(...), computed in a worker process. If the caller stops waiting
+        (deadline, cancellation), a job that hasn't started is cancelled; one already running can't be
+        stopped, so its inputs stay in shared memory until it finishes and its result is dropped.
+        """
+        n = len(cp_numbers)
+        shm = shared_memory.SharedMemory(create=True, size=max(12 * n, 1))
+        try:
+            struct.pack_into(f"{n}d", shm.buf, 0, *distances)
+            struct.pack_into(f"{n}i", shm.buf, 8 * n, *(self.slots[cp] for cp in cp_numbers))
+            future = self.executor.submit(_rank_job, shm.name, n, start_time, end_time, limit)
+        except BaseException:
+            _release(shm)
+            raise
+        # Runs once the job is done, failed or cancelled: never while a worker may still read the inputs
+        future.add_done_callback(lambda _: _release(shm))
+        try:
+            return await asyncio.wrap_future(future)
+        finally:
+            future.cancel()
+
+    def warm_up(self):
+        # Start every worker now so the dataset is loaded before the first heavy request
+        if self.executor is not None:
+            for _ in range(self.workers):
+                self.executor.submit(len, ())
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
@@ -0,0 +1,197 @@
+# Opt-in profiling of a single /find-carpark request, for admins chasing production slowness.
+# Sending PROFILE_KEY (X-Profile-Key header or profile_key query param) runs that request with:
+#   * stage timings: find_coord (token / geocode), find_nearest_carpark, each calc_cost call,
+#     rank_by_cost for sort=cost, serialization. Returned in a Server-Timing header.
+#   * a sampling profiler on the event loop thread, aggregated per function.
+# The full report (stages, hot functions, and the request's search point, window and availability
+# snapshot, so it can be reproduced) is kept for GET /admin/profiles/{id}.
+# Profiled requests skip the result cache and the pricing pool, so the work is actually done, in this process.
+
+import hmac
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi import HTTPException, Request
+
+PROFILE_KEY = os.getenv("PROFILE_KEY")  # unset disables profiling
+PROFILE_HEADER = "x-profile-key"
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "1")) / 1000
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))  # reports kept for /admin/profiles
+PROFILE_TOP = 30  # functions / stacks listed per report
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack every interval from a background thread."""
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = 0
+        self.idle = 0  # samples where the event loop was waiting for I/O
+        self.self_counts = Counter()
+        self.total_counts = Counter()
+        self.stacks = Counter()
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    @staticmethod
+    def _label(code) -> str:
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        self.samples += 1
+        if frame.f_code.co_name == "select" and frame.f_code.co_filename.endswith("selectors.py"):
+            self.idle += 1
+            return
+        labels = []
+        while frame is not None:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        self.self_counts[labels[0]] += 1
+        self.total_counts.update(set(labels))
+        self.stacks[";".join(reversed(labels))] += 1
+
+    def _run(self):
+        started = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            self._sample()
+        self.elapsed = time.perf_counter() - started
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def report(self) -> dict:
+        ms_per_sample = self.elapsed * 1000 / self.samples if self.samples else 0.0
+        return {
+            "samples": self.samples,
+            "idle_samples": self.idle,
+            "ms_per_sample": round(ms_per_sample, 3),
+            "functions": [
+                {"function": label, "total_ms": round(count * ms_per_sample, 2),
+                 "self_ms": round(self.self_counts[label] * ms_per_sample, 2)}
+                for label, count in self.total_counts.most_common(PROFILE_TOP)
+            ],
+            # collapsed "outer;...;inner count" lines, as flamegraph tools take them
+            "stacks": [f"{stack} {count}" for stack, count in self.stacks.most_common(PROFILE_TOP)],
+        }
+
+
+class RequestProfile:
+    def __init__(self, endpoint: str, params: dict):
+        self.id = uuid.uuid4().hex[:16]
+        self.endpoint = endpoint
+        self.params = params
+        self.context = {}
+        self.stages = []
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.sampler = SamplingProfiler(threading.get_ident())
+
+    def add(self, stage: str, seconds: float, **detail):
+        self.stages.append({"stage": stage, "ms": round(seconds * 1000, 3),
+                            "at_ms": round((time.perf_counter() - seconds - self.started) * 1000, 3), **detail})
+
+    def totals(self) -> dict:
+        """stage -> (total ms, calls), in order of first appearance."""
+        totals = {}
+        for entry in self.stages:
+            ms, calls = totals.get(entry["stage"], (0.0, 0))
+            totals[entry["stage"]] = (ms + entry["ms"], calls + 1)
+        return totals
+
+    def server_timing(self) -> str:
+        parts = [f'{stage};dur={ms:.3f};desc="{calls} call{"s" if calls > 1 else ""}"'
+                 for stage, (ms, calls) in self.totals().items()]
+        if self.seconds is not None:
+            parts.append(f"total;dur={self.seconds * 1000:.3f}")
+        return ", ".join(parts)
+
+    def report(self) -> dict:
+        return {
+            "id": self.id,
+            "endpoint": self.endpoint,
+            "params": self.params,
+            "context": self.context,
+            "total_ms": round(self.seconds * 1000, 3) if self.seconds is not None else None,
+            "stage_totals": {stage: {"ms": round(ms, 3), "calls": calls}
+                             for stage, (ms, calls) in self.totals().items()},
+            "stages": self.stages,
+            "sampler": self.sampler.report(),
+        }
+
+
+_current = ContextVar("request_profile", default=None)
+reports = OrderedDict()
+
+
+def check_key(key: Optional[str]):
+    """403 unless key matches PROFILE_KEY."""
+    if not PROFILE_KEY or not key or not hmac.compare_digest(key.encode(), PROFILE_KEY.encode()):
+        raise HTTPException(status_code=403, detail="Invalid profile key")
+
+
+def requested_key(request: Request) -> Optional[str]:
+    return request.headers.get(PROFILE_HEADER) or request.query_params.get("profile_key")
+
+
+@contextmanager
+def profile_request(request: Request, endpoint: str):
+    """
+    Yields a RequestProfile if the request carries a profile key (403 if the key is wrong), else None.
+    On exit the sampler stops and the report is stored for get_report.
+    """
+    key = requested_key(request)
+    if key is None:
+        yield None
+        return
+    check_key(key)
+    params = {k: v for k, v in request.query_params.items() if k != "profile_key"}
+    profile = RequestProfile(endpoint, params)
+    token = _current.set(profile)
+    profile.sampler.start()
+    try:
+        yield profile
+    finally:
+        profile.seconds = time.perf_counter() - profile.started
+        profile.sampler.stop()
+        _current.reset(token)
+        reports[profile.id] = profile.report()
+        while len(reports) > PROFILE_KEEP:
+            reports.popitem(last=False)
+
+
+def current_profile() -> Optional[RequestProfile]:
+    return _current.get()
+
+
+def get_report(profile_id: str) -> Optional[dict]:
+    return reports.get(profile_id)
+
+
+@contextmanager
+def stage(name: str, **detail):
+    """Times the with block as a stage of the current request's profile; does nothing when not profiling."""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(name, time.perf_counter() - started, **detail)
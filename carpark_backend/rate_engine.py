@@ -0,0 +1,257 @@
+# Compiled tariffs for fast, bulk cost evaluation.
+# calc_rates.calc_cost re-parses every "07.00 AM" / "$1.20" string on every call, which is fine for
+# 10 carparks but far too slow when a request needs to price every carpark inside a radius.
+# Here each carpark's rates are parsed once at load into plain tuples, and identical tariffs are
+# shared so a window only has to be priced once per distinct tariff.
+# The evaluation below mirrors calc_cost step by step so prices are identical to the reference.
+
+import math
+from datetime import datetime, date, time, timedelta
+
+from calc_rates import HDB_DAY_KEYS, get_day_type, get_rate_for_day, parse_time_str_to_obj, special_rates_HDB
+from day_calendar import DAY_TYPES
+
+US_PER_SEC = 1_000_000
+US_PER_MIN = 60 * US_PER_SEC
+MINUTES_PER_DAY = 24 * 60
+DAY_END_US = (24 * 3600 - 1) * US_PER_SEC  # 23:59:59, where calc_cost ends the first day of an overnight stay
+GRACE_US = 15 * US_PER_MIN
+
+
+def _us_of_day(dt: datetime) -> int:
+    return ((dt.hour * 60 + dt.minute) * 60 + dt.second) * US_PER_SEC + dt.microsecond
+
+
+def _ceil_minutes(us: int) -> int:
+    return -(-us // US_PER_MIN)
+
+
+def _hms_to_us(hms: str) -> int:
+    t = datetime.strptime(hms, "%H:%M:%S").time()
+    return _us_of_day(datetime.combine(date.min, t))
+
+
+class Tariff:
+    """
+    A carpark's rates, pre-parsed for evaluation.
+    kind is 'HDB' or 'URA'. For HDB, rules maps day type -> [(start_us, end_us, rate_per_half_hour)],
+    or is None for the default $0.60/30 mins. For URA, rules is a list of
+    (start_us, end_us, {day_type: (min_duration, rate) or the exception parsing it raised}).
+    """
+
+    __slots__ = ("kind", "rules", "key", "_minute_tables")
+
+    def __init__(self, kind: str, rules, key):
+        self.kind = kind
+        self.rules = rules
+        self.key = key
+        self._minute_tables = {}
+
+    def cost(self, start_time: datetime, end_time: datetime) -> float:
+        """Same result as calc_rates.calc_cost for the carpark this tariff was compiled from."""
+        start_date, end_date = start_time.date(), end_time.date()
+        part = self._hdb_cost if self.kind == "HDB" else self._ura_cost
+        if end_date > start_date:  # overnight parking, split exactly like calc_cost
+            first_day_end_time = datetime.combine(start_date, time(23, 59, 59))
+            second_day_start_time = datetime.combine(end_date, time(0, 0, 0))
+            return part(start_time, first_day_end_time) + part(second_day_start_time, end_time)
+        return part(start_time, end_time)
+
+    def _hdb_cost(self, start_time: datetime, end_time: datetime) -> float:
+        # Mirrors calc_hdb_cost
+        if end_time - start_time <= timedelta(minutes=15):
+            return 0.0
+        if self.rules is None:
+            duration_in_minutes = math.ceil((end_time - start_time).total_seconds() / 60)
+            return round(duration_in_minutes * (0.60 / 30.0), 2)
+
+        total_cost = 0.0
+        cur = _us_of_day(start_time)
+        end = _us_of_day(end_time)
+        for rate_start, rate_end, rate in self.rules[get_day_type(start_time)]:
+            if cur >= rate_start and end <= rate_end:
+                total_cost += _ceil_minutes(end - cur) * rate / 30.0
+                return round(total_cost, 2)
+            if cur > rate_end:
+                continue
+            if cur >= rate_start and end > rate_end:
+                total_cost += _ceil_minutes(rate_end - cur) * rate / 30
+                cur = rate_end + US_PER_SEC
+        return round(total_cost, 2)
+
+    def _ura_cost(self, start_time: datetime, end_time: datetime) -> float:
+        # Mirrors calc_ura_cost
+        if not self.rules:
+            return 0.0
+
+        total_cost = 0.0
+        current = start_time
+        while current < end_time:
+            day_end = datetime.combine(current.date(), time(23, 59, 59))
+            chunk_end = min(day_end, end_time)
+            total_cost = self._ura_day_cost(total_cost, get_day_type(current), _us_of_day(current), _us_of_day(chunk_end))
+            current = chunk_end + timedelta(seconds=1)
+
+        return round(total_cost, 2)
+
+    def _ura_day_cost(self, total_cost: float, day_type: str, cur: int, chunk: int) -> float:
+        # One day of calc_ura_cost's loop; cur..chunk are microseconds since midnight
+        for rule_start, rule_end, day_rates in self.rules:
+            overlap_start = max(cur, rule_start)
+            overlap_end = min(chunk, rule_end)
+            if overlap_start >= overlap_end:
+                continue
+            rate_info = day_rates[day_type]
+            if isinstance(rate_info, Exception):
+                raise rate_info.with_traceback(None)
+            min_duration, rate = rate_info
+            if rate <= 0:
+                continue
+            duration_mins = _ceil_minutes(overlap_end - overlap_start)
+            blocks = math.ceil(duration_mins / max(min_duration, 1))
+            total_cost += blocks * rate
+        return total_cost
+
+    def _minute_table(self, day_type: str) -> tuple:
+        """
+        Per-minute tariff for an HDB special carpark, built on first use.
+        Returns (prefix, stop): prefix[m] is the sum of per-minute rates (in cents per half hour) before minute m,
+        stop[m] is the first uncovered minute at or after m. calc_hdb_cost stops charging at the first gap
+        between rate windows, so a stay from s is billed for minutes s..min(end, stop[s]).
+        """
+        table = self._minute_tables.get(day_type)
+        if table is None:
+            rate = [0] * MINUTES_PER_DAY
+            covered = [False] * MINUTES_PER_DAY
+            for rate_start, rate_end, rate_per_half_hour in self.rules[day_type]:
+                for m in range(rate_start // US_PER_MIN, rate_end // US_PER_MIN + 1):
+                    rate[m] = round(rate_per_half_hour * 100)
+                    covered[m] = True
+            prefix = [0] * (MINUTES_PER_DAY + 1)
+            for m in range(MINUTES_PER_DAY):
+                prefix[m + 1] = prefix[m] + rate[m]
+            stop = [MINUTES_PER_DAY] * (MINUTES_PER_DAY + 1)
+            for m in range(MINUTES_PER_DAY - 1, -1, -1):
+                stop[m] = stop[m + 1] if covered[m] else m
+            table = self._minute_tables[day_type] = (prefix, stop)
+        return table
+
+    def _sweep_part(self, day: date, start_min: int, end_min: int, end_us: int) -> float:
+        # Cost of one same-day piece of a stay starting on a whole minute, as calc_cost would bill it
+        start_us = start_min * US_PER_MIN
+        day_type = get_day_type(day)
+        if self.kind == "HDB":
+            if end_us - start_us <= GRACE_US:
+                return 0.0
+            if self.rules is None:
+                return round(_ceil_minutes(end_us - start_us) * (0.60 / 30.0), 2)
+            prefix, stop = self._minute_table(day_type)
+            billed_to = min(end_min, stop[start_min])
+            return round((prefix[billed_to] - prefix[start_min]) / 3000, 2) if billed_to > start_min else 0.0
+        if not self.rules or start_us >= end_us:
+            return 0.0
+        return round(self._ura_day_cost(0.0, day_type, start_us, end_us), 2)
+
+    def sweep(self, day: date, duration: int, step: int = 15) -> list:
+        """
+        Cost of parking for duration minutes starting at every step-th minute of day.
+        Returns [(start_minute, cost or the exception raised)]. Each start is O(1) for HDB (prefix sums over the per-minute tariff)
+        and O(rules) for URA, instead of a full calc_cost per start. duration must be at most a day.
+        """
+        next_day = day + timedelta(days=1)
+        results = []
+        for start_min in range(0, MINUTES_PER_DAY, step):
+            end_min = start_min + duration
+            try:
+                if end_min < MINUTES_PER_DAY:
+                    cost = self._sweep_part(day, start_min, end_min, end_min * US_PER_MIN)
+                else:  # overnight, split at 23:59:59 like calc_cost
+                    end_min -= MINUTES_PER_DAY
+                    cost = (self._sweep_part(day, start_min, MINUTES_PER_DAY, DAY_END_US)
+                            + self._sweep_part(next_day, 0, end_min, end_min * US_PER_MIN))
+            except Exception as e:
+                cost = e
+            results.append((start_min, cost))
+        return results
+
+
+def _compile_ura_rules(rates: list, veh_cat: str = "Car") -> tuple:
+    rules = []
+    for rule in rates:
+        if rule.get("veh_cat") != veh_cat:
+            continue
+        try:
+            rule_start = _us_of_day(datetime.combine(date.min, parse_time_str_to_obj(rule["start_time"])))
+            rule_end = _us_of_day(datetime.combine(date.min, parse_time_str_to_obj(rule["end_time"])))
+        except Exception:
+            continue
+        day_rates = {}
+        for day_type in DAY_TYPES:
+            try:
+                info = get_rate_for_day(rule, day_type)
+                day_rates[day_type] = (info["min_duration"], info["rate"])
+            except Exception as e:  # calc_ura_cost raises when it reaches this rule, so do we
+                day_rates[day_type] = e
+        rules.append((rule_start, rule_end, day_rates))
+    return tuple(rules)
+
+
+def compile_tariff(carpark: dict) -> Tariff:
+    """Parses a carpark's rates once. Raises ValueError for unknown carpark types, like calc_cost."""
+    if carpark["type"] == "HDB":
+        code = carpark["carpark_number"]
+        if code not in special_rates_HDB:
+            return Tariff("HDB", None, ("HDB", None))
+        rules = {
+            day_type: tuple(
+                (_hms_to_us(r["start"]), _hms_to_us(r["end"]), r["rate_per_half_hour"])
+                for r in special_rates_HDB[code][day_key]
+            )
+            for day_type, day_key in HDB_DAY_KEYS.items()
+        }
+        return Tariff("HDB", rules, ("HDB", code))
+    elif carpark["type"] == "URA":
+        rules = _compile_ura_rules(carpark.get("rates") or [])
+        key = ("URA", tuple(
+            (s, e, tuple(repr(d[t]) for t in DAY_TYPES)) for s, e, d in rules
+        ))
+        return Tariff("URA", rules, key)
+    else:
+        raise ValueError("Unknown carpark type")
+
+
+def compile_tariffs(carpark_data: dict) -> dict:
+    """
+    Compiles every carpark in carpark_data. Carparks with identical rates share one Tariff object,
+    which is what lets bulk_cost price a window once per distinct tariff.
+    """
+    interned = {}
+    tariffs = {}
+    for cp_number, cp_info in carpark_data.items():
+        try:
+            tariff = compile_tariff(cp_info)
+        except ValueError:
+            continue
+        tariffs[cp_number] = interned.setdefault(tariff.key, tariff)
+    return tariffs
+
+
+def bulk_cost(tariffs: dict, cp_numbers, start_time: datetime, end_time: datetime) -> dict:
+    """
+    Prices start_time..end_time for every carpark in cp_numbers.
+    Returns {cp_number: cost or the exception raised}; carparks without a tariff are left out.
+    """
+    by_tariff = {}
+    results = {}
+    for cp_number in cp_numbers:
+        tariff = tariffs.get(cp_number)
+        if tariff is None:
+            continue
+        key = id(tariff)
+        if key not in by_tariff:
+            try:
+                by_tariff[key] = tariff.cost(start_time, end_time)
+            except Exception as e:
+                by_tariff[key] = e
+        results[cp_number] = by_tariff[key]
+    return results
@@ -0,0 +1,260 @@
+# Differential test + benchmark harness for the rate engines.
+# Generates random carparks, tariffs and parking windows (overnight, multi-day, grace-period and
+# rule-boundary cases), checks every optimised engine in rate_engine.py against the reference
+# calc_cost, and reports throughput in cost evaluations per second.
+#
+#   python rate_engine_harness.py --cases 20000 --seed 1
+#
+# Exits non-zero if any engine disagrees with the reference.
+
+import argparse
+import json
+import os
+import random
+import sys
+import time as timer
+from contextlib import contextmanager
+from datetime import datetime, date, time, timedelta
+
+from calc_rates import calc_cost, special_rates_HDB
+from rate_engine import compile_tariff, compile_tariffs, bulk_cost
+
+HDB_RATES = (0.60, 0.80, 1.20, 1.40)
+URA_RATES = ("$0.00", "$0.00", "$0.50", "$0.60", "$0.70", "$0.75", "$1.20", "$1.50", "$5.00", "$5.60")
+URA_MIN_DURATIONS = ("0 mins", "30 mins", "30 mins", "60 mins", "510 mins")
+URA_TIME_FORMATS = ("{h:02d}.{m:02d} {p}", "{h:02d}:{m:02d} {p}", "{h}.{m:02d}{p}", "{h}:{m:02d}{p}")
+
+
+def _fmt_12h(minute_of_day: int, rng: random.Random) -> str:
+    h24, m = divmod(minute_of_day % (24 * 60), 60)
+    h = h24 % 12 or 12
+    return rng.choice(URA_TIME_FORMATS).format(h=h, m=m, p="AM" if h24 < 12 else "PM")
+
+
+def _fmt_24h(seconds: int) -> str:
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def random_hdb_special(rng: random.Random) -> dict:
+    """A special_rates_HDB entry: contiguous windows over the day, sometimes with a gap like BBB's 17:00-19:00."""
+    tariff = {}
+    for day_key in ("weekdays", "saturdays", "sundays"):
+        cuts = sorted(rng.sample(range(30, 24 * 60, 30), rng.randint(0, 5)))
+        bounds = [0] + cuts + [24 * 60]
+        windows = []
+        for start, end in zip(bounds, bounds[1:]):
+            if windows and rng.random() < 0.15:
+                continue  # leave a gap
+            windows.append({
+                "start": _fmt_24h(start * 60),
+                "end": _fmt_24h(end * 60 - 1),
+                "rate_per_half_hour": rng.choice(HDB_RATES),
+            })
+        tariff[day_key] = windows
+    return tariff
+
+
+def random_ura_rates(rng: random.Random) -> list:
+    """A URA 'rates' list: 1-6 rules, including overnight rules, free blocks, flat per-entry charges and bad data."""
+    rates = []
+    for _ in range(rng.randint(1, 6)):
+        start = rng.randrange(0, 48) * 30
+        end = rng.randrange(0, 48) * 30 if rng.random() < 0.3 else min(start + rng.randrange(1, 20) * 30, 23 * 60 + 59)
+        rule = {
+            "veh_cat": "Car" if rng.random() < 0.9 else rng.choice(["Motorcycle", "Heavy Vehicle"]),
+            "start_time": _fmt_12h(start, rng) if rng.random() < 0.97 else None,
+            "end_time": _fmt_12h(end, rng),
+        }
+        for day_type in ("weekday", "saturday", "sunday_ph"):
+            if rng.random() < 0.03:
+                continue  # missing day block is billed as free
+            if rng.random() < 0.03:
+                rule[day_type] = {"min_duration": None, "rate": None}  # as in the real URA feed
+                continue
+            rule[day_type] = {"min_duration": rng.choice(URA_MIN_DURATIONS), "rate": rng.choice(URA_RATES)}
+        rates.append(rule)
+    return rates
+
+
+def random_carparks(rng: random.Random, n: int) -> tuple:
+    """Returns (carpark_data, hdb_specials) with n carparks, roughly half HDB (a third of those special) and half URA."""
+    carparks, specials = {}, {}
+    for i in range(n):
+        if rng.random() < 0.5:
+            code = f"ZZH{i}"
+            if rng.random() < 0.33:
+                specials[code] = random_hdb_special(rng)
+            carparks[code] = {"carpark_number": code, "type": "HDB", "coordinates": (None, None)}
+        else:
+            code = f"ZZU{i}"
+            carparks[code] = {"carpark_number": code, "type": "URA", "coordinates": (None, None),
+                              "rates": random_ura_rates(rng) if rng.random() < 0.97 else []}
+    return carparks, specials
+
+
+@contextmanager
+def registered_hdb_specials(specials: dict):
+    """HDB special rates live in calc_rates.special_rates_HDB, so random ones are registered for the duration."""
+    special_rates_HDB.update(specials)
+    try:
+        yield
+    finally:
+        for code in specials:
+            special_rates_HDB.pop(code, None)
+
+
+def random_window(rng: random.Random) -> tuple:
+    """A parking window biased towards the edges calc_cost cares about."""
+    day = date(2024, 1, 1) + timedelta(days=rng.randrange(0, 3 * 365))
+    kind = rng.random()
+    if kind < 0.2:  # start on a half-hour rule boundary, or a second either side of it
+        start = datetime.combine(day, time()) + timedelta(minutes=rng.randrange(0, 48) * 30,
+                                                          seconds=rng.choice([0, 0, -1, 1, 59]))
+    elif kind < 0.3:  # right before midnight
+        start = datetime.combine(day, time(23, 59, 59)) - timedelta(seconds=rng.randrange(0, 3600))
+    else:
+        start = datetime.combine(day, time()) + timedelta(seconds=rng.randrange(0, 86400),
+                                                          microseconds=rng.choice([0, 0, 0, rng.randrange(10**6)]))
+
+    kind = rng.random()
+    if kind < 0.15:  # grace period edge
+        duration = timedelta(minutes=15, seconds=rng.choice([-1, 0, 0, 1]))
+    elif kind < 0.3:  # overnight
+        duration = datetime.combine(start.date() + timedelta(days=1), time()) - start + timedelta(minutes=rng.randrange(0, 600))
+    elif kind < 0.4:  # multi-day
+        duration = timedelta(days=rng.randint(1, 3), minutes=rng.randrange(0, 1440))
+    elif kind < 0.45:  # empty or reversed
+        duration = timedelta(minutes=-rng.randrange(0, 120))
+    elif kind < 0.55:  # ends at 23:59:59, like the first half of an overnight stay
+        duration = datetime.combine(start.date(), time(23, 59, 59)) - start
+    else:
+        duration = timedelta(minutes=rng.randrange(1, 12 * 60), seconds=rng.choice([0, 0, rng.randrange(60)]))
+    return start, start + duration
+
+
+def _outcome(fn, *args):
+    """Cost, or (exception type, message) so engines that fail the same way compare equal."""
+    try:
+        return fn(*args)
+    except Exception as e:
+        return (type(e).__name__, str(e))
+
+
+def _bulk_outcome(result):
+    return (type(result).__name__, str(result)) if isinstance(result, Exception) else result
+
+
+def check_engines(carparks: dict, cases: int = 5000, seed: int = 0, sweeps: int = 50, specials: dict = None) -> list:
+    """
+    Runs the differential check over carparks and returns a list of mismatch descriptions
+    (empty when every engine agrees). Covers Tariff.cost and bulk_cost on random windows,
+    and Tariff.sweep on random days/durations.
+    """
+    rng = random.Random(seed)
+    mismatches = []
+    with registered_hdb_specials(specials or {}):
+        tariffs = compile_tariffs(carparks)
+        codes = list(carparks)
+        for _ in range(cases):
+            start, end = random_window(rng)
+            batch = rng.sample(codes, min(8, len(codes)))
+            bulk = bulk_cost(tariffs, batch, start, end)
+            for code in batch:
+                expected = _outcome(calc_cost, carparks[code], start, end)
+                got = _outcome(tariffs[code].cost, start, end)
+                if got != expected:
+                    mismatches.append(f"Tariff.cost {code} {start} -> {end}: {got} != {expected}")
+                if _bulk_outcome(bulk[code]) != expected:
+                    mismatches.append(f"bulk_cost {code} {start} -> {end}: {bulk[code]} != {expected}")
+
+        for _ in range(sweeps):
+            code = rng.choice(codes)
+            day = date(2024, 1, 1) + timedelta(days=rng.randrange(0, 3 * 365))
+            duration = rng.choice([rng.randint(1, 1440), 15, 16, 1440])
+            step = rng.choice([1, 5, 15])
+            for start_min, cost in tariffs[code].sweep(day, duration, step):
+                start = datetime.combine(day, time()) + timedelta(minutes=start_min)
+                expected = _outcome(calc_cost, carparks[code], start, start + timedelta(minutes=duration))
+                if _bulk_outcome(cost) != expected:
+                    mismatches.append(f"sweep {code} {start} +{duration}m: {cost} != {expected}")
+    return mismatches
+
+
+def _rate(n: int, seconds: float) -> float:
+    return n / seconds if seconds > 0 else float("inf")
+
+
+def benchmark(cases: int = 20000, seed: int = 0, n_carparks: int = 200) -> dict:
+    """Cost evaluations per second for each engine over the same random carparks and windows."""
+    rng = random.Random(seed)
+    carparks, specials = random_carparks(rng, n_carparks)
+    windows = [random_window(rng) for _ in range(max(1, cases // n_carparks))]
+    codes = list(carparks)
+    n = len(windows) * len(codes)
+    results = {}
+    with registered_hdb_specials(specials):
+        t = timer.perf_counter()
+        for start, end in windows:
+            for code in codes:
+                _outcome(calc_cost, carparks[code], start, end)
+        results["calc_cost (reference)"] = _rate(n, timer.perf_counter() - t)
+
+        t = timer.perf_counter()
+        tariffs = {code: compile_tariff(carparks[code]) for code in codes}
+        results["compile_tariff (per carpark)"] = _rate(len(codes), timer.perf_counter() - t)
+
+        t = timer.perf_counter()
+        for start, end in windows:
+            for code in codes:
+                _outcome(tariffs[code].cost, start, end)
+        results["Tariff.cost"] = _rate(n, timer.perf_counter() - t)
+
+        shared = compile_tariffs(carparks)
+        t = timer.perf_counter()
+        for start, end in windows:
+            bulk_cost(shared, codes, start, end)
+        results["bulk_cost"] = _rate(n, timer.perf_counter() - t)
+
+        day = date(2025, 7, 7)
+        t = timer.perf_counter()
+        for code in codes:
+            shared[code].sweep(day, 120, 1)
+        results["Tariff.sweep (per start time)"] = _rate(len(codes) * 1440, timer.perf_counter() - t)
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Differential check and throughput benchmark for the rate engines")
+    parser.add_argument("--cases", type=int, default=20000, help="random windows to check (each priced at 8 carparks)")
+    parser.add_argument("--sweeps", type=int, default=200, help="random start-time sweeps to check")
+    parser.add_argument("--carparks", type=int, default=200, help="random carparks to generate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dataset", default="./data/combined_carpark_data.json",
+                        help="also check every engine against the real carparks in this file (skipped if missing)")
+    parser.add_argument("--no-bench", action="store_true", help="skip the throughput benchmark")
+    args = parser.parse_args(argv)
+
+    carparks, specials = random_carparks(random.Random(args.seed), args.carparks)
+    suites = [("random carparks", carparks, specials)]
+    if os.path.exists(args.dataset):
+        with open(args.dataset, "r", encoding="utf-8") as f:
+            suites.append((args.dataset, json.load(f), None))
+
+    mismatches = []
+    for name, data, data_specials in suites:
+        found = check_engines(data, args.cases, args.seed, args.sweeps, data_specials)
+        print(f"Differential check on {name}: {args.cases} windows, {args.sweeps} sweeps, seed {args.seed}: "
+              f"{len(found)} mismatches")
+        for line in found[:20]:
+            print("  " + line)
+        mismatches += found
+
+    if not args.no_bench:
+        print("Throughput (cost evaluations / second):")
+        for engine, rate in benchmark(args.cases, args.seed, args.carparks).items():
+            print(f"  {engine:<32} {rate:>14,.0f}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
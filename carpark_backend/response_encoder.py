@@ -0,0 +1,115 @@
+# Fast JSON for carpark results.
+# The static part of every carpark (number, address, coordinates, type, URA rates) never changes
+# after load, so it is encoded to bytes once. A response is then those fragments stitched together
+# with the per-request fields (lots, distance, cost), encoded with orjson. This skips the per-request
+# dict copies and FastAPI's jsonable_encoder + stdlib json path entirely.
+# Clients can ask for a subset of fields (?fields=), which gets its own lazily built set of fragments.
+
+import os
+import orjson
+from fastapi import Response
+
+# Fields that change per request / per poll and so are never baked into a fragment
+DYNAMIC_FIELDS = ("total_lots", "available_lots", "forecast_available_lots", "distance", "walking_distance",
+                  "route_position", "cost", "cost_note")
+STATIC_FIELDS = ("carpark_number", "address", "coordinates", "type", "rates")
+RESULT_FIELDS = STATIC_FIELDS + DYNAMIC_FIELDS
+
+# Responses at least this big are gzipped for clients that accept it
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1000"))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))
+
+MAX_PROJECTIONS = 64  # distinct ?fields= combinations kept fragments for
+
+
+def parse_fields(fields: str) -> tuple:
+    """
+    "distance,carpark_number, available_lots" -> fields in RESULT_FIELDS order, carpark_number always included.
+    None / "" means every field. Raises ValueError on unknown names.
+    """
+    if not fields:
+        return None
+    requested = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = requested.difference(RESULT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    requested.add("carpark_number")
+    return tuple(f for f in RESULT_FIELDS if f in requested)
+
+
+class CarparkEncoder:
+    def __init__(self, carpark_data: dict = None):
+        self.carpark_data = {}
+        self.fragments = {}
+        self.projections = {}
+        if carpark_data:
+            self.load(carpark_data)
+
+    def load(self, carpark_data: dict):
+        fragments = {}
+        for cp_number, cp_info in carpark_data.items():
+            static = {k: v for k, v in cp_info.items() if k not in DYNAMIC_FIELDS}
+            fragments[cp_number] = orjson.dumps(static)[:-1]  # drop the closing brace
+        self.carpark_data, self.fragments, self.projections = carpark_data, fragments, {}
+
+    def _projected_fragments(self, fields: tuple) -> dict:
+        # Filled per carpark on first use, since most carparks never show up under a given projection
+        fragments = self.projections.get(fields)
+        if fragments is None:
+            if len(self.projections) >= MAX_PROJECTIONS:
+                self.projections.clear()
+            fragments = self.projections[fields] = {}
+        return fragments
+
+    def _fragment(self, cp_number: str, fields: tuple = None):
+        if fields is None:
+            return self.fragments.get(cp_number)
+        fragments = self._projected_fragments(fields)
+        fragment = fragments.get(cp_number)
+        if fragment is None:
+            cp_info = self.carpark_data.get(cp_number)
+            if cp_info is None:
+                return None
+            static = {k: v for k, v in cp_info.items() if k in fields and k not in DYNAMIC_FIELDS}
+            fragment = fragments[cp_number] = orjson.dumps(static)[:-1]
+        return fragment
+
+    def encode_one(self, result: dict, fields: tuple = None) -> bytes:
+        """
+        result holds 'carpark_number' plus any dynamic fields; the static fields come from the fragment.
+        fields (from parse_fields) limits the output to those keys.
+        """
+        if fields is not None:
+            dynamic = {k: v for k, v in result.items() if k in DYNAMIC_FIELDS and k in fields}
+        else:
+            dynamic = {k: v for k, v in result.items() if k in DYNAMIC_FIELDS}
+        fragment = self._fragment(result.get("carpark_number"), fields)
+        if fragment is None:
+            if fields is None:
+                return orjson.dumps(result)
+            return orjson.dumps({k: v for k, v in result.items() if k in fields})
+        if not dynamic:
+            return fragment + b"}"
+        if fragment == b"{":
+            return orjson.dumps(dynamic)
+        return fragment + b"," + orjson.dumps(dynamic)[1:]
+
+    def encode(self, results: list, fields: tuple = None) -> bytes:
+        return b"[" + b",".join(self.encode_one(r, fields) for r in results) + b"]"
+
+    @staticmethod
+    def encode_update(update: dict, fields: tuple = None) -> bytes:
+        """Just the keys in update (no static fragment), e.g. a cost arriving after the carpark itself."""
+        if fields is not None:
+            update = {k: v for k, v in update.items() if k in fields}
+        return orjson.dumps(update)
+
+
+def sse_event(event: str, data: bytes) -> bytes:
+    """One server-sent event frame; data must be single-line JSON (orjson never emits newlines)."""
+    return b"event: " + event.encode() + b"\ndata: " + data + b"\n\n"
+
+
+class CarparkJSONResponse(Response):
+    """Response whose body was already encoded by CarparkEncoder."""
+    media_type = "application/json"
@@ -0,0 +1,90 @@
+# Server-side cache of encoded /find-carpark responses.
+# Repeat searches around the same mall / MRT station within one poll interval are the bulk of traffic,
+# so results are keyed on the geocoded point snapped to a ~50 m grid, the exact time window, and the
+# other query params. The window isn't snapped: costs are per minute, with grace periods and per-block
+# rounding, so any two distinct windows can have different prices. An entry is only served while the availability snapshot
+# version it was built from is still current, so every applied poll invalidates the cache.
+
+import hashlib
+import math
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from spatial_index import M_PER_DEG_LAT
+
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "2048"))
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", "60"))  # seconds, also sent as Cache-Control max-age
+RESULT_CACHE_GRID_M = float(os.getenv("RESULT_CACHE_GRID_M", "50"))
+
+
+M_PER_DEG_LNG = M_PER_DEG_LAT * math.cos(math.radians(1.35))  # fixed at Singapore's latitude so cells are stable
+
+
+def quantize_location(lat: float, lng: float, grid_m: float = RESULT_CACHE_GRID_M) -> tuple:
+    return round(lat * M_PER_DEG_LAT / grid_m), round(lng * M_PER_DEG_LNG / grid_m)
+
+
+def time_key(dt: Optional[datetime]) -> Optional[datetime]:
+    # Rates depend on wall-clock time only, so any tzinfo is dropped rather than converted
+    return None if dt is None else dt.replace(tzinfo=None)
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True if an If-None-Match header value matches etag (weak comparison, as RFC 9110 requires for it)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    strip = lambda tag: tag.strip().removeprefix("W/")
+    return strip(etag) in {strip(tag) for tag in if_none_match.split(",")}
+
+
+class CachedResult:
+    __slots__ = ("body", "etag", "version", "created", "next_cursor")
+
+    def __init__(self, body: bytes, version: int, etag: str = None, next_cursor: str = None):
+        self.body = body
+        self.etag = etag or make_etag(body)
+        self.version = version
+        self.created = time.monotonic()
+        self.next_cursor = next_cursor
+
+
+class ResultCache:
+    """LRU of CachedResult, bounded by max_entries and by age (ttl seconds) as a backstop to version checks."""
+
+    def __init__(self, max_entries: int = RESULT_CACHE_SIZE, ttl: float = RESULT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version: int) -> Optional[CachedResult]:
+        entry = self.entries.get(key)
+        if entry is None or entry.version != version or time.monotonic() - entry.created > self.ttl:
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry: CachedResult):
+        if self.max_entries <= 0:
+            return
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
@@ -0,0 +1,25 @@
+# Opaque cursors for paging through nearest-carpark results.
+# A cursor carries the search point and the last (distance, carpark_number) returned, so the next page
+# neither geocodes again nor rescans: SpatialIndex.nearest resumes from the ring that entry sits in.
+
+import base64
+import binascii
+import math
+import orjson
+
+
+def encode_cursor(lat: float, lng: float, distance: float, cp_number: str) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps([lat, lng, distance, cp_number])).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """-> (lat, lng, (distance, carpark_number)). Raises ValueError if the cursor is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        lat, lng, distance, cp_number = orjson.loads(raw)
+    except (binascii.Error, orjson.JSONDecodeError, TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+    if not all(isinstance(v, (int, float)) and math.isfinite(v) for v in (lat, lng, distance)) \
+            or not isinstance(cp_number, str):
+        raise ValueError("Invalid cursor")
+    return float(lat), float(lng), (float(distance), cp_number)
@@ -0,0 +1,236 @@
+# Grid index over carpark coordinates so radius / nearest lookups don't scan every carpark.
+# Singapore is small enough that a flat equirectangular projection is accurate to well under 0.1%,
+# which is only used to pick grid cells; distances returned are always haversine.
+
+import heapq
+import math
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371e3
+M_PER_DEG_LAT = math.pi * EARTH_RADIUS_M / 180
+
+
+def haversine(lat1, lon1, lat2, lon2) -> float:
+    R = EARTH_RADIUS_M
+    φ1, φ2 = math.radians(lat1), math.radians(lat2)
+    dφ = math.radians(lat2 - lat1)
+    dλ = math.radians(lon2 - lon1)
+
+    a = math.sin(dφ / 2) ** 2 + math.cos(φ1) * math.cos(φ2) * math.sin(dλ / 2) ** 2
+    return R * (2 * math.atan2(math.sqrt(a), math.sqrt(1 - a)))
+
+
+class SpatialIndex:
+    """Uniform grid of cell_m x cell_m cells, each holding (carpark_number, lat, lng) entries."""
+
+    def __init__(self, cell_m: float = 500.0, ref_lat: float = 1.35):
+        self.cell_m = cell_m
+        self.m_per_deg_lng = M_PER_DEG_LAT * math.cos(math.radians(ref_lat))
+        self.cells = {}
+        self.size = 0
+        self.bounds = None  # (min_x, min_y, max_x, max_y) over occupied cells
+
+    def _cell(self, lat: float, lng: float) -> tuple:
+        return (
+            math.floor(lng * self.m_per_deg_lng / self.cell_m),
+            math.floor(lat * M_PER_DEG_LAT / self.cell_m),
+        )
+
+    def insert(self, cp_number: str, lat: float, lng: float):
+        x, y = self._cell(lat, lng)
+        self.cells.setdefault((x, y), []).append((cp_number, lat, lng))
+        self.size += 1
+        if self.bounds is None:
+            self.bounds = (x, y, x, y)
+        else:
+            min_x, min_y, max_x, max_y = self.bounds
+            self.bounds = (min(min_x, x), min(min_y, y), max(max_x, x), max(max_y, y))
+
+    @classmethod
+    def from_carparks(cls, carpark_data: dict, cell_m: float = 500.0) -> "SpatialIndex":
+        index = cls(cell_m)
+        for cp_number, cp_info in carpark_data.items():
+            lat, lng = cp_info["coordinates"]
+            if lat is None or lng is None:
+                continue
+            index.insert(cp_number, lat, lng)
+        return index
+
+    def within_radius(self, lat: float, lng: float, radius_m: float) -> list:
+        """Returns [(distance_m, carpark_number)] for every carpark within radius_m, unsorted."""
+        cx, cy = self._cell(lat, lng)
+        # 1% slack covers the projection error at the edge of the search circle
+        reach = math.ceil(radius_m * 1.01 / self.cell_m)
+        results = []
+        for x in range(cx - reach, cx + reach + 1):
+            for y in range(cy - reach, cy + reach + 1):
+                for cp_number, cp_lat, cp_lng in self.cells.get((x, y), ()):
+                    d = haversine(lat, lng, cp_lat, cp_lng)
+                    if d <= radius_m:
+                        results.append((d, cp_number))
+        return results
+
+    def max_within(self, radius_m: float) -> int:
+        """Upper bound on how many carparks within_radius(..., radius_m) can return, from per-cell counts."""
+        if self.bounds is None:
+            return 0
+        min_x, min_y, max_x, max_y = self.bounds
+        reach = math.ceil(radius_m * 1.01 / self.cell_m)  # same reach as within_radius
+        counts = np.zeros((max_x - min_x + 1 + 2 * reach, max_y - min_y + 1 + 2 * reach), dtype=np.int64)
+        for (x, y), entries in self.cells.items():
+            counts[x - min_x + reach, y - min_y + reach] = len(entries)
+        # Summed-area table: every (2 * reach + 1)-cell square's total in four lookups
+        table = np.pad(counts.cumsum(0).cumsum(1), ((1, 0), (1, 0)))
+        w = 2 * reach + 1
+        return int((table[w:, w:] - table[:-w, w:] - table[w:, :-w] + table[:-w, :-w]).max())
+
+    def _ring(self, cx: int, cy: int, r: int):
+        """Occupied-area cells exactly r steps (Chebyshev) from (cx, cy): parts of the ring outside bounds are skipped."""
+        min_x, min_y, max_x, max_y = self.bounds
+        if r == 0:
+            yield cx, cy
+            return
+        xs = range(max(cx - r, min_x), min(cx + r, max_x) + 1)
+        for y in (cy - r, cy + r):
+            if min_y <= y <= max_y:
+                for x in xs:
+                    yield x, y
+        ys = range(max(cy - r + 1, min_y), min(cy + r - 1, max_y) + 1)
+        for x in (cx - r, cx + r):
+            if min_x <= x <= max_x:
+                for y in ys:
+                    yield x, y
+
+    def nearest(self, lat: float, lng: float, after: tuple = None):
+        """
+        Yields (distance_m, carpark_number) in (distance, carpark_number) order, expanding ring by ring so
+        only as much of the grid is touched as the caller consumes. after=(distance_m, carpark_number)
+        resumes just past that entry, starting from the ring it falls in rather than from the centre.
+        """
+        if self.bounds is None:
+            return
+        px, py = lng * self.m_per_deg_lng, lat * M_PER_DEG_LAT
+        cx, cy = self._cell(lat, lng)
+        min_x, min_y, max_x, max_y = self.bounds
+        last_ring = max(cx - min_x, max_x - cx, cy - min_y, max_y - cy, 0)
+
+        # Rings closer than the occupied area are empty, so a search from outside it starts at its edge
+        r = max(min_x - cx, cx - max_x, min_y - cy, cy - max_y, 0)
+        if after is not None:
+            # Every point in ring r is within (r + 1) * cell * sqrt(2) projected metres, so rings
+            # whose farthest point is still closer than `after` hold nothing left to return
+            r = max(r, math.ceil(after[0] / (self.cell_m * math.sqrt(2) * 1.01)) - 1)
+
+        heap = []
+        while r <= last_ring:
+            for cell in self._ring(cx, cy, r):
+                for cp_number, cp_lat, cp_lng in self.cells.get(cell, ()):
+                    entry = (haversine(lat, lng, cp_lat, cp_lng), cp_number)
+                    if after is None or entry > after:
+                        heapq.heappush(heap, entry)
+            # Nothing outside rings 0..r can be closer than the nearest edge of ring r (less 1% slack)
+            edge = min(
+                px - (cx - r) * self.cell_m, (cx + r + 1) * self.cell_m - px,
+                py - (cy - r) * self.cell_m, (cy + r + 1) * self.cell_m - py,
+            ) / 1.01
+            while heap and heap[0][0] < edge:
+                yield heapq.heappop(heap)
+            r += 1
+        while heap:
+            yield heapq.heappop(heap)
+
+    def along_route(self, points: list, corridor_m: float, max_cells: int = None) -> list:
+        """
+        [(route_position_m, distance_m, carpark_number)] for every carpark within corridor_m of the polyline
+        through points [(lat, lng), ...], ordered by route position: how far along the route the point
+        closest to the carpark is. Each segment is cut into cell-sized pieces and only the cells within
+        corridor_m of a piece are looked at, so the work follows the route's length, not the grid's size.
+        Runs of pieces that reach the same cells (a densely sampled route, or one doubling back on itself)
+        look at those cells once, measuring their carparks against all of the run's segments in one go.
+        Raises ValueError if that is more than max_cells cell lookups.
+        Route distances are measured in the flat projection (see top of file).
+        """
+        if not points:
+            return []
+        xy = np.array([(lng * self.m_per_deg_lng, lat * M_PER_DEG_LAT) for lat, lng in points])
+        if len(xy) == 1:
+            xy = np.concatenate([xy, xy])
+        a, d = xy[:-1], xy[1:] - xy[:-1]
+        length = np.hypot(d[:, 0], d[:, 1])
+        length_sq = length * length
+        start = np.concatenate([[0.0], np.cumsum(length)[:-1]])  # route position of each segment's start
+
+        # (cell box, first segment, last segment) for each run of pieces reaching the same cells
+        runs = []
+        for i, ((ax, ay), (dx, dy), segment_length) in enumerate(zip(a.tolist(), d.tolist(), length.tolist())):
+            pieces = max(1, math.ceil(segment_length / self.cell_m))
+            for k in range(pieces):
+                x0, y0 = ax + dx * k / pieces, ay + dy * k / pieces
+                x1, y1 = ax + dx * (k + 1) / pieces, ay + dy * (k + 1) / pieces
+                box = (math.floor((min(x0, x1) - corridor_m) / self.cell_m),
+                       math.floor((min(y0, y1) - corridor_m) / self.cell_m),
+                       math.floor((max(x0, x1) + corridor_m) / self.cell_m),
+                       math.floor((max(y0, y1) + corridor_m) / self.cell_m))
+                if runs and runs[-1][0] == box:
+                    runs[-1][2] = i
+                else:
+                    runs.append([box, i, i])
+        if max_cells is not None:
+            cells = sum((x1 - x0 + 1) * (y1 - y0 + 1) for (x0, y0, x1, y1), _, _ in runs)
+            if cells > max_cells:
+                raise ValueError("Route too detailed for this corridor")
+
+        best = {}  # carpark_number -> (distance, route position)
+        for (x0, y0, x1, y1), first, last in runs:
+            found = [entry for x in range(x0, x1 + 1) for y in range(y0, y1 + 1) for entry in self.cells.get((x, y), ())]
+            if not found:
+                continue
+            p = np.array([(cp_lng * self.m_per_deg_lng, cp_lat * M_PER_DEG_LAT) for _, cp_lat, cp_lng in found])
+            s = slice(first, last + 1)
+            # Closest point of each segment to each carpark: a + t * d, t clamped to the segment
+            rel_x = p[:, 0:1] - a[s, 0]
+            rel_y = p[:, 1:2] - a[s, 1]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                t = np.where(length_sq[s] > 0, (rel_x * d[s, 0] + rel_y * d[s, 1]) / length_sq[s], 0.0)
+            t = np.clip(t, 0.0, 1.0)
+            dist = np.hypot(rel_x - t * d[s, 0], rel_y - t * d[s, 1])
+            nearest = dist.argmin(axis=1)
+            rows = np.arange(len(found))
+            for (cp_number, _, _), dist_m, position in zip(
+                    found, dist[rows, nearest].tolist(),
+                    (start[s][nearest] + t[rows, nearest] * length[s][nearest]).tolist()):
+                if dist_m <= corridor_m and (cp_number not in best or dist_m < best[cp_number][0]):
+                    best[cp_number] = (dist_m, position)
+        return sorted((route_position, dist_m, cp_number) for cp_number, (dist_m, route_position) in best.items())
+
+
+def route_length(points: list) -> float:
+    """Length in metres of the polyline through points [(lat, lng), ...]."""
+    return sum(haversine(a[0], a[1], b[0], b[1]) for a, b in zip(points, points[1:]))
+
+
+def decode_polyline(encoded: str, precision: int = 5) -> list:
+    """[(lat, lng), ...] from an encoded polyline (the Google / OSRM format). ValueError if malformed."""
+    points, index, lat, lng = [], 0, 0, 0
+    factor = 10 ** precision
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            result, shift = 0, 0
+            while True:
+                if index >= len(encoded):
+                    raise ValueError("truncated polyline")
+                b = ord(encoded[index]) - 63
+                index += 1
+                if not 0 <= b < 64:
+                    raise ValueError("invalid polyline character")
+                result |= (b & 0x1F) << shift
+                shift += 5
+                if b < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        points.append((lat / factor, lng / factor))
+    return points
@@ -13,10 +13,14 @@ import os
 from bs4 import BeautifulSoup
 from pyproj import Transformer
 import asyncio
+import time
+from circuit_breaker import CircuitOpenError, fetch_json, datagov_breaker, DATAGOV_BASE_URL
+from metrics import POLL_SECONDS
 
 # Load environment variables from .env file
 from dotenv import load_dotenv
 load_dotenv()
+HDB_POLL_INTERVAL = float(os.getenv("HDB_POLL_INTERVAL", "60"))  # seconds
 
 # A single dictionary to hold both HDB and URA carpark data
 data = {}
@@ -48,18 +52,21 @@ def load_HDB_carpark_data(file_path, data):
         print(f"An error occurred while reading the file: {e}")
     return data
 
-async def update_realtime_availability_task(dictionary):
+async def update_realtime_availability_task(dictionary, on_update=None):
     # This dictionary is different from data, dictionary is used to update real-time availability
     # change variable names to indicate this is HDB carpark data
+    # on_update(source, changes) is called after each poll is applied, with {carpark_number: (total_lots, available_lots)}
+    # for the carparks whose numbers changed
     while True:
         # print("Updating real-time carpark availability...")
         try:
-            carpark_api_url = "https://api.data.gov.sg/v1/transport/carpark-availability"
-            carpark_response = requests.get(carpark_api_url)
-            carpark_response.raise_for_status()
-            real_time_carpark_data = carpark_response.json()
-            
+            carpark_api_url = f"{DATAGOV_BASE_URL}/v1/transport/carpark-availability"
+            with POLL_SECONDS.labels("HDB", "fetch").time():
+                real_time_carpark_data = await fetch_json(datagov_breaker, carpark_api_url)
+            apply_started = time.perf_counter()
+
             if real_time_carpark_data and real_time_carpark_data.get('items') and real_time_carpark_data['items'][0].get('carpark_data'):
+                changes = {}
                 for cp in real_time_carpark_data['items'][0]['carpark_data']:
                     carpark_number = cp.get('carpark_number')
                     carpark_info = cp.get('carpark_info')[0]
@@ -67,13 +74,23 @@ async def update_realtime_availability_task(dictionary):
                     total_lots, available_lots = carpark_info.get('total_lots'), carpark_info.get('lots_available')
                     # print(f"Processing carpark {carpark_number}: Total Lots = {total_lots}, Available Lots = {available_lots}")
                     if carpark_number in dictionary:
-                        dictionary[carpark_number]['total_lots'] = int(total_lots) if total_lots else 0
-                        dictionary[carpark_number]['available_lots'] = int(available_lots) if available_lots else 'N/A'
+                        total_lots = int(total_lots) if total_lots else 0
+                        available_lots = int(available_lots) if available_lots else 'N/A'
+                        current = dictionary[carpark_number]
+                        if current.get('total_lots') != total_lots or current.get('available_lots') != available_lots:
+                            changes[carpark_number] = (total_lots, available_lots)
+                        current['total_lots'] = total_lots
+                        current['available_lots'] = available_lots
+                if on_update:
+                    on_update("HDB", changes)
+                POLL_SECONDS.labels("HDB", "apply").observe(time.perf_counter() - apply_started)
+        except CircuitOpenError as e:
+            print(f"Skipping real-time availability poll, keeping last-known data: {e}")
         except requests.exceptions.RequestException as e:
             print(f"Failed to fetch real-time carpark availability: {e}")
         except Exception as e:
             print(f"Error processing real-time availability data: {e}")
-        await asyncio.sleep(60)
+        await asyncio.sleep(HDB_POLL_INTERVAL)
 
 def parse_ura_feature(feature, data):
     """
@@ -179,19 +196,23 @@ def load_URA_carpark_data(file_path, data):
         print(f"An error occurred while reading the URA GeoJSON file: {e}")
     return data
 
-# Load all the data, then save it as a json file
-prep_data_file = './data/HDBCarparkInformation.csv'
-data = load_HDB_carpark_data(prep_data_file, data)
-
-prep_data_file_ura = './data/carpark_rates.json'
-data = load_URA_carpark_data(prep_data_file_ura, data)
-
-# Check for None values in coordinates
-for carpark_number, carpark_info in data.items():
-    if carpark_info['coordinates'][0] is None or carpark_info['coordinates'][0] is None:
-        # del data[carpark_number]
-        print(f"Carpark {carpark_number} has invalid coordinates: {carpark_info['coordinates']}")
-# Save the combined data to a JSON file
-output_file = './combined_carpark_data.json'
-with open(output_file, 'w', encoding='utf-8') as f:
-    json.dump(data, f, ensure_ascii=False, indent=4)
+def build_combined_data(hdb_file='./data/HDBCarparkInformation.csv', ura_file='./data/carpark_rates.json',
+                        output_file='./combined_carpark_data.json'):
+    # Load all the data, then save it as a json file
+    data = load_HDB_carpark_data(hdb_file, {})
+    data = load_URA_carpark_data(ura_file, data)
+
+    # Check for None values in coordinates
+    for carpark_number, carpark_info in data.items():
+        if carpark_info['coordinates'][0] is None or carpark_info['coordinates'][0] is None:
+            # del data[carpark_number]
+            print(f"Carpark {carpark_number} has invalid coordinates: {carpark_info['coordinates']}")
+    # Save the combined data to a JSON file
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+    return data
+
+
+# Only when run as a script: importing this module (the app does, for the pollers) shouldn't rewrite files
+if __name__ == "__main__":
+    build_combined_data()
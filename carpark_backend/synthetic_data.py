@@ -0,0 +1,145 @@
+# Synthetic carpark data at any multiple of the real dataset's size, for benchmarks and load tests.
+# Writes the same raw inputs startup.py reads (HDBCarparkInformation.csv and a URA Car_Park_Details
+# style carpark_rates.json), so the loaders themselves can be measured. Carparks are placed around
+# real carpark locations (plus some spread over Singapore's bounding box), so density follows
+# the real towns, and URA rule sets are sampled from real carparks when the real dataset is around.
+#
+#   python synthetic_data.py --scale 10 --out /tmp/carparks_10x
+
+import argparse
+import csv
+import json
+import os
+import random
+
+from pyproj import Transformer
+
+import rate_engine_harness as harness
+
+DATASET = "./data/combined_carpark_data.json"
+HDB_CSV = "./data/HDBCarparkInformation.csv"
+# Size of the real dataset, used when it isn't on disk
+BASE_HDB, BASE_URA = 2256, 662
+
+SG_BBOX = (1.22, 103.62, 1.47, 104.03)  # lat_min, lng_min, lat_max, lng_max
+JITTER_M = 400
+UNIFORM_SHARE = 0.1  # carparks placed anywhere in the bbox rather than near a real one
+
+HDB_FIELDS = ["car_park_no", "address", "x_coord", "y_coord", "car_park_type", "type_of_parking_system",
+              "short_term_parking", "free_parking", "night_parking", "car_park_decks", "gantry_height",
+              "car_park_basement"]
+HDB_TEMPLATE_ROW = {
+    "car_park_type": "MULTI-STOREY CAR PARK", "type_of_parking_system": "ELECTRONIC PARKING",
+    "short_term_parking": "WHOLE DAY", "free_parking": "NO", "night_parking": "YES", "car_park_decks": "5",
+    "gantry_height": "2.1", "car_park_basement": "N",
+}
+
+wgs84_to_svy21 = Transformer.from_crs("EPSG:4326", "EPSG:3414", always_xy=True)
+
+
+def _load_sources(dataset: str, hdb_csv: str) -> tuple:
+    """(coordinates of real carparks, real URA rule sets, real HDB csv rows), each empty if not available."""
+    coords, ura_rules, hdb_rows = [], [], []
+    if os.path.exists(dataset):
+        with open(dataset, "r", encoding="utf-8") as f:
+            for cp in json.load(f).values():
+                lat, lng = cp["coordinates"]
+                if lat is not None:
+                    coords.append((lat, lng))
+                if cp["type"] == "URA" and cp.get("rates"):
+                    ura_rules.append(cp["rates"])
+    if os.path.exists(hdb_csv):
+        with open(hdb_csv, "r", encoding="utf-8") as f:
+            hdb_rows = list(csv.DictReader(f))
+    return coords, ura_rules, hdb_rows
+
+
+def _location(rng: random.Random, coords: list) -> tuple:
+    lat_min, lng_min, lat_max, lng_max = SG_BBOX
+    if not coords or rng.random() < UNIFORM_SHARE:
+        return rng.uniform(lat_min, lat_max), rng.uniform(lng_min, lng_max)
+    lat, lng = rng.choice(coords)
+    # ~JITTER_M metres of gaussian spread (1 degree ~ 111 km here)
+    return lat + rng.gauss(0, JITTER_M / 111_000), lng + rng.gauss(0, JITTER_M / 111_000)
+
+
+def _ura_features(rng: random.Random, code: str, name: str, x: float, y: float, rules: list) -> list:
+    capacity = rng.randint(10, 400)
+    features = []
+    for rule in rules:
+        weekday, saturday, sunday_ph = (rule.get(k) or {} for k in ("weekday", "saturday", "sunday_ph"))
+        features.append({
+            "ppCode": code, "ppName": name, "vehCat": rule.get("veh_cat", "Car"),
+            "startTime": rule.get("start_time"), "endTime": rule.get("end_time"),
+            "weekdayMin": weekday.get("min_duration"), "weekdayRate": weekday.get("rate"),
+            "satdayMin": saturday.get("min_duration"), "satdayRate": saturday.get("rate"),
+            "sunPHMin": sunday_ph.get("min_duration"), "sunPHRate": sunday_ph.get("rate"),
+            "parkCapacity": capacity,
+            "geometries": [{"coordinates": f"{x:.4f},{y:.4f}"}],
+        })
+    return features
+
+
+def generate(scale: float, seed: int = 0, dataset: str = DATASET, hdb_csv: str = HDB_CSV) -> tuple:
+    """
+    Returns (hdb_rows, ura_features) for scale x the real dataset: rows for HDBCarparkInformation.csv and
+    'Result' entries for carpark_rates.json. Same scale and seed give the same data.
+    """
+    rng = random.Random(seed)
+    coords, ura_rules, real_hdb_rows = _load_sources(dataset, hdb_csv)
+    n_hdb = round(BASE_HDB * scale)
+    n_ura = round(BASE_URA * scale)
+
+    hdb_rows = []
+    for i in range(n_hdb):
+        lat, lng = _location(rng, coords)
+        x, y = wgs84_to_svy21.transform(lng, lat)
+        row = dict(rng.choice(real_hdb_rows)) if real_hdb_rows else {"address": f"BLK {i} SYNTHETIC ROAD",
+                                                                     **HDB_TEMPLATE_ROW}
+        row.update({"car_park_no": f"SH{i:06d}", "x_coord": f"{x:.4f}", "y_coord": f"{y:.4f}"})
+        hdb_rows.append(row)
+
+    ura_features = []
+    for i in range(n_ura):
+        lat, lng = _location(rng, coords)
+        x, y = wgs84_to_svy21.transform(lng, lat)
+        rules = rng.choice(ura_rules) if ura_rules else harness.random_ura_rates(rng)
+        ura_features += _ura_features(rng, f"SU{i:06d}", f"SYNTHETIC CARPARK {i}", x, y, rules)
+    return hdb_rows, ura_features
+
+
+def write_files(hdb_rows: list, ura_features: list, out_dir: str) -> tuple:
+    """Writes both raw inputs into out_dir; returns (hdb_csv_path, ura_json_path)."""
+    os.makedirs(out_dir, exist_ok=True)
+    hdb_path = os.path.join(out_dir, "HDBCarparkInformation.csv")
+    ura_path = os.path.join(out_dir, "carpark_rates.json")
+    with open(hdb_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=HDB_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(hdb_rows)
+    with open(ura_path, "w", encoding="utf-8") as f:
+        json.dump({"Status": "Success", "Result": ura_features}, f)
+    return hdb_path, ura_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic HDB / URA carpark input files")
+    parser.add_argument("--scale", type=float, default=1, help="multiple of the real dataset's size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", required=True, help="output directory")
+    parser.add_argument("--combined", action="store_true",
+                        help="also run the startup.py loaders and write combined_carpark_data.json")
+    args = parser.parse_args(argv)
+
+    hdb_rows, ura_features = generate(args.scale, args.seed)
+    hdb_path, ura_path = write_files(hdb_rows, ura_features, args.out)
+    print(f"Wrote {len(hdb_rows)} HDB carparks to {hdb_path} and {len(ura_features)} URA rate rows to {ura_path}")
+    if args.combined:
+        from startup import build_combined_data
+        combined_path = os.path.join(args.out, "combined_carpark_data.json")
+        data = build_combined_data(hdb_path, ura_path, combined_path)
+        print(f"Wrote {len(data)} carparks to {combined_path}")
+
+
+if __name__ == "__main__":
+    main()
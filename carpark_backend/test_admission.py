@@ -0,0 +1,81 @@
+import unittest
+import asyncio
+from types import SimpleNamespace
+
+from fastapi import HTTPException
+
+from admission import AdmissionController, TokenBucket, client_key
+
+
+def fake_request(host="1.2.3.4", api_key=None):
+    headers = {"x-api-key": api_key} if api_key else {}
+    return SimpleNamespace(headers=headers, client=SimpleNamespace(host=host))
+
+
+class TestAdmission(unittest.IsolatedAsyncioTestCase):
+    def test_token_bucket_refills(self):
+        bucket = TokenBucket(capacity=2, now=0.0)
+        self.assertEqual(bucket.take(1.0, 2, 0.0), 0)
+        self.assertEqual(bucket.take(1.0, 2, 0.0), 0)
+        self.assertAlmostEqual(bucket.take(1.0, 2, 0.0), 1.0)
+        self.assertEqual(bucket.take(1.0, 2, 1.0), 0)
+
+    def test_client_key_prefers_known_api_key(self):
+        self.assertEqual(client_key(fake_request(api_key="abc"), frozenset({"abc"})), "key:abc")
+        self.assertEqual(client_key(fake_request(api_key="xyz"), frozenset({"abc"})), "ip:1.2.3.4")
+        self.assertEqual(client_key(fake_request(), frozenset({"abc"})), "ip:1.2.3.4")
+
+    async def test_rotating_unknown_keys_share_the_ip_bucket(self):
+        admission = AdmissionController(rate=0.001, burst=2, api_keys=frozenset({"partner"}))
+        for i in range(2):
+            async with admission.admit(fake_request(api_key=f"random-{i}")):
+                pass
+        with self.assertRaises(HTTPException) as ctx:
+            async with admission.admit(fake_request(api_key="random-2")):
+                pass
+        self.assertEqual(ctx.exception.status_code, 429)
+        async with admission.admit(fake_request(api_key="partner")):  # a configured key has its own bucket
+            pass
+
+    async def test_rate_limit_per_client(self):
+        admission = AdmissionController(rate=0.001, burst=2)
+        for _ in range(2):
+            async with admission.admit(fake_request()):
+                pass
+        with self.assertRaises(HTTPException) as ctx:
+            async with admission.admit(fake_request()):
+                pass
+        self.assertEqual(ctx.exception.status_code, 429)
+        self.assertIn("Retry-After", ctx.exception.headers)
+        async with admission.admit(fake_request(host="5.6.7.8")):  # other clients unaffected
+            pass
+        self.assertEqual((admission.admitted, admission.rejected_rate_limited), (3, 1))
+
+    async def test_sheds_when_queue_wait_exceeds_timeout(self):
+        admission = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=0.05, rate=0)
+        release = asyncio.Event()
+
+        async def hold():
+            async with admission.admit(fake_request()):
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        with self.assertRaises(HTTPException) as ctx:
+            async with admission.admit(fake_request()):
+                pass
+        self.assertEqual(ctx.exception.status_code, 503)
+        self.assertEqual(ctx.exception.headers["Retry-After"], "1")
+
+        # a queued request that gets a slot in time is admitted
+        waiter = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(holder, waiter)
+        self.assertEqual(admission.stats()["admitted"], 2)
+        self.assertEqual(admission.stats()["rejected_overloaded"], 1)
+        self.assertEqual(admission.stats()["in_flight"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,182 @@
+import unittest
+import asyncio
+import random
+from unittest import mock
+
+import orjson
+import requests
+from fastapi import HTTPException
+
+from alerts import AlertEngine, AlertRequest, ThresholdIndex, BELOW, ABOVE, check_webhook
+from carpark_service import CarparkService
+
+
+def parse(frame: bytes) -> tuple:
+    event, data = frame.decode().strip().split("\n")
+    return event[len("event: "):], orjson.loads(data[len("data: "):])
+
+
+class TestThresholdIndex(unittest.TestCase):
+    def test_crossed_matches_a_brute_force_scan(self):
+        rng = random.Random(7)
+        index = ThresholdIndex()
+        thresholds = {i: rng.randint(0, 50) for i in range(300)}
+        for alert_id, threshold in thresholds.items():
+            index.add("A", threshold, alert_id)
+        for alert_id in range(0, 300, 3):
+            index.remove("A", thresholds.pop(alert_id), alert_id)
+
+        for _ in range(200):
+            old, new = rng.choice([None, rng.randint(0, 50)]), rng.randint(0, 50)
+            below = {i for i, t in thresholds.items() if new < t and (old is None or t <= old)}
+            above = {i for i, t in thresholds.items() if t < new and (old is None or old <= t)}
+            self.assertEqual(set(index.crossed("A", BELOW, old, new)), below)
+            self.assertEqual(set(index.crossed("A", ABOVE, old, new)), above)
+        self.assertEqual(index.crossed("B", BELOW, 10, 0), [])
+
+
+class TestAlertEngine(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.service = CarparkService(None, './data/combined_carpark_data.json')
+        self.service.load_dataset()
+        self.cp = next(iter(self.service.carpark_data))
+        self.lat, self.lng = self.service.carpark_data[self.cp]["coordinates"]
+        self.service.hdb_data[self.cp] = {"total_lots": 100, "available_lots": 30}
+        self.engine = AlertEngine(self.service)
+
+    def test_carpark_alert_fires_on_crossing_only(self):
+        alert = self.engine.add(AlertRequest(carpark_number=self.cp, below=20, webhook="http://example.com/hook",
+                                             once=False))
+        self.assertEqual(alert.fired, 0)  # 30 lots now
+        self.engine.on_update("HDB", {self.cp: (100, 25)})
+        self.engine.on_update("HDB", {self.cp: (100, 18)})
+        self.engine.on_update("HDB", {self.cp: (100, 12)})  # still below: no repeat
+        self.assertEqual(alert.fired, 1)
+        url, event = self.engine.webhooks.get_nowait()
+        self.assertEqual((event["available_lots"], event["previous_lots"]), (18, 25))
+
+        self.engine.on_update("HDB", {self.cp: (100, 40)})
+        self.engine.on_update("HDB", {self.cp: (100, 5)})
+        self.assertEqual(alert.fired, 2)
+        self.assertTrue(self.engine.remove(alert.id))
+        self.assertFalse(self.engine.remove(alert.id))
+        self.assertEqual(self.engine.by_carpark[BELOW].keys, {})
+
+    def test_once_alert_fires_at_registration_and_is_dropped(self):
+        alert = self.engine.add(AlertRequest(carpark_number=self.cp, above=10, webhook="http://example.com/hook"))
+        self.assertEqual(alert.fired, 1)
+        self.assertNotIn(alert.id, self.engine.alerts)
+        self.assertEqual(self.engine.webhooks.get_nowait()[1]["source"], "current")
+
+    def test_area_alert_only_for_carparks_within_radius(self):
+        alert = self.engine.add(AlertRequest(lat=self.lat, lng=self.lng, radius=300, above=50, once=False))
+        far = next(cp for cp, info in self.service.carpark_data.items()
+                   if info["coordinates"][0] is not None and abs(info["coordinates"][0] - self.lat) > 0.05)
+        self.engine.on_update("HDB", {far: (100, 0)})
+        self.engine.on_update("HDB", {far: (100, 90)})
+        self.assertEqual(alert.fired, 0)
+        self.engine.on_update("URA", {self.cp: (100, "60")})
+        self.assertEqual(alert.fired, 1)
+
+    def test_ids_are_unguessable(self):
+        ids = [self.engine.add(AlertRequest(carpark_number=self.cp, below=5)).id for _ in range(3)]
+        self.assertEqual(len(set(ids)), 3)
+        self.assertTrue(all(isinstance(alert_id, str) and len(alert_id) >= 16 for alert_id in ids))
+        self.assertFalse(self.engine.remove("1"))
+        self.assertEqual(self.engine.stats()["alerts"], 3)
+
+    def test_alerts_per_client_and_per_target_are_capped(self):
+        engine = AlertEngine(self.service, max_per_client=3, max_per_target=2)
+        first = engine.add(AlertRequest(carpark_number=self.cp, below=5, webhook="http://hooks.example.com/a",
+                                        once=False), "ip:1.2.3.4")
+        engine.add(AlertRequest(carpark_number=self.cp, below=6, webhook="http://HOOKS.example.com/b",
+                                once=False), "ip:5.6.7.8")
+        with self.assertRaises(HTTPException) as e:  # same host, different path and client
+            engine.add(AlertRequest(carpark_number=self.cp, below=7, webhook="http://hooks.example.com/c",
+                                    once=False), "ip:9.9.9.9")
+        self.assertEqual(e.exception.status_code, 429)
+
+        engine.add(AlertRequest(carpark_number=self.cp, below=5), "ip:1.2.3.4")
+        engine.add(AlertRequest(carpark_number=self.cp, below=5), "ip:1.2.3.4")
+        with self.assertRaises(HTTPException) as e:
+            engine.add(AlertRequest(carpark_number=self.cp, below=5), "ip:1.2.3.4")
+        self.assertEqual(e.exception.status_code, 429)
+
+        engine.remove(first.id)  # frees a slot for the client and for the host
+        engine.add(AlertRequest(carpark_number=self.cp, below=7, webhook="http://hooks.example.com/c"), "ip:1.2.3.4")
+        engine.add(AlertRequest(carpark_number=self.cp, above=10), "ip:5.6.7.8")  # fires at once, not kept
+        self.assertEqual(engine.counts, {"client:ip:1.2.3.4": 3, "client:ip:5.6.7.8": 1,
+                                         "webhook:hooks.example.com": 2, **{
+                                             "channel:" + alert.channel: 1 for alert in engine.alerts.values()
+                                             if alert.channel}})
+
+    def test_invalid_requests_are_rejected(self):
+        for request in (AlertRequest(carpark_number=self.cp),
+                        AlertRequest(carpark_number=self.cp, below=5, above=5),
+                        AlertRequest(lat=self.lat, below=5),
+                        AlertRequest(carpark_number=self.cp, below=5, webhook="file:///etc/passwd"),
+                        AlertRequest(carpark_number=self.cp, below=5, webhook="http://x", channel="c" * 16)):
+            with self.assertRaises(HTTPException) as e:
+                self.engine.add(request)
+            self.assertEqual(e.exception.status_code, 400)
+        with self.assertRaises(HTTPException) as e:
+            self.engine.add(AlertRequest(carpark_number="UNKNOWN", below=5))
+        self.assertEqual(e.exception.status_code, 404)
+
+    async def test_channel_alerts_stream_to_listeners(self):
+        alert = self.engine.add(AlertRequest(carpark_number=self.cp, below=20))
+        events = self.engine.stream(alert.channel)
+        await events.__anext__()
+        self.assertEqual(self.engine.stats()["channel_streams"], 1)
+        self.engine.on_update("HDB", {self.cp: (100, 3)})
+        event, body = parse(await events.__anext__())
+        self.assertEqual((event, body["alert_id"], body["available_lots"]), ("alert", alert.id, 3))
+        self.assertEqual(self.engine.stats()["alerts"], 0)  # once
+        await events.aclose()
+        self.assertEqual(self.engine.channels, {})
+
+    async def test_failed_webhook_is_counted(self):
+        senders = self.engine.start(workers=1)
+        with mock.patch("requests.post", side_effect=requests.ConnectionError("refused")) as post:
+            self.engine.add(AlertRequest(carpark_number=self.cp, above=10, webhook="http://93.184.216.34:9/hook"))
+            for _ in range(100):
+                if self.engine.webhook_failed:
+                    break
+                await asyncio.sleep(0.05)
+        senders[0].cancel()
+        self.assertEqual(self.engine.stats()["webhooks_failed"], 1)
+        self.assertFalse(post.call_args.kwargs["allow_redirects"])
+
+    async def test_internal_webhooks_are_rejected(self):
+        for url in ("http://127.0.0.1/hook", "http://10.0.0.5/hook", "http://192.168.1.1/hook",
+                    "http://169.254.169.254/latest/meta-data/", "http://[::1]:8000/", "http://[::ffff:127.0.0.1]/",
+                    "http://0.0.0.0/", "http://100.64.0.1/", "http://224.0.0.1/", "https://localhost/hook"):
+            with self.assertRaises(HTTPException, msg=url) as e:
+                await self.engine.check_webhook_host(url)
+            self.assertEqual(e.exception.status_code, 400)
+        with self.assertRaises(HTTPException):  # IP literals are caught without resolving
+            self.engine.add(AlertRequest(carpark_number=self.cp, below=5, webhook="http://169.254.169.254/"))
+        await self.engine.check_webhook_host("http://93.184.216.34/hook")
+
+        with mock.patch("socket.getaddrinfo", return_value=[(2, 1, 6, "", ("10.1.2.3", 80))]):
+            with self.assertRaises(ValueError):  # a public-looking name pointing inside
+                check_webhook("http://hooks.example.com/x")
+        with self.assertRaises(ValueError):
+            check_webhook("http://93.184.216.34/hook", allowed_hosts=frozenset({"hooks.example.com"}))
+
+    async def test_webhook_is_rechecked_when_sent(self):
+        senders = self.engine.start(workers=1)
+        with mock.patch("socket.getaddrinfo", return_value=[(2, 1, 6, "", ("127.0.0.1", 80))]), \
+                mock.patch("requests.post") as post:
+            self.engine.add(AlertRequest(carpark_number=self.cp, above=10, webhook="http://hooks.example.com/x"))
+            for _ in range(100):
+                if self.engine.webhook_failed:
+                    break
+                await asyncio.sleep(0.05)
+        senders[0].cancel()
+        self.assertEqual(self.engine.webhook_failed, 1)
+        post.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,135 @@
+import unittest
+import json
+import os
+import random
+import tempfile
+
+from fastapi import HTTPException
+
+from availability_aggregates import AvailabilityAggregates, load_planning_areas
+from carpark_service import CarparkService
+
+
+def square(name, min_lat, min_lng, max_lat, max_lng, hole=None, name_in_description=False):
+    rings = [[[min_lng, min_lat], [max_lng, min_lat], [max_lng, max_lat], [min_lng, max_lat], [min_lng, min_lat]]]
+    if hole:
+        h_min_lat, h_min_lng, h_max_lat, h_max_lng = hole
+        rings.append([[h_min_lng, h_min_lat], [h_max_lng, h_min_lat], [h_max_lng, h_max_lat], [h_min_lng, h_max_lat]])
+    properties = ({"Description": f"<table><tr><th>PLN_AREA_N</th> <td>{name}</td></tr></table>"}
+                  if name_in_description else {"PLN_AREA_N": name})
+    return {"type": "Feature", "properties": properties, "geometry": {"type": "Polygon", "coordinates": rings}}
+
+
+CARPARKS = {
+    "A1": {"type": "HDB", "coordinates": [1.301, 103.801], "total_lots": 100, "available_lots": "N/A"},
+    "A2": {"type": "URA", "coordinates": [1.302, 103.802], "total_lots": 50, "available_lots": "N/A"},
+    "B1": {"type": "HDB", "coordinates": [1.351, 103.851], "total_lots": 80, "available_lots": "N/A"},
+    "HOLE": {"type": "HDB", "coordinates": [1.3055, 103.8055], "total_lots": 10, "available_lots": "N/A"},
+    "NOWHERE": {"type": "HDB", "coordinates": [None, None], "total_lots": 10, "available_lots": "N/A"},
+}
+
+
+class TestAvailabilityAggregates(unittest.TestCase):
+    def setUp(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".geojson", delete=False) as f:
+            json.dump({"type": "FeatureCollection", "features": [
+                square("alpha", 1.30, 103.80, 1.31, 103.81, hole=(1.305, 103.805, 1.306, 103.806)),
+                square("BETA", 1.35, 103.85, 1.36, 103.86, name_in_description=True),
+            ]}, f)
+        self.addCleanup(os.remove, f.name)
+        self.areas = load_planning_areas(f.name)
+        self.aggregates = AvailabilityAggregates(CARPARKS, self.areas, cell_sizes=(500, 4000))
+
+    def test_planning_areas_from_geojson(self):
+        self.assertEqual([name for name, _ in self.areas], ["ALPHA", "BETA"])
+        self.assertEqual(load_planning_areas("/nonexistent.geojson"), [])
+        heatmap = self.aggregates.heatmap((1.2, 103.7, 1.4, 103.9), 4000)
+        counts = {area["name"]: area["carparks"] for area in heatmap["areas"]}
+        self.assertEqual(counts, {"ALPHA": 2, "BETA": 1})  # HOLE is in the hole
+
+    def test_polls_update_cells_and_areas(self):
+        self.aggregates.apply("HDB", {"A1": (100, 40), "B1": (80, 10), "A2": (50, 99)})  # A2 is URA's
+        self.aggregates.apply("URA", {"A2": (50, "5")})
+        heatmap = self.aggregates.heatmap((1.2, 103.7, 1.4, 103.9), 4000)
+        self.assertEqual(heatmap["totals"], {"carparks": 4, "reporting": 3, "total_lots": 230, "available_lots": 55})
+        alpha = heatmap["areas"][0]
+        self.assertEqual((alpha["reporting"], alpha["total_lots"], alpha["available_lots"]), (2, 150, 45))
+
+        self.aggregates.apply("HDB", {"A1": (100, "N/A")})
+        heatmap = self.aggregates.heatmap((1.2, 103.7, 1.4, 103.9), 4000)
+        self.assertEqual(heatmap["areas"][0]["available_lots"], 5)
+        self.assertEqual(heatmap["totals"]["reporting"], 2)
+
+    def test_bbox_selects_cells(self):
+        self.aggregates.apply("HDB", {"B1": (80, 10)})
+        heatmap = self.aggregates.heatmap((1.34, 103.84, 1.36, 103.86), 500)
+        self.assertEqual(len(heatmap["cells"]), 1)
+        cell = heatmap["cells"][0]
+        south, west, north, east = cell["bounds"]
+        self.assertTrue(south <= 1.351 <= north and west <= 103.851 <= east)
+        self.assertEqual(cell["available_lots"], 10)
+        self.assertEqual([area["name"] for area in heatmap["areas"]], ["BETA"])
+
+
+class TestHeatmapService(unittest.TestCase):
+    def setUp(self):
+        self.service = CarparkService(None, './data/combined_carpark_data.json')
+        self.service.load_dataset()
+
+    def test_incremental_sums_match_a_full_recount(self):
+        rng = random.Random(3)
+        cps = list(self.service.carpark_data)
+        for _ in range(5):
+            for source, data in (("HDB", self.service.hdb_data), ("URA", self.service.ura_data)):
+                changes = {}
+                for cp in rng.sample(cps, 300):
+                    lots = rng.choice(["N/A", rng.randint(0, 200)])
+                    lots = str(lots) if source == "URA" and lots != "N/A" else lots
+                    changes[cp] = (data[cp].get("total_lots", 0), lots)
+                    data[cp]["available_lots"] = lots
+                self.service._on_availability_update(source, changes)
+
+        heatmap = self.service.heatmap(None, 2000)
+        reporting = available = 0
+        for cp, info in self.service.carpark_data.items():
+            if info["coordinates"][0] is None:
+                continue
+            _, lots = self.service._availability(cp, info["type"])
+            if lots != "N/A":
+                reporting += 1
+                available += int(lots)
+        self.assertEqual(heatmap["totals"]["reporting"], reporting)
+        self.assertEqual(heatmap["totals"]["available_lots"], available)
+        self.assertEqual(heatmap["totals"]["carparks"], sum(cell["carparks"] for cell in heatmap["cells"]))
+
+    def test_bad_parameters(self):
+        for bbox, cell_m in (("1,2,3", 1000), ("a,b,c,d", 1000), ("1.4,103,1.3,104", 1000), (None, 333)):
+            with self.assertRaises(HTTPException) as e:
+                self.service.heatmap(bbox, cell_m)
+            self.assertEqual(e.exception.status_code, 400)
+
+
+class TestHeatmapEndpoint(unittest.TestCase):
+    def test_etag_follows_the_content(self):
+        from fastapi.testclient import TestClient
+        import main
+
+        main.carpark_service.load_dataset()
+        client = TestClient(main.app)
+        first = client.get("/availability/heatmap", params={"cell_m": 2000})
+        etag = first.headers["etag"]
+        # A restarted process or another worker numbers its snapshots differently; same data, same tag
+        main.carpark_service.snapshot_version += 1000
+        self.assertEqual(client.get("/availability/heatmap", params={"cell_m": 2000},
+                                    headers={"If-None-Match": etag}).status_code, 304)
+
+        cp = next(cp for cp, info in main.carpark_service.carpark_data.items() if info["type"] == "HDB")
+        main.carpark_service.hdb_data[cp]["available_lots"] = 7
+        main.carpark_service._on_availability_update("HDB", {cp: (100, 7)})
+        second = client.get("/availability/heatmap", params={"cell_m": 2000}, headers={"If-None-Match": etag})
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second.headers["etag"], etag)
+
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
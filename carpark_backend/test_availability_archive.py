@@ -0,0 +1,170 @@
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from unittest import mock
+
+import numpy as np
+
+import availability_archive
+from availability_archive import AvailabilityArchive
+from availability_history import stored_value
+from carpark_service import CarparkService
+
+DAY1 = datetime(2026, 10, 12, 23, 50).timestamp()
+
+
+def poll(*lots):
+    return np.arange(len(lots), dtype=np.uint32), np.array([stored_value(v) for v in lots], dtype=np.uint16)
+
+
+def rows(archive, start, end):
+    out = []
+    for carparks, polls, t, slot, lots in archive.scan(start, end):
+        out += list(zip(t.tolist(), carparks[slot].tolist(), lots.tolist()))
+    return out
+
+
+class TestAvailabilityArchive(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.archive = AvailabilityArchive(self.dir, ["A", "B", "C"])
+
+    def test_round_trip_across_days_and_flushes(self):
+        self.archive.append(DAY1, *poll(10, 20, "N/A"))
+        self.archive.append(DAY1 + 60, np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint16))  # no changes
+        self.archive.flush()
+        self.archive.append(DAY1 + 900, *poll(11))  # next day: a keyframe, so every carpark
+        self.archive.flush()
+        self.assertEqual(self.archive.stats()["segments_written"], 2)
+        self.assertEqual(sorted(os.listdir(self.dir)), ["2026-10-12", "2026-10-13"])
+
+        everything = rows(self.archive, DAY1 - 1, DAY1 + 1000)
+        self.assertEqual(everything, [(DAY1, "A", 11), (DAY1, "B", 21), (DAY1, "C", 0),
+                                      (DAY1 + 900, "A", 12), (DAY1 + 900, "B", 21), (DAY1 + 900, "C", 0)])
+        self.assertEqual(rows(self.archive, DAY1 + 30, DAY1 + 1000)[0], (DAY1 + 900, "A", 12))
+        polls = [p for block in self.archive.scan(DAY1 - 1, DAY1 + 1000) for p in block[1].tolist()]
+        self.assertEqual(polls, [DAY1, DAY1 + 60, DAY1 + 900])
+
+    def test_compaction_and_retention(self):
+        old = DAY1 - 200 * 86400
+        for t in (old, DAY1, DAY1 + 60, DAY1 + 120):
+            self.archive.append(t, *poll(int(t) % 100, 5))
+            self.archive.flush()
+        other = AvailabilityArchive(self.dir, ["C", "A"])  # a different dataset's carpark table
+        other.append(DAY1 + 180, *poll(7, 8))
+        other.flush()
+        before = rows(self.archive, DAY1 - 1, DAY1 + 500)
+
+        self.archive.compact(today=datetime.fromtimestamp(DAY1).date() + timedelta(days=1))
+        self.assertEqual(os.listdir(self.dir), ["2026-10-12.npz"])
+        self.assertEqual(rows(self.archive, DAY1 - 1, DAY1 + 500), before)
+        self.assertEqual(rows(self.archive, DAY1 + 170, DAY1 + 500), [(DAY1 + 180, "C", 8), (DAY1 + 180, "A", 9)])
+
+    def test_failed_write_is_retried(self):
+        self.archive.append(DAY1, *poll(1, 2))
+        with mock.patch.object(availability_archive, "_write", side_effect=OSError("disk full")):
+            self.archive.flush()
+        self.assertEqual(self.archive.stats()["pending_rows"], 4)  # the first poll is a keyframe: A, B and C
+        self.archive.append(DAY1 + 60, *poll(3))
+        self.archive.flush()
+        self.assertEqual(len(rows(self.archive, DAY1, DAY1 + 60)), 4)
+        self.assertEqual(self.archive.stats()["pending_rows"], 0)
+
+    def test_appends_and_flushes_during_a_flush(self):
+        write = availability_archive._write
+        writing, release = threading.Event(), threading.Event()
+
+        def slow_write(*args):
+            writing.set()
+            release.wait(5)
+            write(*args)
+
+        self.archive.append(DAY1, *poll(1, 2, 3))
+        with mock.patch.object(availability_archive, "_write", side_effect=slow_write):
+            flusher = threading.Thread(target=self.archive.flush)
+            flusher.start()
+            writing.wait(5)
+            # while the segment is being written the event loop keeps appending, and shutdown flushes
+            self.archive.append(DAY1 + 60, *poll(7))
+            second = threading.Thread(target=self.archive.flush)
+            second.start()
+            second.join(0.1)
+            self.assertTrue(second.is_alive())  # waits for the first flush rather than racing it
+            release.set()
+            flusher.join(5)
+            second.join(5)
+        self.assertEqual(self.archive.stats()["pending_rows"], 0)
+        self.assertEqual(self.archive.stats()["rows_written"], 4)
+        self.assertEqual(self.archive.stats()["segments_written"], 2)
+        self.assertEqual(rows(self.archive, DAY1 + 30, DAY1 + 90), [(DAY1 + 60, "A", 8)])
+
+    def test_replay_starts_from_the_last_keyframe(self):
+        for t, lots in ((DAY1, (10, 20, 30)), (DAY1 + 300, (11,)), (DAY1 + 900, (12,))):
+            self.archive.append(t, *poll(*lots))  # the first (after startup) and third (new day) are keyframes
+        self.archive.flush()
+        self.assertEqual(self.archive.keyframe_before(DAY1 + 400), DAY1)
+        self.assertEqual(self.archive.keyframe_before(DAY1 + 900), DAY1 + 900)
+        self.assertIsNone(self.archive.keyframe_before(DAY1 - 1))
+
+        index = {"A": 0, "B": 1, "C": 2}
+        replayed = [(t, columns.tolist(), values.tolist())
+                    for t, columns, values in self.archive.replay(DAY1 + 120, DAY1 + 400, index)]
+        # B and C last changed before the window, but are still there as of its start
+        self.assertEqual(replayed, [(DAY1 + 120, [0, 1, 2], [11, 21, 31]), (DAY1 + 300, [0], [12])])
+
+
+class TestRestoreHistory(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def service(self):
+        service = CarparkService(None, './data/combined_carpark_data.json')
+        service.load_dataset()
+        service.archive = AvailabilityArchive(self.dir, service.history.index)
+        return service
+
+    def test_restart_rebuilds_history_and_forecast(self):
+        first = self.service()
+        cp = next(iter(first.carpark_data))
+        now = datetime.now().timestamp()
+        with mock.patch("time.time", side_effect=[now - 3600 + 300 * i for i in range(12)]):
+            for i in range(12):
+                first._on_availability_update("HDB", {cp: (100, i)} if i % 3 else {})
+        first.archive.flush()
+
+        second = self.service()
+        second.restore_availability(now)
+        self.assertEqual(second.history.history(cp, now - 7200, now), first.history.history(cp, now - 7200, now))
+        np.testing.assert_array_equal(second.forecast.count, first.forecast.count)
+        self.assertFalse(second.history.current.any())  # live counts wait for the first poll
+
+    def test_restart_keeps_carparks_that_did_not_change_in_the_window(self):
+        first = self.service()
+        quiet, busy = list(first.carpark_data)[:2]
+        now = datetime(2026, 10, 19, 12, 0).timestamp()
+        start = now - first.history.slots * first.history.resolution  # noon too: no day keyframe in between
+        # quiet reports just before the replay window and never changes after
+        times = [start - 600] + [start + 300 * i for i in range(1, 13)]
+        with mock.patch("time.time", side_effect=times):
+            first._on_availability_update("HDB", {quiet: (100, 42), busy: (100, 1)})
+            for i in range(12):
+                first._on_availability_update("HDB", {busy: (100, i + 2)})
+        first.archive.flush()
+
+        second = self.service()
+        with mock.patch("carpark_service.FORECAST_WEEKS", 0):  # replay exactly the history window
+            second.restore_availability(now)
+        restored = second.history.history(quiet, start, start + 3600)
+        self.assertEqual(restored[0], (start, 42))  # the state replay starts from, as of the window's start
+        self.assertEqual(restored[1:], first.history.history(quiet, start + 300, start + 3600))
+        self.assertEqual(len(restored), 13)
+        self.assertEqual(second.history.history(busy, start + 300, start + 3600),
+                         first.history.history(busy, start + 300, start + 3600))
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,116 @@
+import unittest
+import math
+import os
+import time
+from datetime import datetime, timedelta
+from unittest import mock
+
+import numpy as np
+
+from availability_forecast import AvailabilityForecast, SUNDAY
+from availability_history import stored_value
+from carpark_service import CarparkService
+from day_calendar import day_type_calendar, SINGAPORE_TZ
+
+WEEK = 7 * 86400
+MONDAY_6PM = datetime(2026, 10, 19, 18, 0, tzinfo=SINGAPORE_TZ).timestamp()
+
+
+def row(*lots):
+    return np.array([stored_value(v) for v in lots], dtype=np.uint16)
+
+
+class TestAvailabilityForecast(unittest.TestCase):
+    def test_profile_is_the_mean_for_that_weekly_slot(self):
+        forecast = AvailabilityForecast(3, sample_seconds=1800)
+        for week, lots in enumerate((10, 20, 30)):
+            forecast.observe(row(lots, "N/A", 5), MONDAY_6PM - week * WEEK)
+        forecast.observe(row(99, 99, 99), MONDAY_6PM + 3600)  # another slot
+
+        # A week ahead, today's deviation has faded: just the profile
+        predicted = forecast.predict(MONDAY_6PM + WEEK, MONDAY_6PM + WEEK - 3 * 86400, row("N/A", "N/A", "N/A"))
+        self.assertAlmostEqual(predicted[0], 20, places=4)
+        self.assertTrue(math.isnan(predicted[1]))  # never reported, no current reading
+        self.assertAlmostEqual(predicted[2], 5, places=4)
+
+    def test_current_deviation_fades_with_lead_time(self):
+        forecast = AvailabilityForecast(1, sample_seconds=1800, decay_hours=2)
+        forecast.observe(row(100), MONDAY_6PM)
+        forecast.observe(row(50), MONDAY_6PM + 3600)
+        now = MONDAY_6PM + WEEK  # running 40 below the usual 100 right now
+        soon = forecast.predict(now + 3600, now, row(60))[0]
+        later = forecast.predict(now + 8 * 3600, now, row(60))[0]
+        self.assertAlmostEqual(soon, 50 - 40 * math.exp(-0.5), places=3)
+        self.assertLess(soon, later)
+        self.assertGreaterEqual(forecast.predict(now + 3600, now, row(0))[0], 0)
+
+    def test_no_profile_falls_back_to_current(self):
+        forecast = AvailabilityForecast(2)
+        predicted = forecast.predict(MONDAY_6PM + 7200, MONDAY_6PM, row(12, "N/A"))
+        self.assertEqual(predicted[0], 12)
+        self.assertTrue(math.isnan(predicted[1]))
+
+    def test_running_mean_forgets_old_weeks(self):
+        forecast = AvailabilityForecast(1, sample_seconds=1800, weeks=2)
+        self.assertEqual(forecast.max_count, 2)
+        for lots in (0, 0, 0, 0, 100, 100, 100, 100):
+            forecast.observe(row(lots), MONDAY_6PM)
+        self.assertGreater(forecast.mean[forecast.slot(MONDAY_6PM)][0], 90)
+
+    def test_public_holidays_use_the_sunday_profile(self):
+        forecast = AvailabilityForecast(1)
+        monday = datetime.fromtimestamp(MONDAY_6PM, SINGAPORE_TZ).date()
+        with mock.patch.object(day_type_calendar, "days", day_type_calendar.days._replace(holidays={monday})):
+            self.assertEqual(forecast.slot(MONDAY_6PM) // forecast.bins_per_day, SUNDAY)
+        self.assertEqual(forecast.slot(MONDAY_6PM) // forecast.bins_per_day, 0)
+
+
+class TestForecastInResults(unittest.TestCase):
+    def setUp(self):
+        self.service = CarparkService(None, './data/combined_carpark_data.json')
+        self.service.load_dataset()
+        self.cp = next(iter(self.service.carpark_data))
+
+    def test_future_start_time_gets_a_forecast(self):
+        self.service._on_availability_update("HDB", {self.cp: (100, 40)})
+        results = [{"carpark_number": self.cp}, {"carpark_number": "UNKNOWN"}]
+        self.service.add_forecasts(results, datetime.now(SINGAPORE_TZ) + timedelta(hours=3))
+        self.assertEqual(results[0]["forecast_available_lots"], 40)  # no profile yet: current count
+        self.assertIsNone(results[1]["forecast_available_lots"])
+
+        near = [{"carpark_number": self.cp}]
+        self.service.add_forecasts(near, datetime.now(SINGAPORE_TZ) + timedelta(minutes=5))
+        self.assertNotIn("forecast_available_lots", near[0])
+
+    def test_forecast_vector_is_shared_until_the_next_poll(self):
+        arrival = datetime.now(SINGAPORE_TZ) + timedelta(hours=2)
+        first = self.service.forecast_all(arrival)
+        self.assertIs(self.service.forecast_all(arrival), first)
+        self.assertEqual(len(first), len(self.service.carpark_data))
+        self.service._on_availability_update("HDB", {self.cp: (100, 1)})
+        self.assertIsNot(self.service.forecast_all(arrival), first)
+
+    def test_naive_times_are_singapore_times_on_a_utc_server(self):
+        with mock.patch.dict(os.environ, {"TZ": "UTC"}):
+            time.tzset()
+            self.addCleanup(time.tzset)
+            self.assertEqual(self.service.forecast.slot(MONDAY_6PM), 18 * 2)  # Monday 18:00 in Singapore
+            # 3 hours ahead on Singapore's clock, which would be 5 hours ago read as UTC
+            arrival = datetime.now(SINGAPORE_TZ).replace(tzinfo=None) + timedelta(hours=3)
+            self.service._on_availability_update("HDB", {self.cp: (100, 40)})
+            results = [{"carpark_number": self.cp}]
+            self.service.add_forecasts(results, arrival)
+            self.assertEqual(results[0]["forecast_available_lots"], 40)
+            self.assertIs(self.service.forecast_all(arrival), self.service.forecast_all(arrival.replace(
+                tzinfo=SINGAPORE_TZ)))
+
+            body = self.service.availability_history(self.cp, datetime(2026, 10, 19, 9, 0), datetime(2026, 10, 19, 10, 0))
+            self.assertEqual(body["from"], datetime(2026, 10, 19, 9, 0, tzinfo=SINGAPORE_TZ))
+            self.assertEqual(body["from"].utcoffset(), timedelta(hours=8))
+            latest = self.service.availability_history(self.cp)["samples"][-1]["time"]
+            self.assertLess(abs(latest - datetime.now(SINGAPORE_TZ)), timedelta(minutes=10))
+            self.assertEqual(latest.utcoffset(), timedelta(hours=8))
+
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
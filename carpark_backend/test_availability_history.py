@@ -0,0 +1,72 @@
+import unittest
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+
+from availability_history import AvailabilityHistory, stored_value, NO_READING
+from carpark_service import CarparkService
+
+DAY = 86400
+
+
+class TestAvailabilityHistory(unittest.TestCase):
+    def test_stored_value_coerces_ura_strings(self):
+        self.assertEqual(stored_value("12"), 13)
+        self.assertEqual(stored_value(0), 1)
+        self.assertEqual(stored_value("N/A"), NO_READING)
+        self.assertEqual(stored_value(None), NO_READING)
+
+    def test_unchanged_carparks_carry_forward_and_gaps_are_skipped(self):
+        history = AvailabilityHistory(["A", "B"], days=1, resolution=300)
+        t0 = 1_000 * DAY
+        history.record({"A": (100, 10), "B": (50, "7")}, t0)
+        history.record({"A": (100, 8)}, t0 + 300)  # B unchanged
+        history.record({}, t0 + 1500)  # no poll for the three buckets in between
+
+        self.assertEqual(history.history("A", t0, t0 + 1500), [(t0, 10), (t0 + 300, 8), (t0 + 1500, 8)])
+        self.assertEqual([lots for _, lots in history.history("B", t0, t0 + 1500)], [7, 7, 7])
+        self.assertEqual(history.history("A", t0 + 600, t0 + 1200), [])
+        with self.assertRaises(KeyError):
+            history.history("C", t0, t0)
+
+    def test_ring_keeps_only_the_last_window(self):
+        history = AvailabilityHistory(["A"], days=1, resolution=3600)
+        t0 = 1_000 * DAY
+        for hour in range(30):
+            history.record({"A": (10, hour)}, t0 + hour * 3600)
+        samples = history.history("A", t0, t0 + 29 * 3600)
+        self.assertEqual(len(samples), 24)
+        self.assertEqual([lots for _, lots in samples], list(range(6, 30)))
+
+    def test_memory_is_fixed_by_carparks_and_window(self):
+        history = AvailabilityHistory((f"CP{i}" for i in range(100_000)), days=7, resolution=300)
+        self.assertEqual(history.slots, 2016)
+        self.assertLess(history.nbytes, 100_000 * 2016 * 2 + 100_000 * 2 + 2016 * 8 + 1)
+
+
+class TestHistoryEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.service = CarparkService(None, './data/combined_carpark_data.json')
+        self.service.load_dataset()
+        self.hdb = next(cp for cp, v in self.service.carpark_data.items() if v["type"] == "HDB")
+
+    def test_polls_feed_history(self):
+        self.service._on_availability_update("HDB", {self.hdb: (200, 42)})
+        self.service._on_availability_update("HDB", {})  # unchanged poll is still a sample
+        body = self.service.availability_history(self.hdb)
+        self.assertEqual(body["carpark_number"], self.hdb)
+        self.assertTrue(body["samples"])
+        self.assertEqual(body["samples"][-1]["available_lots"], 42)
+
+    def test_errors(self):
+        with self.assertRaises(HTTPException) as ctx:
+            self.service.availability_history("NOPE")
+        self.assertEqual(ctx.exception.status_code, 404)
+        now = datetime.now()
+        with self.assertRaises(HTTPException) as ctx:
+            self.service.availability_history(self.hdb, now, now - timedelta(hours=1))
+        self.assertEqual(ctx.exception.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,35 @@
+import unittest
+import tempfile
+
+import benchmark
+import synthetic_data
+from startup import load_HDB_carpark_data, load_URA_carpark_data
+
+
+class TestSyntheticData(unittest.TestCase):
+    def test_generated_files_load_through_startup_loaders(self):
+        hdb_rows, ura_features = synthetic_data.generate(0.05, seed=3)
+        self.assertEqual(synthetic_data.generate(0.05, seed=3), (hdb_rows, ura_features))
+        with tempfile.TemporaryDirectory() as workdir:
+            hdb_path, ura_path = synthetic_data.write_files(hdb_rows, ura_features, workdir)
+            data = load_URA_carpark_data(ura_path, load_HDB_carpark_data(hdb_path, {}))
+
+        self.assertEqual(len(data), len(hdb_rows) + len({f["ppCode"] for f in ura_features}))
+        lat_min, lng_min, lat_max, lng_max = synthetic_data.SG_BBOX
+        for cp in data.values():
+            lat, lng = cp["coordinates"]
+            self.assertTrue(lat_min - 0.05 < lat < lat_max + 0.05 and lng_min - 0.05 < lng < lng_max + 0.05)
+        self.assertTrue(all(cp["rates"] for cp in data.values() if cp["type"] == "URA"))
+
+    def test_run_scale_reports_every_benchmark(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            results = benchmark.run_scale(0.02, queries=20, cost_cases=50, seed=0, workdir=workdir)
+        names = [r["benchmark"] for r in results]
+        self.assertIn("CarparkService.load_dataset", names)
+        self.assertIn("find_nearest_carpark[limit=10]", names)
+        self.assertIn("calc_cost", names)
+        self.assertTrue(all(r["ops"] > 0 and r["p99_ms"] >= r["p50_ms"] for r in results))
+
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -200,6 +200,20 @@ class TestHDBParkingCost(unittest.TestCase):
         cost = calc_cost(self.combined_data["ACB"], start_dt, end_dt)
         self.assertEqual(cost, 13.60)
 
+    # --- Public Holiday Tests (Sunday/PH rates apply) ---
+
+    def test_public_holiday_day_type(self):
+        self.assertEqual(get_day_type(datetime(2025, 12, 25, 12, 0, 0)), "sunday_ph")  # Christmas, Thursday
+        self.assertEqual(get_day_type(datetime(2025, 8, 9, 12, 0, 0)), "sunday_ph")   # National Day, Saturday
+        self.assertEqual(get_day_type(datetime(2025, 12, 24, 12, 0, 0)), "weekday")
+
+    def test_acb_public_holiday_uses_sunday_rates(self):
+        # Christmas 2025 is a Thursday; ACB Sunday/PH 08:00-18:59:59 is 0.80/half-hour (weekday would be 1.40)
+        start_dt = datetime(2025, 12, 25, 12, 0, 0)
+        end_dt = datetime(2025, 12, 25, 12, 30, 0)
+        cost = calc_cost(self.combined_data["ACB"], start_dt, end_dt)
+        self.assertEqual(cost, 0.80)
+
 # This block runs the tests when the script is executed
 if __name__ == '__main__':
     print("Running HDB Parking Cost Tests...")
@@ -96,6 +96,13 @@ class TestURAParkingCost(unittest.TestCase):
         cost = calc_cost(self.combined_data["P0024"], start_dt, end_dt)
         self.assertEqual(cost, 0.0)
 
+    def test_p0024_public_holiday_daytime_free(self):
+        # Christmas 2025 (Thursday) uses sunday_ph rates: 08:30–17:00 is free → $0
+        start_dt = datetime(2025, 12, 25, 10, 0, 0)
+        end_dt   = datetime(2025, 12, 25, 11, 0, 0)
+        cost = calc_cost(self.combined_data["P0024"], start_dt, end_dt)
+        self.assertEqual(cost, 0.0)
+
     # -------------------------
     # P0028 / P0038 – both have paid 08:30–17:00 and 17:00–22:00, free otherwise
     # -------------------------
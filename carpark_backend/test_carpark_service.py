@@ -0,0 +1,220 @@
+import unittest
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+from datetime import date, datetime, timedelta
+from unittest import mock
+
+from fastapi import HTTPException
+
+from calc_rates import calc_cost
+import carpark_service
+from carpark_service import CarparkService
+
+
+class TestFindAlongRoute(unittest.TestCase):
+    def test_find_along_route_prices_and_filters(self):
+        service = CarparkService(None, './data/combined_carpark_data.json')
+        service.load_dataset()
+        route = [(1.3048, 103.8318), (1.2820, 103.8585)]
+        everything = asyncio.run(service.find_along_route(route, 500, 500))
+        self.assertTrue(all("cost_note" in cp for cp in everything))
+
+        start = datetime(2025, 7, 7, 10, 0)
+        some = asyncio.run(service.find_along_route(route, 500, 5, start, start + timedelta(hours=2)))
+        self.assertEqual(len(some), 5)
+        cutoff = max(cp["distance"] for cp in some)
+        self.assertEqual([cp["carpark_number"] for cp in some],
+                         [cp["carpark_number"] for cp in everything if cp["distance"] <= cutoff])
+        for cp in some:
+            self.assertEqual(cp["cost"], calc_cost(service.carpark_data[cp["carpark_number"]], start,
+                                                   start + timedelta(hours=2)))
+
+        cp_number = everything[0]["carpark_number"]
+        if service.carpark_data[cp_number]["type"] == "HDB":
+            service.hdb_data[cp_number]["available_lots"] = 50
+        else:
+            service.ura_data[cp_number]["available_lots"] = "50"  # URA sends lot counts as strings
+        filtered = asyncio.run(service.find_along_route(route, 500, 500, min_available_lots=10))
+        self.assertEqual([cp["carpark_number"] for cp in filtered], [cp_number])
+
+    def test_route_needing_too_many_cells_is_rejected(self):
+        service = CarparkService(None, './data/combined_carpark_data.json')
+        service.load_dataset()
+        zigzag = [(1.30 + (k % 2) * 0.018, 103.85) for k in range(100)]
+        with mock.patch.object(carpark_service, "ROUTE_MAX_CELLS", 1000):
+            with self.assertRaises(HTTPException) as e:
+                asyncio.run(service.find_along_route(zigzag, 2000, 10))
+        self.assertEqual(e.exception.status_code, 400)
+
+
+def ura_carpark(number: str, lat: float, lng: float, rate: str,
+                bands=(("07.00 AM", "10.00 PM", None), ("10.00 PM", "07.00 AM", "$0.00"))) -> dict:
+    """A URA carpark charging per 30 minutes: rate from 7 am to 10 pm every day and free overnight, unless bands given."""
+    rates = []
+    for start, end, band_rate in bands:
+        charge = {"min_duration": "30 mins", "rate": band_rate or rate}
+        rates.append({"veh_cat": "Car", "start_time": start, "end_time": end,
+                      "weekday": charge, "saturday": charge, "sunday_ph": charge})
+    return {"carpark_number": number, "address": number, "coordinates": [lat, lng], "type": "URA", "total_lots": 100,
+            "available_lots": "N/A", "rates": rates}
+
+
+def service_with(directory: str, carparks: list) -> CarparkService:
+    path = os.path.join(directory, "carparks.json")
+    with open(path, "w") as f:
+        json.dump({cp["carpark_number"]: cp for cp in carparks}, f)
+    service = CarparkService(None, path)
+    service.load_dataset()
+    return service
+
+
+class TestSortByCost(unittest.TestCase):
+    LAT, LNG = 1.3000, 103.8000  # about 111 m per 0.001 degree of latitude
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        carparks = [
+            ura_carpark("DEAR", self.LAT + 0.0005, self.LNG, "$1.20"),
+            ura_carpark("CHEAP_FAR", self.LAT + 0.0040, self.LNG, "$0.60"),
+            ura_carpark("CHEAP_NEAR", self.LAT - 0.0010, self.LNG, "$0.60"),
+            ura_carpark("FREE", self.LAT, self.LNG + 0.0030, "$0.00"),
+            ura_carpark("OUTSIDE", self.LAT + 0.0200, self.LNG, "$0.00"),
+        ]
+        self.service = service_with(self.dir, carparks)
+        for cp_number, lots in (("DEAR", "50"), ("CHEAP_FAR", "50"), ("CHEAP_NEAR", "50"), ("FREE", "5"),
+                                ("OUTSIDE", "50")):
+            self.service.ura_data[cp_number]["available_lots"] = lots
+        self.start = datetime(2026, 10, 19, 10, 0)  # a Monday, two hours of day rates
+        self.end = self.start + timedelta(hours=2)
+
+    def search(self, min_available_lots=None, limit=10):
+        return asyncio.run(self.service._find_at(self.LAT, self.LNG, limit, self.start, self.end, "cost", 1000,
+                                                 min_available_lots))
+
+    def test_ranked_by_cost_with_distance_breaking_ties(self):
+        results = self.search()
+        self.assertEqual([(cp["carpark_number"], cp["cost"]) for cp in results],
+                         [("FREE", 0.0), ("CHEAP_NEAR", 2.4), ("CHEAP_FAR", 2.4), ("DEAR", 4.8)])
+        self.assertLess(results[1]["distance"], results[2]["distance"])
+        self.assertLess(results[3]["distance"], results[1]["distance"])  # nearest of all, but dearest
+        self.assertEqual([cp["carpark_number"] for cp in self.search(limit=2)], ["FREE", "CHEAP_NEAR"])
+
+    def test_min_available_lots_is_applied_before_ranking(self):
+        self.assertEqual([cp["carpark_number"] for cp in self.search(min_available_lots=10)],
+                         ["CHEAP_NEAR", "CHEAP_FAR", "DEAR"])
+        with self.assertRaises(HTTPException) as e:
+            self.search(min_available_lots=51)
+        self.assertEqual(e.exception.status_code, 404)
+
+
+class TestBestStartTimes(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        # Dear by day, cheapest in the evening, in between overnight
+        bands = (("12.00 AM", "07.00 AM", "$0.60"), ("07.00 AM", "05.00 PM", "$1.20"), ("05.00 PM", "11.59 PM", "$0.30"))
+        self.service = service_with(self.dir, [ura_carpark("EVENING", 1.3, 103.8, None, bands)])
+        self.day = date(2026, 10, 19)
+
+    def test_cheapest_start_is_chosen(self):
+        body = asyncio.run(self.service.best_start_times("EVENING", self.day, 120, 30))
+        self.assertEqual(len(body["costs"]), 48)
+        for entry in body["costs"]:
+            self.assertEqual(entry["cost"], calc_cost(self.service.carpark_data["EVENING"], entry["start_time"],
+                                                      entry["start_time"] + timedelta(minutes=120)))
+        # 5 pm to 10 pm starts all cost 4 x $0.30; the earliest wins
+        self.assertEqual(body["cheapest"], {"start_time": datetime(2026, 10, 19, 17, 0), "cost": 1.2})
+        self.assertEqual(min(entry["cost"] for entry in body["costs"]), 1.2)
+
+    def test_unknown_carpark(self):
+        with self.assertRaises(HTTPException) as e:
+            asyncio.run(self.service.best_start_times("NOPE", self.day, 120, 30))
+        self.assertEqual(e.exception.status_code, 404)
+
+
+class TestBestStartTimeEndpoint(unittest.TestCase):
+    def setUp(self):
+        from fastapi.testclient import TestClient
+        import main
+
+        main.carpark_service.load_dataset()
+        self.client = TestClient(main.app)
+        self.cp = next(cp for cp, info in main.carpark_service.carpark_data.items() if info["type"] == "HDB")
+
+    def test_endpoint(self):
+        response = self.client.get(f"/carparks/{self.cp}/best-start-time", params={"day": "2026-10-19", "duration": 90})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(len(body["costs"]), 24 * 60 // 15)
+        self.assertEqual(body["cheapest"]["cost"], min(c["cost"] for c in body["costs"] if c["cost"] is not None))
+
+        self.assertEqual(self.client.get("/carparks/NOPE/best-start-time",
+                                         params={"day": "2026-10-19", "duration": 90}).status_code, 404)
+        for params in ({"day": "2026-10-19", "duration": 0}, {"day": "2026-10-19", "duration": 1441},
+                       {"day": "2026-10-19", "duration": 90, "step": 0}, {"day": "19/10/2026", "duration": 90},
+                       {"duration": 90}):
+            self.assertEqual(self.client.get(f"/carparks/{self.cp}/best-start-time", params=params).status_code, 422,
+                             params)
+
+
+class TestFindCarparkStream(unittest.TestCase):
+    def setUp(self):
+        from fastapi.testclient import TestClient
+        import main
+
+        self.service = main.carpark_service
+        self.service.load_dataset()
+        patcher = mock.patch.object(self.service, "find_coord", mock.AsyncMock(return_value=(1.3521, 103.8198)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = TestClient(main.app)
+
+    def events(self, response) -> list:
+        events = []
+        for frame in response.text.split("\n\n")[:-1]:
+            event, data = frame.split("\n")
+            events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+        return events
+
+    def test_carparks_then_costs_then_done(self):
+        start = datetime(2026, 10, 19, 10, 0)
+        params = {"search_query": "bishan", "limit": 4, "start_time": start.isoformat(),
+                  "end_time": (start + timedelta(hours=2)).isoformat()}
+        response = self.client.get("/find-carpark/stream", params=params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/event-stream"))
+        events = self.events(response)
+        self.assertEqual([event for event, _ in events], ["carpark"] * 4 + ["cost"] * 4 + ["done"])
+
+        carparks, costs = [data for _, data in events[:4]], [data for _, data in events[4:8]]
+        expected = asyncio.run(self.service.find_nearest_carpark(1.3521, 103.8198, 4))
+        self.assertEqual([cp["carpark_number"] for cp in carparks], [cp["carpark_number"] for cp in expected])
+        self.assertTrue(all("cost" not in cp for cp in carparks))  # priced afterwards
+        self.assertEqual([cp["carpark_number"] for cp in costs], [cp["carpark_number"] for cp in carparks])
+        for update in costs:
+            self.assertEqual(update["cost"], calc_cost(self.service.carpark_data[update["carpark_number"]], start,
+                                                       start + timedelta(hours=2)))
+        self.assertEqual(events[-1], ("done", {}))
+
+        # The cursor picks up after the last carpark sent
+        page = self.client.get("/find-carpark/stream", params={"cursor": response.headers["x-next-cursor"], "limit": 4})
+        following = [data["carpark_number"] for event, data in self.events(page) if event == "carpark"]
+        expected = asyncio.run(self.service.find_nearest_carpark(1.3521, 103.8198, 8))
+        self.assertEqual(following, [cp["carpark_number"] for cp in expected[4:]])
+
+    def test_no_cost_events_unless_asked_for(self):
+        response = self.client.get("/find-carpark/stream",
+                                   params={"search_query": "bishan", "limit": 3, "fields": "distance"})
+        self.assertEqual([event for event, _ in self.events(response)], ["carpark"] * 3 + ["done"])
+
+        response = self.client.get("/find-carpark/stream", params={"search_query": "bishan", "limit": 3})
+        notes = [data["cost_note"] for event, data in self.events(response) if event == "cost"]
+        self.assertEqual(notes, ["Provide start & end time to estimate cost"] * 3)
+
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
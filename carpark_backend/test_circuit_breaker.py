@@ -0,0 +1,71 @@
+import unittest
+from unittest import mock
+
+from fastapi import HTTPException
+
+import circuit_breaker
+from circuit_breaker import CircuitBreaker, CircuitOpenError, OPEN, HALF_OPEN, CLOSED
+from carpark_service import CarparkService
+
+
+def fail():
+    raise TimeoutError("upstream timed out")
+
+
+class TestCircuitBreaker(unittest.IsolatedAsyncioTestCase):
+    async def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker("test", timeout=1, failure_threshold=2, reset_timeout=60)
+        self.assertEqual(await breaker.call(lambda: "ok"), "ok")
+        for _ in range(2):
+            with self.assertRaises(TimeoutError):
+                await breaker.call(fail)
+        self.assertEqual(breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError) as ctx:
+            await breaker.call(lambda: "ok")
+        self.assertGreater(ctx.exception.retry_after, 0)
+        self.assertEqual(breaker.stats()["short_circuited"], 1)
+
+    async def test_half_open_trial(self):
+        breaker = CircuitBreaker("test", timeout=1, failure_threshold=1, reset_timeout=0)
+        with self.assertRaises(TimeoutError):
+            await breaker.call(fail)
+        # reset_timeout passed: one trial call, which fails and re-opens
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertEqual(await breaker.call(lambda: "ok"), "ok")
+        self.assertEqual(breaker.state, CLOSED)
+
+
+class FakeTokenManager:
+    async def get_token(self):
+        return "token"
+
+
+class TestGeocodeFallback(unittest.IsolatedAsyncioTestCase):
+    async def test_cached_geocode_served_while_onemap_is_down(self):
+        service = CarparkService(FakeTokenManager())
+        breaker = CircuitBreaker("onemap", timeout=1, failure_threshold=1, reset_timeout=60)
+        with mock.patch("carpark_service.onemap_breaker", breaker), \
+                mock.patch.object(circuit_breaker, "_request_json",
+                                  return_value={"results": [{"LATITUDE": "1.28", "LONGITUDE": "103.85"}]}):
+            self.assertEqual(await service.find_coord("Raffles Place"), (1.28, 103.85))
+
+        with mock.patch("carpark_service.onemap_breaker", breaker), \
+                mock.patch.object(circuit_breaker, "_request_json", side_effect=TimeoutError()):
+            with self.assertRaises(HTTPException) as ctx:
+                await service.find_coord("Bugis")
+            self.assertEqual(ctx.exception.status_code, 500)
+            self.assertEqual(breaker.state, OPEN)
+
+            self.assertEqual(await service.find_coord("  raffles   PLACE "), (1.28, 103.85))
+            with self.assertRaises(HTTPException) as ctx:
+                await service.find_coord("Bugis")
+            self.assertEqual(ctx.exception.status_code, 503)
+            self.assertIn("Retry-After", ctx.exception.headers)
+
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,61 @@
+import unittest
+import contextvars
+import json
+from datetime import datetime
+from unittest import mock
+
+import requests
+
+import circuit_breaker
+from circuit_breaker import CircuitBreaker, fetch_json, CLOSED
+from deadline import Deadline, DeadlineExceeded, start_deadline, time_left, _current
+from carpark_service import CarparkService, DEADLINE_COST_NOTE
+
+
+class TestDeadline(unittest.TestCase):
+    def test_header_parsing(self):
+        ctx = contextvars.copy_context()
+        self.assertAlmostEqual(ctx.run(start_deadline, "250").remaining(), 0.25, places=2)
+        self.assertGreater(ctx.run(start_deadline, "nonsense").remaining(), 1)
+        self.assertLessEqual(ctx.run(start_deadline, "999999999").remaining(), 30)
+
+    def test_time_left(self):
+        ctx = contextvars.copy_context()
+        self.assertEqual(ctx.run(time_left, 3.0), 3.0)  # no deadline
+        ctx.run(_current.set, Deadline(0.5))
+        self.assertLessEqual(ctx.run(time_left, 3.0), 0.5)
+        ctx.run(_current.set, Deadline(0))
+        with self.assertRaises(DeadlineExceeded):
+            ctx.run(time_left, 3.0)
+
+
+class TestDeadlinePropagation(unittest.IsolatedAsyncioTestCase):
+    async def test_running_out_of_budget_does_not_trip_the_breaker(self):
+        breaker = CircuitBreaker("test", timeout=10, failure_threshold=1)
+        _current.set(Deadline(0.2))
+
+        def slow(method, url, timeout, **kwargs):
+            self.assertLessEqual(timeout, 0.2)
+            raise requests.exceptions.Timeout()
+
+        with mock.patch.object(circuit_breaker.requests, "request", side_effect=slow):
+            with self.assertRaises(DeadlineExceeded):
+                await fetch_json(breaker, "http://upstream")
+        self.assertEqual(breaker.state, CLOSED)
+
+    async def test_expired_budget_returns_nearest_without_costs(self):
+        service = CarparkService(None)
+        with open('./data/combined_carpark_data.json', 'r') as f:
+            service.carpark_data = json.load(f)
+        service.spatial_index = service.spatial_index.from_carparks(service.carpark_data)
+        deadline = Deadline(0)
+        _current.set(deadline)
+        results = await service._find_at(1.2836, 103.8511, 5, datetime(2025, 7, 7, 10), datetime(2025, 7, 7, 12),
+                                         "cost", 1000, None)
+        self.assertTrue(deadline.partial)
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(r["cost_note"] == DEADLINE_COST_NOTE and "cost" not in r for r in results))
+
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
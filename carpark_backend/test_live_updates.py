@@ -0,0 +1,82 @@
+import unittest
+import asyncio
+
+import orjson
+from fastapi import HTTPException
+
+from live_updates import LiveHub
+from carpark_service import CarparkService
+
+
+def parse(frame: bytes) -> tuple:
+    event, data = frame.decode().strip().split("\n")
+    return event[len("event: "):], orjson.loads(data[len("data: "):])
+
+
+class TestLiveHub(unittest.IsolatedAsyncioTestCase):
+    async def test_updates_reach_only_watchers_of_changed_carparks(self):
+        hub = LiveHub()
+        a = hub.subscribe(["A", "B"])
+        b = hub.subscribe(["B", "C"])
+        hub.publish("HDB", {"A": (100, 5), "Z": (10, 1)})
+        self.assertEqual(a.queue.qsize(), 1)
+        self.assertEqual(b.queue.qsize(), 0)
+
+        hub.publish("URA", {"B": (0, "7"), "C": (20, 3)})
+        event, body = parse(b.queue.get_nowait())
+        self.assertEqual(event, "update")
+        self.assertEqual(body["source"], "URA")
+        self.assertEqual({c["carpark_number"] for c in body["changes"]}, {"B", "C"})
+
+        hub.unsubscribe(a)
+        self.assertEqual(set(hub.watchers), {"B", "C"})
+        self.assertEqual(hub.stats()["subscriptions"], 1)
+
+    async def test_stream_sends_snapshot_then_updates_and_unsubscribes(self):
+        hub = LiveHub()
+        events = hub.stream(["A"], lambda cps: [{"carpark_number": cp, "available_lots": 1} for cp in cps],
+                            heartbeat=0.05)
+        self.assertEqual(parse(await events.__anext__())[0], "snapshot")
+        self.assertEqual(hub.stats()["subscriptions"], 1)
+        self.assertEqual(await events.__anext__(), b": keepalive\n\n")
+        hub.publish("HDB", {"A": (100, 4)})
+        event, body = parse(await events.__anext__())
+        self.assertEqual(body["changes"][0]["available_lots"], 4)
+        await events.aclose()
+        self.assertEqual(hub.stats()["subscriptions"], 0)
+        self.assertEqual(hub.watchers, {})
+
+    async def test_slow_client_is_dropped(self):
+        hub = LiveHub()
+        events = hub.stream(["A"], lambda cps: [])
+        await events.__anext__()
+        subscription = next(iter(hub.subscriptions))
+        for i in range(subscription.queue.maxsize + 1):
+            hub.publish("HDB", {"A": (100, i)})
+        self.assertEqual(hub.stats()["dropped_slow_clients"], 1)
+        self.assertEqual(parse(await events.__anext__())[0], "overflow")
+        with self.assertRaises(StopAsyncIteration):
+            await events.__anext__()
+
+
+class TestWatchSet(unittest.TestCase):
+    def setUp(self):
+        self.service = CarparkService(None, './data/combined_carpark_data.json')
+        self.service.load_dataset()
+
+    def test_ids_and_area(self):
+        cp = next(iter(self.service.carpark_data))
+        self.assertEqual(self.service.watch_set(f"{cp}, NOPE", None, None, 1000, 10), [cp])
+        lat, lng = self.service.carpark_data[cp]["coordinates"]
+        area = self.service.watch_set(None, lat, lng, 500, 1000)
+        self.assertIn(cp, area)
+        with self.assertRaises(HTTPException) as ctx:
+            self.service.watch_set(None, lat, lng, 5000, 5)
+        self.assertEqual(ctx.exception.status_code, 400)
+        with self.assertRaises(HTTPException) as ctx:
+            self.service.watch_set("NOPE", None, None, 1000, 10)
+        self.assertEqual(ctx.exception.status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,29 @@
+import unittest
+
+from prometheus_client import CollectorRegistry, generate_latest
+
+from admission import AdmissionController
+from carpark_service import CarparkService
+from circuit_breaker import CircuitBreaker
+from metrics import ServiceCollector
+
+
+class TestServiceCollector(unittest.TestCase):
+    def test_exports_service_counters(self):
+        service = CarparkService(None)
+        service.result_cache.hits, service.result_cache.misses = 3, 1
+        service.availability_updated["HDB"] = 0  # a very old poll
+        breaker = CircuitBreaker("onemap", timeout=1)
+        breaker.errors = 2
+        registry = CollectorRegistry()
+        registry.register(ServiceCollector(service, AdmissionController(), [breaker]))
+
+        text = generate_latest(registry).decode()
+        self.assertIn('carpark_cache_hits_total{cache="result"} 3.0', text)
+        self.assertIn('carpark_upstream_errors_total{upstream="onemap"} 2.0', text)
+        self.assertIn('carpark_availability_age_seconds{source="HDB"}', text)
+        self.assertNotIn('source="URA"', text)  # never polled
+
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,73 @@
+import unittest
+import random
+
+from fastapi.testclient import TestClient
+
+import loadgen
+import mock_upstreams
+from mock_upstreams import UpstreamProfile
+
+DATASET = './data/combined_carpark_data.json'
+
+
+class TestMockUpstreams(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(mock_upstreams.create_app(DATASET, hdb_size=3000, ura_size=10, search_results=3))
+
+    def test_onemap_token_and_search(self):
+        token = self.client.post("/api/auth/post/getToken", json={"email": "a", "password": "b"}).json()
+        self.assertEqual(token["access_token"], mock_upstreams.MOCK_TOKEN)
+        self.assertGreater(int(token["expiry_timestamp"]), 0)
+
+        first = self.client.get("/api/common/elastic/search", params={"searchVal": "520123"}).json()
+        again = self.client.get("/api/common/elastic/search", params={"searchVal": "520123"}).json()
+        self.assertEqual(first, again)
+        self.assertEqual(len(first["results"]), 3)
+        lat, lng = float(first["results"][0]["LATITUDE"]), float(first["results"][0]["LONGITUDE"])
+        self.assertTrue(1.1 < lat < 1.6 and 103.5 < lng < 104.2)
+        self.assertEqual(self.client.get("/api/common/elastic/search",
+                                         params={"searchVal": "notfound"}).json()["results"], [])
+
+    def test_availability_feeds_match_upstream_shapes_and_sizes(self):
+        hdb = self.client.get("/v1/transport/carpark-availability").json()
+        carparks = hdb["items"][0]["carpark_data"]
+        self.assertEqual(len(carparks), 3000)
+        info = carparks[0]["carpark_info"][0]
+        self.assertLessEqual(int(info["lots_available"]), int(info["total_lots"]))
+
+        self.assertEqual(self.client.get("/uraDataService/insertNewToken/v1",
+                                         headers={"AccessKey": "k"}).json()["Result"], mock_upstreams.MOCK_TOKEN)
+        ura = self.client.get("/uraDataService/invokeUraDS/v1", params={"service": "Car_Park_Availability"},
+                              headers={"AccessKey": "k", "Token": mock_upstreams.MOCK_TOKEN}).json()
+        self.assertEqual(ura["Status"], "Success")
+        self.assertEqual(len(ura["Result"]), 10)
+
+    def test_error_rate_and_stats(self):
+        profiles = {"datagov": UpstreamProfile(error_rate=1.0, error_status=502)}
+        client = TestClient(mock_upstreams.create_app(DATASET, profiles))
+        self.assertEqual(client.get("/v1/transport/carpark-availability").status_code, 502)
+        self.assertEqual(client.get("/api/common/elastic/search", params={"searchVal": "x"}).status_code, 200)
+        stats = client.get("/mock/stats").json()
+        self.assertEqual((stats["datagov"]["requests"], stats["datagov"]["errors"]), (1, 1))
+        self.assertEqual(stats["onemap"]["errors"], 0)
+
+
+class TestLoadgen(unittest.TestCase):
+    def test_summarize_percentiles_and_statuses(self):
+        samples = [(200, i / 1000) for i in range(1, 101)] + [(503, 0.5), (0, 1.0)]
+        summary = loadgen.summarize(4, 2.0, samples)
+        self.assertEqual((summary["requests"], summary["ok"]), (102, 100))
+        self.assertEqual(summary["statuses"], {"0": 1, "200": 100, "503": 1})
+        self.assertAlmostEqual(summary["throughput_rps"], 51)
+        self.assertEqual(summary["max_ms"], 1000)
+        self.assertLessEqual(summary["p50_ms"], summary["p90_ms"])
+        self.assertLessEqual(summary["p90_ms"], summary["p99_ms"])
+
+    def test_cost_requests_have_a_window(self):
+        rng = random.Random(1)
+        params = [loadgen.make_params(rng, ["123456"], 1.0, 10) for _ in range(20)]
+        self.assertTrue(all(p["sort"] == "cost" and p["end_time"] > p["start_time"] for p in params))
+
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,116 @@
+import unittest
+import asyncio
+import time
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from multiprocessing import shared_memory
+from unittest import mock
+
+import pricing_pool
+from pricing_pool import PricingPool, rank_by_cost
+from carpark_service import CarparkService
+
+DATA_FILE = './data/combined_carpark_data.json'
+
+
+class TestPricingPool(unittest.IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.service = CarparkService(None, DATA_FILE)
+        cls.service.load_dataset()
+        cls.pool = PricingPool(DATA_FILE, cls.service.carpark_data, workers=1, threshold=1)
+        cls.pool.executor.submit(len, ()).result(60)  # wait for the worker to load the dataset
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.shutdown()
+
+    def setUp(self):
+        located = [cp for cp, info in self.service.carpark_data.items() if info["coordinates"][0] is not None]
+        self.cp_numbers = located[:3000]
+        self.distances = [float(i % 977) for i in range(len(self.cp_numbers))]
+        self.start, self.end = datetime(2026, 10, 19, 9, 0), datetime(2026, 10, 19, 18, 30)
+        self.segments = []
+        real = shared_memory.SharedMemory
+
+        def tracked(*args, **kwargs):
+            self.segments.append(real(*args, **kwargs))
+            return self.segments[-1]
+
+        patcher = mock.patch.object(pricing_pool.shared_memory, "SharedMemory", side_effect=tracked)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assertReleased(self, segment):
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=segment.name)
+
+    async def test_worker_ranking_matches_inline(self):
+        inline = rank_by_cost(self.service.tariffs, self.cp_numbers, self.distances, self.start, self.end, 50)
+        pooled = await self.pool.rank_by_cost(self.cp_numbers, self.distances, self.start, self.end, 50)
+        self.assertEqual(pooled, inline)
+        self.assertEqual(len(pooled), 50)
+        self.assertEqual(len(self.segments), 1)
+        self.assertReleased(self.segments[0])
+
+    async def abandon(self):
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(
+                self.pool.rank_by_cost(self.cp_numbers, self.distances, self.start, self.end, 10), 0.05)
+        return self.segments[-1]
+
+    async def test_abandoned_job_is_cancelled_or_released_when_done(self):
+        # The worker is busy and the executor's call queue (workers + 1) is full: the job is still pending
+        busy = [self.pool.executor.submit(time.sleep, 0.3) for _ in range(3)]
+        self.assertReleased(await self.abandon())
+        for job in busy:
+            job.result(5)
+
+        # Handed to the executor already: it can't be cancelled, so its inputs stay until it's done
+        busy = self.pool.executor.submit(time.sleep, 0.3)
+        segment = await self.abandon()
+        shared_memory.SharedMemory(name=segment.name).close()
+        busy.result(5)
+        for _ in range(100):
+            try:
+                shared_memory.SharedMemory(name=segment.name).close()
+            except FileNotFoundError:
+                break
+            await asyncio.sleep(0.05)
+        self.assertReleased(segment)
+
+        pooled = await self.pool.rank_by_cost(self.cp_numbers, self.distances, self.start, self.end, 10)
+        self.assertEqual(len(pooled), 10)  # the worker is still usable
+
+    def test_job_whose_inputs_are_gone_is_skipped(self):
+        pricing_pool._worker_codes = list(self.service.carpark_data)
+        self.assertIsNone(pricing_pool._rank_job("psm_no_such_segment", 1, self.start, self.end, 5))
+
+
+class TestPoolStartup(unittest.TestCase):
+    def test_pool_is_not_started_when_no_search_reaches_the_threshold(self):
+        service = CarparkService(None, DATA_FILE)
+        service.load_dataset()
+        pool = PricingPool(DATA_FILE, service.carpark_data, workers=1, threshold=2000, max_candidates=1352)
+        self.assertIsNone(pool.executor)
+        self.assertFalse(pool.should_offload(5000))
+        pool.shutdown()
+
+
+class TestPoolFallback(unittest.IsolatedAsyncioTestCase):
+    async def test_broken_pool_falls_back_to_inline(self):
+        service = CarparkService(None, DATA_FILE)
+        service.load_dataset()
+        start, end = datetime(2026, 10, 19, 9, 0), datetime(2026, 10, 19, 18, 30)
+        expected = await service.find_cheapest_carpark(1.3521, 103.8198, 10, start, end, 3000)
+
+        service.pricing_pool = mock.Mock()
+        service.pricing_pool.should_offload.return_value = True
+        service.pricing_pool.rank_by_cost = mock.AsyncMock(side_effect=BrokenProcessPool("worker died"))
+        fallback = await service.find_cheapest_carpark(1.3521, 103.8198, 10, start, end, 3000)
+        self.assertEqual(fallback, expected)
+        service.pricing_pool.rank_by_cost.assert_awaited_once()
+
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,95 @@
+import unittest
+import threading
+import time
+from datetime import datetime
+from unittest import mock
+
+from fastapi import HTTPException
+from starlette.requests import Request
+
+import profiling
+from profiling import SamplingProfiler, profile_request, stage, current_profile
+from carpark_service import CarparkService
+
+
+def make_request(key=None, query=b""):
+    headers = [(b"x-profile-key", key.encode())] if key else []
+    return Request({"type": "http", "method": "GET", "path": "/find-carpark", "headers": headers,
+                    "query_string": query})
+
+
+def busy_work(seconds):
+    end = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < end:
+        total += sum(range(100))
+    return total
+
+
+class TestProfiling(unittest.TestCase):
+    def test_stage_only_records_inside_a_profile(self):
+        with stage("nothing"):
+            pass  # no profile: no-op
+        with mock.patch.object(profiling, "PROFILE_KEY", "k"):
+            with profile_request(make_request("k"), "find_carpark") as profile:
+                with stage("calc_cost", carpark_number="A1"):
+                    pass
+                with stage("calc_cost", carpark_number="B2"):
+                    pass
+        self.assertIsNone(current_profile())
+        self.assertEqual([s["carpark_number"] for s in profile.stages], ["A1", "B2"])
+        self.assertIn('calc_cost;dur=', profile.server_timing())
+        self.assertIn('desc="2 calls"', profile.server_timing())
+        self.assertEqual(profiling.get_report(profile.id)["stage_totals"]["calc_cost"]["calls"], 2)
+
+    def test_key_checks(self):
+        with profile_request(make_request(), "find_carpark") as profile:
+            self.assertIsNone(profile)
+        with mock.patch.object(profiling, "PROFILE_KEY", None):  # disabled: any key is refused
+            with self.assertRaises(HTTPException) as ctx:
+                with profile_request(make_request("k"), "find_carpark"):
+                    pass
+            self.assertEqual(ctx.exception.status_code, 403)
+        with mock.patch.object(profiling, "PROFILE_KEY", "k"):
+            with self.assertRaises(HTTPException):
+                with profile_request(make_request(query=b"profile_key=wrong"), "find_carpark"):
+                    pass
+            with profile_request(make_request(query=b"profile_key=k&limit=5"), "find_carpark") as profile:
+                self.assertEqual(profile.params, {"limit": "5"})
+
+    def test_sampler_finds_the_busy_function(self):
+        sampler = SamplingProfiler(threading.get_ident(), interval=0.001)
+        sampler.start()
+        busy_work(0.2)
+        sampler.stop()
+        report = sampler.report()
+        self.assertGreater(report["samples"], 10)
+        hottest = max(report["functions"], key=lambda f: f["self_ms"])
+        self.assertTrue(hottest["function"].startswith("busy_work"))
+        self.assertTrue(any("busy_work" in stack for stack in report["stacks"]))
+
+
+class TestProfiledSearch(unittest.IsolatedAsyncioTestCase):
+    async def test_profiled_search_times_each_stage_and_skips_the_cache(self):
+        service = CarparkService(None, './data/combined_carpark_data.json')
+        service.load_dataset()
+        service.find_coord = mock.AsyncMock(return_value=(1.3521, 103.8198))
+        start, end = datetime(2026, 10, 20, 9), datetime(2026, 10, 20, 18)
+
+        with mock.patch.object(profiling, "PROFILE_KEY", "k"):
+            with profile_request(make_request("k"), "find_carpark") as profile:
+                await service.find_carpark_cached("x", 5, start, end)
+
+        totals = profile.totals()
+        self.assertEqual(list(totals)[:2], ["find_coord", "find_nearest_carpark"])
+        self.assertEqual(totals["calc_cost"][1], 5)
+        self.assertIn("serialization", totals)
+        self.assertEqual(profile.context["search_point"], [1.3521, 103.8198])
+        self.assertEqual(len(service.result_cache.entries), 0)
+
+        await service.find_carpark_cached("x", 5, start, end)  # unprofiled: cached as usual
+        self.assertEqual(len(service.result_cache.entries), 1)
+
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,82 @@
+import unittest
+from datetime import datetime, date, timedelta
+import json
+
+from calc_rates import calc_cost
+from rate_engine import compile_tariff, compile_tariffs, bulk_cost
+import random
+import rate_engine_harness as harness
+
+
+class TestCompiledTariffs(unittest.TestCase):
+    def setUp(self):
+        with open('./data/combined_carpark_data.json', 'r') as f:
+            self.combined_data = json.load(f)
+
+    def assertSameAsReference(self, cp, start_dt, end_dt):
+        carpark = self.combined_data[cp]
+        self.assertEqual(compile_tariff(carpark).cost(start_dt, end_dt), calc_cost(carpark, start_dt, end_dt))
+
+    def test_hdb_special_cross_segments(self):
+        for cp in ["ACB", "HG16", "BBB"]:
+            self.assertSameAsReference(cp, datetime(2025, 7, 7, 9, 30), datetime(2025, 7, 7, 20, 15))
+            self.assertSameAsReference(cp, datetime(2025, 7, 5, 22, 0), datetime(2025, 7, 6, 9, 0))
+
+    def test_hdb_standard_and_grace_period(self):
+        self.assertSameAsReference("Y79M", datetime(2025, 7, 7, 10, 0), datetime(2025, 7, 7, 10, 15))
+        self.assertSameAsReference("Y79M", datetime(2025, 7, 7, 10, 0, 30), datetime(2025, 7, 7, 12, 0, 1))
+
+    def test_ura_blocks_and_overnight(self):
+        for cp in ["P0023", "P0024", "A0007"]:
+            self.assertSameAsReference(cp, datetime(2025, 7, 7, 8, 15), datetime(2025, 7, 7, 9, 15))
+            self.assertSameAsReference(cp, datetime(2025, 7, 7, 16, 45), datetime(2025, 7, 8, 7, 15))
+
+    def test_identical_tariffs_are_shared(self):
+        tariffs = compile_tariffs(self.combined_data)
+        self.assertIs(tariffs["Y79M"], tariffs["KAML"])  # both on the default HDB rate
+        self.assertLess(len({id(t) for t in tariffs.values()}), len(tariffs))
+
+    def test_bulk_cost_matches_reference(self):
+        tariffs = compile_tariffs(self.combined_data)
+        start_dt, end_dt = datetime(2025, 7, 7, 10, 0), datetime(2025, 7, 7, 13, 0)
+        costs = bulk_cost(tariffs, list(self.combined_data), start_dt, end_dt)
+        for cp, cost in costs.items():
+            try:
+                expected = calc_cost(self.combined_data[cp], start_dt, end_dt)
+            except Exception:
+                self.assertIsInstance(cost, Exception)
+                continue
+            self.assertEqual(cost, expected, cp)
+
+    def test_sweep_matches_reference_for_every_start(self):
+        day = date(2025, 7, 5)
+        for cp in ["ACB", "BBB", "Y79M", "P0023", "A0007"]:
+            tariff = compile_tariff(self.combined_data[cp])
+            for duration in [10, 16, 135, 1440]:
+                for start_min, cost in tariff.sweep(day, duration, 5):
+                    start_dt = datetime(day.year, day.month, day.day) + timedelta(minutes=start_min)
+                    end_dt = start_dt + timedelta(minutes=duration)
+                    self.assertEqual(cost, calc_cost(self.combined_data[cp], start_dt, end_dt), (cp, start_dt, duration))
+
+
+class TestDifferentialHarness(unittest.TestCase):
+    # Small version of `python rate_engine_harness.py`; run that for the full check and throughput numbers
+
+    def test_random_carparks_match_reference(self):
+        for seed in range(3):
+            carparks, specials = harness.random_carparks(random.Random(seed), 100)
+            self.assertEqual(harness.check_engines(carparks, 500, seed, 10, specials), [])
+
+    def test_real_carparks_match_reference(self):
+        with open('./data/combined_carpark_data.json', 'r') as f:
+            combined_data = json.load(f)
+        self.assertEqual(harness.check_engines(combined_data, 500, 0, 10), [])
+
+    def test_random_specials_are_unregistered(self):
+        carparks, specials = harness.random_carparks(random.Random(0), 100)
+        harness.check_engines(carparks, 10, 0, 1, specials)
+        self.assertFalse(set(specials) & set(harness.special_rates_HDB))
+
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,61 @@
+import unittest
+import json
+
+from response_encoder import CarparkEncoder, parse_fields, sse_event
+
+
+class TestCarparkEncoder(unittest.TestCase):
+    def setUp(self):
+        with open('./data/combined_carpark_data.json', 'r') as f:
+            self.combined_data = json.load(f)
+        self.encoder = CarparkEncoder(self.combined_data)
+
+    def test_matches_full_dict_encoding(self):
+        results = [
+            {"carpark_number": "HLM", "total_lots": 500, "available_lots": 123, "distance": 145.23, "cost": 1.2},
+            {"carpark_number": "P0023", "total_lots": 11, "available_lots": "N/A", "distance": 301.5,
+             "cost_note": "Provide start & end time to estimate cost"},
+        ]
+        expected = [{**self.combined_data[r["carpark_number"]], **r} for r in results]
+        self.assertEqual(json.loads(self.encoder.encode(results)), expected)
+
+    def test_static_snapshot_lots_are_not_baked_in(self):
+        encoded = json.loads(self.encoder.encode([{"carpark_number": "HLM"}]))
+        self.assertNotIn("available_lots", encoded[0])
+        self.assertEqual(encoded[0]["address"], self.combined_data["HLM"]["address"])
+
+    def test_unknown_carpark_and_empty_list(self):
+        self.assertEqual(json.loads(self.encoder.encode([{"carpark_number": "NOPE", "distance": 1.0}])),
+                         [{"carpark_number": "NOPE", "distance": 1.0}])
+        self.assertEqual(self.encoder.encode([]), b"[]")
+
+    def test_field_projection(self):
+        fields = parse_fields("distance,available_lots")
+        self.assertEqual(fields, ("carpark_number", "available_lots", "distance"))
+        results = [
+            {"carpark_number": "P0023", "total_lots": 11, "available_lots": 4, "distance": 301.5,
+             "cost_note": "Provide start & end time to estimate cost"},
+            {"carpark_number": "NOPE", "available_lots": 1, "cost": 2.0},
+        ]
+        self.assertEqual(json.loads(self.encoder.encode(results, fields)), [
+            {"carpark_number": "P0023", "available_lots": 4, "distance": 301.5},
+            {"carpark_number": "NOPE", "available_lots": 1},
+        ])
+        # the full encoding is unaffected by an earlier projection
+        self.assertIn("rates", json.loads(self.encoder.encode(results[:1]))[0])
+
+    def test_parse_fields(self):
+        self.assertIsNone(parse_fields(None))
+        self.assertIsNone(parse_fields(""))
+        self.assertEqual(parse_fields(" cost , address"), ("carpark_number", "address", "cost"))
+        with self.assertRaises(ValueError):
+            parse_fields("distance,price")
+
+    def test_stream_update_frames(self):
+        update = {"carpark_number": "HLM", "cost": 1.2, "cost_note": None}
+        frame = sse_event("cost", self.encoder.encode_update(update, parse_fields("cost")))
+        self.assertEqual(frame, b'event: cost\ndata: {"carpark_number":"HLM","cost":1.2}\n\n')
+
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,66 @@
+import unittest
+import json
+from datetime import datetime, timezone, timedelta
+from unittest import mock
+
+from result_cache import ResultCache, CachedResult, quantize_location, time_key, etag_matches
+from carpark_service import CarparkService
+
+
+class TestResultCache(unittest.TestCase):
+    def test_nearby_points_share_a_cell(self):
+        # ~10 m apart vs ~200 m apart
+        self.assertEqual(quantize_location(1.28360, 103.85110), quantize_location(1.28369, 103.85110))
+        self.assertNotEqual(quantize_location(1.28360, 103.85110), quantize_location(1.28540, 103.85110))
+
+    def test_times_are_keyed_exactly(self):
+        self.assertNotEqual(time_key(datetime(2025, 7, 7, 10, 5)), time_key(datetime(2025, 7, 7, 10, 6)))
+        self.assertNotEqual(time_key(datetime(2025, 7, 7, 10, 5)), time_key(datetime(2025, 7, 7, 10, 5, 30)))
+        aware = datetime(2025, 7, 7, 10, 5, tzinfo=timezone(timedelta(hours=8)))
+        self.assertEqual(time_key(aware), time_key(datetime(2025, 7, 7, 10, 5)))
+        self.assertIsNone(time_key(None))
+
+    def test_new_snapshot_version_invalidates(self):
+        cache = ResultCache(max_entries=10, ttl=60)
+        cache.put("k", CachedResult(b"[]", version=1))
+        self.assertIsNotNone(cache.get("k", 1))
+        self.assertIsNone(cache.get("k", 2))
+        self.assertIsNone(cache.get("k", 1))  # dropped once stale
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_lru_eviction(self):
+        cache = ResultCache(max_entries=2, ttl=60)
+        for key in ("a", "b"):
+            cache.put(key, CachedResult(key.encode(), version=0))
+        cache.get("a", 0)
+        cache.put("c", CachedResult(b"c", version=0))
+        self.assertIsNone(cache.get("b", 0))
+        self.assertIsNotNone(cache.get("a", 0))
+
+    def test_etag_matching(self):
+        etag = CachedResult(b"[1]", version=0).etag
+        self.assertEqual(etag, CachedResult(b"[1]", version=5).etag)
+        self.assertTrue(etag_matches(etag, etag))
+        self.assertTrue(etag_matches(f'"other", W/{etag}', etag))
+        self.assertTrue(etag_matches("*", etag))
+        self.assertFalse(etag_matches('"other"', etag))
+        self.assertFalse(etag_matches(None, etag))
+
+
+class TestCachedSearch(unittest.IsolatedAsyncioTestCase):
+    async def test_windows_in_one_billing_block_are_priced_separately(self):
+        service = CarparkService(None, './data/combined_carpark_data.json')
+        service.load_dataset()
+        service.find_coord = mock.AsyncMock(return_value=tuple(service.carpark_data["BE18"]["coordinates"]))
+        start = datetime(2025, 7, 7, 10, 0)
+
+        costs = []
+        for minutes in (10, 29, 10):
+            entry = await service.find_carpark_cached("x", 5, start, start + timedelta(minutes=minutes))
+            costs.append({cp["carpark_number"]: cp["cost"] for cp in json.loads(entry.body)}["BE18"])
+        self.assertEqual(costs, [0.0, 0.58, 0.0])  # 10 minutes is within the grace period
+        self.assertEqual((service.result_cache.hits, len(service.result_cache.entries)), (1, 2))
+
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,28 @@
+import unittest
+import asyncio
+
+from fastapi import HTTPException
+
+from search_cursor import encode_cursor, decode_cursor
+from carpark_service import CarparkService
+
+
+class TestSearchCursor(unittest.TestCase):
+    def test_decode_cursor_rejects_garbage(self):
+        for cursor in ("", "not-a-cursor", encode_cursor(1.3, 103.8, 10.0, "A1")[:-3]):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+    def test_cursor_outside_singapore_is_rejected(self):
+        service = CarparkService(None, './data/combined_carpark_data.json')
+        service.load_dataset()
+        for lat, lng in [(15.0, 103.8), (1e308, 103.8), (1.3, -1e308)]:
+            with self.assertRaises(HTTPException) as e:
+                asyncio.run(service._search_point(None, "distance", encode_cursor(lat, lng, 10.0, "A1")))
+            self.assertEqual(e.exception.status_code, 400)
+        lat, lng, after = asyncio.run(service._search_point(None, "distance", encode_cursor(1.3, 103.8, 10.0, "A1")))
+        self.assertEqual((lat, lng, after), (1.3, 103.8, (10.0, "A1")))
+
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
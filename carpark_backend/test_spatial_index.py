@@ -0,0 +1,125 @@
+import unittest
+import json
+import itertools
+import math
+
+from spatial_index import SpatialIndex, haversine, decode_polyline, M_PER_DEG_LAT
+from search_cursor import encode_cursor, decode_cursor
+
+
+class TestSpatialIndex(unittest.TestCase):
+    def test_within_radius_matches_full_scan(self):
+        with open('./data/combined_carpark_data.json', 'r') as f:
+            data = json.load(f)
+        index = SpatialIndex.from_carparks(data)
+        lat, lng, radius = 1.2836, 103.8511, 800
+        expected = sorted(
+            cp for cp, info in data.items()
+            if info["coordinates"][0] is not None and haversine(lat, lng, *info["coordinates"]) <= radius
+        )
+        self.assertEqual(sorted(cp for _, cp in index.within_radius(lat, lng, radius)), expected)
+
+    def test_max_within_bounds_every_search(self):
+        with open('./data/combined_carpark_data.json', 'r') as f:
+            data = json.load(f)
+        index = SpatialIndex.from_carparks(data)
+        located = [info["coordinates"] for info in data.values() if info["coordinates"][0] is not None]
+        for radius in (1000, 5000):
+            most = max(len(index.within_radius(lat, lng, radius)) for lat, lng in located[::7])
+            self.assertLessEqual(most, index.max_within(radius))
+        self.assertEqual(SpatialIndex().max_within(1000), 0)
+
+    def test_nearest_pages_match_full_scan(self):
+        with open('./data/combined_carpark_data.json', 'r') as f:
+            data = json.load(f)
+        index = SpatialIndex.from_carparks(data)
+        for lat, lng in [(1.2836, 103.8511), (1.4491, 103.8200), (1.20, 104.10)]:
+            expected = sorted(
+                (haversine(lat, lng, *info["coordinates"]), cp) for cp, info in data.items()
+                if info["coordinates"][0] is not None
+            )
+            self.assertEqual(list(itertools.islice(index.nearest(lat, lng), 50)), expected[:50])
+
+            # page through via cursors, 40 at a time
+            pages, after = [], None
+            for _ in range(5):
+                page = list(itertools.islice(index.nearest(lat, lng, after), 40))
+                pages += page
+                _, _, after = decode_cursor(encode_cursor(lat, lng, *page[-1]))
+            self.assertEqual(pages, expected[:200])
+            self.assertEqual(list(index.nearest(lat, lng, expected[-3])), expected[-2:])
+
+    def test_nearest_from_far_away_only_walks_the_grid(self):
+        with open('./data/combined_carpark_data.json', 'r') as f:
+            data = json.load(f)
+        index = SpatialIndex.from_carparks(data)
+        lat, lng = 15.0, 103.8
+        expected = sorted(
+            (haversine(lat, lng, *info["coordinates"]), cp) for cp, info in data.items()
+            if info["coordinates"][0] is not None
+        )
+        visited = []
+        ring = index._ring
+        index._ring = lambda *args: (visited.append(cell) or cell for cell in ring(*args))
+        self.assertEqual(list(itertools.islice(index.nearest(lat, lng, expected[9]), 10)), expected[10:20])
+        min_x, min_y, max_x, max_y = index.bounds
+        self.assertLessEqual(len(visited), (max_x - min_x + 1) * (max_y - min_y + 1))
+
+    def test_along_route_matches_full_scan(self):
+        with open('./data/combined_carpark_data.json', 'r') as f:
+            data = json.load(f)
+        index = SpatialIndex.from_carparks(data)
+        # Orchard -> Marina Bay -> Tampines, with a long diagonal leg and a repeated vertex
+        route = [(1.3048, 103.8318), (1.2820, 103.8585), (1.2820, 103.8585), (1.3496, 103.9568)]
+        corridor = 400
+
+        def project(lat, lng):
+            return lng * index.m_per_deg_lng, lat * M_PER_DEG_LAT
+
+        expected = {}
+        position = 0.0
+        for a, b in zip(route, route[1:]):
+            (ax, ay), (bx, by) = project(*a), project(*b)
+            length = math.hypot(bx - ax, by - ay)
+            for cp, info in data.items():
+                if info["coordinates"][0] is None:
+                    continue
+                px, py = project(*info["coordinates"])
+                t = ((px - ax) * (bx - ax) + (py - ay) * (by - ay)) / length ** 2 if length else 0.0
+                t = min(1.0, max(0.0, t))
+                d = math.hypot(px - ax - t * (bx - ax), py - ay - t * (by - ay))
+                if d <= corridor and (cp not in expected or d < expected[cp][0]):
+                    expected[cp] = (d, position + t * length)
+            position += length
+
+        hits = index.along_route(route, corridor)
+        self.assertGreater(len(hits), 50)
+        self.assertEqual({cp for _, _, cp in hits}, set(expected))
+        for pos, d, cp in hits:
+            self.assertAlmostEqual(d, expected[cp][0], places=6)
+            self.assertAlmostEqual(pos, expected[cp][1], places=6)
+        self.assertEqual([pos for pos, _, _ in hits], sorted(pos for pos, _, _ in hits))
+        self.assertEqual(index.along_route([], corridor), [])
+        self.assertEqual({cp for _, _, cp in index.along_route(route[:1], 300)},
+                         {cp for _, cp in index.within_radius(*route[0], 300)})
+
+    def test_along_route_looks_at_shared_cells_once(self):
+        with open('./data/combined_carpark_data.json', 'r') as f:
+            data = json.load(f)
+        index = SpatialIndex.from_carparks(data)
+        # Back and forth 200 m, 2000 times: every segment reaches the same cells
+        zigzag = [(1.30 + (k % 2) * 0.0018, 103.85) for k in range(2000)]
+        hits = index.along_route(zigzag, 1000, max_cells=200)
+        self.assertEqual(hits, index.along_route(zigzag[:2], 1000))
+        with self.assertRaises(ValueError):  # across 2 km each time it can't share them
+            index.along_route([(1.30 + (k % 2) * 0.018, 103.85) for k in range(2000)], 1000, max_cells=100000)
+
+    def test_decode_polyline(self):
+        self.assertEqual(decode_polyline("_p~iF~ps|U_ulLnnqC_mqNvxq`@"),
+                         [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)])
+        for garbage in ("_p~iF", "_p~iF~ps|U_ulL", "\x00\x00"):
+            with self.assertRaises(ValueError):
+                decode_polyline(garbage)
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,24 @@
+import unittest
+
+from ura_availability import apply_URA_availability
+
+
+class TestApplyURAAvailability(unittest.TestCase):
+    def test_only_car_lots_are_applied(self):
+        data = {"A0004": {"total_lots": 100, "available_lots": "40"}, "B0012": {"total_lots": 50, "available_lots": "7"}}
+        # URA sends one entry per lot type for the same carpark, motorcycles often last
+        result = [
+            {"carparkNo": "A0004", "lotType": "C", "lotsAvailable": "40"},
+            {"carparkNo": "A0004", "lotType": "M", "lotsAvailable": "3"},
+            {"carparkNo": "B0012", "lotType": "H", "lotsAvailable": "1"},
+            {"carparkNo": "B0012", "lotType": "C", "lotsAvailable": "9"},
+            {"carparkNo": "B0012", "lotType": "M", "lotsAvailable": "12"},
+            {"carparkNo": "Z9999", "lotType": "C", "lotsAvailable": "5"},
+        ]
+        self.assertEqual(apply_URA_availability(data, result), {"B0012": (50, "9")})
+        self.assertEqual((data["A0004"]["available_lots"], data["B0012"]["available_lots"]), ("40", "9"))
+        self.assertEqual(apply_URA_availability(data, result), {})  # same poll again: nothing changed
+
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
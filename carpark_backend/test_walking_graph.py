@@ -0,0 +1,129 @@
+import unittest
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from fastapi import HTTPException
+
+import walking_graph
+from walking_graph import WalkingGraph, build_graph, lines_from_geojson
+from carpark_service import CarparkService
+from spatial_index import haversine
+
+# A canal between the start and NEAR: it's 150 m away in a straight line but the bridge is 500 m south.
+# FAR is 300 m north on the same bank.
+START, FAR, BANK, BRIDGE, NEAR = (1.300, 103.800), (1.3027, 103.800), (1.2955, 103.800), (1.2955, 103.80135), \
+    (1.300, 103.80135)
+
+
+def graph_of(points, edges, **kwargs):
+    u, v, length = zip(*[(a, b, haversine(*points[a], *points[b]) if w is None else w) for a, b, w in edges])
+    lat, lng = zip(*points)
+    return WalkingGraph(np.array(lat), np.array(lng), np.array(u), np.array(v), np.array(length), **kwargs)
+
+
+class TestWalkingGraph(unittest.TestCase):
+    def setUp(self):
+        self.graph = graph_of([START, FAR, BANK, BRIDGE, NEAR],
+                              [(0, 1, None), (0, 2, None), (2, 3, None), (3, 4, None)])
+        self.graph.attach({
+            "NEAR": {"coordinates": list(NEAR)},
+            "FAR": {"coordinates": list(FAR)},
+            "OFFGRAPH": {"coordinates": [1.35, 103.85]},
+            "NOWHERE": {"coordinates": [None, None]},
+        })
+
+    def test_walk_goes_round_the_canal(self):
+        self.assertEqual(set(self.graph.carparks), {"NEAR", "FAR"})
+        walks = self.graph.walking_distances(*START, ["NEAR", "FAR", "OFFGRAPH"])
+        self.assertAlmostEqual(walks["FAR"], haversine(*START, *FAR), places=3)
+        self.assertGreater(walks["NEAR"], 1000)
+        self.assertLess(haversine(*START, *NEAR), walks["FAR"])
+        self.assertNotIn("OFFGRAPH", walks)
+        self.assertEqual(self.graph.walking_distances(1.35, 103.85, ["NEAR"]), {})  # too far from any path
+
+    def test_search_stops_early_and_is_cached(self):
+        walks = self.graph.walking_distances(*START, ["NEAR", "FAR"], enough=1)
+        self.assertEqual(list(walks), ["FAR"])  # NEAR is certainly farther, never reached
+        self.graph.walking_distances(*START, ["NEAR", "FAR"], enough=1)
+        self.assertEqual((self.graph.searches, self.graph.cache_hits), (1, 1))
+
+        walks = self.graph.walking_distances(*START, ["NEAR", "FAR"])  # wants both: searches further
+        self.assertEqual(set(walks), {"NEAR", "FAR"})
+        self.graph.walking_distances(1.30001, 103.80001, ["FAR", "NEAR"])  # snaps to the same start node
+        self.assertEqual((self.graph.searches, self.graph.cache_hits), (2, 2))
+
+    def test_max_walk(self):
+        self.assertEqual(set(self.graph.walking_distances(*START, ["NEAR", "FAR"], max_m=1000)), {"FAR"})
+        self.assertEqual(set(self.graph.walking_distances(*START, ["NEAR", "FAR"])), {"NEAR", "FAR"})
+
+
+class TestBuildGraph(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def test_build_from_geojson(self):
+        path = os.path.join(self.dir, "footpaths.geojson")
+        with open(path, "w") as f:
+            json.dump({"type": "FeatureCollection", "features": [
+                {"type": "Feature", "geometry": {"type": "LineString",
+                                                 "coordinates": [[103.8, 1.3], [103.8001, 1.3], [103.8002, 1.3]]}},
+                {"type": "Feature", "geometry": {"type": "MultiLineString", "coordinates": [
+                    [[103.8002, 1.3], [103.8002, 1.3001]],
+                    [[103.9, 1.4], [103.9001, 1.4]],  # not connected to the rest
+                ]}},
+                {"type": "Feature", "geometry": {"type": "Point", "coordinates": [103.8, 1.3]}},
+            ]}, f)
+        lines = lines_from_geojson(path)
+        self.assertEqual(lines[0], [(1.3, 103.8), (1.3, 103.8001), (1.3, 103.8002)])
+        self.assertEqual(len(lines), 3)
+
+        lat, lng, u, v, length = build_graph(lines, max_merged_edge_m=15)
+        self.assertEqual((len(lat), len(u)), (4, 3))  # the detached piece is dropped, nothing short enough to merge
+
+        output = os.path.join(self.dir, "graph.npz")
+        walking_graph.main(["build", path, output])
+        graph = WalkingGraph.load(output)
+        self.assertEqual((graph.n, len(graph.neighbours) // 2), (2, 1))  # the whole chain is one edge
+        expected = haversine(1.3, 103.8, 1.3, 103.8002) + haversine(1.3, 103.8002, 1.3001, 103.8002)
+        self.assertAlmostEqual(graph.weights[0], expected, places=2)
+        self.assertIsNone(WalkingGraph.load(os.path.join(self.dir, "missing.npz")))
+
+
+class TestWalkingSort(unittest.TestCase):
+    def setUp(self):
+        self.service = CarparkService(None, './data/combined_carpark_data.json')
+        self.service.load_dataset()
+        self.lat, self.lng = 1.3521, 103.8198
+
+    def test_needs_a_graph(self):
+        self.service.walking_graph = None
+        with self.assertRaises(HTTPException) as e:
+            asyncio.run(self.service.find_carpark("bishan", sort="walking"))
+        self.assertEqual(e.exception.status_code, 400)
+
+    def test_reranks_the_shortlist(self):
+        nearest = asyncio.run(self.service.find_nearest_carpark(self.lat, self.lng, 8))
+        points = [(self.lat, self.lng)] + [tuple(self.service.carpark_data[cp["carpark_number"]]["coordinates"])
+                                           for cp in nearest]
+        # A walkway straight to each carpark, except the nearest, which is a long way round
+        edges = [(0, i, 5000.0 if i == 1 else None) for i in range(1, len(points))]
+        self.service.walking_graph = graph_of(points, edges, max_snap_m=5)
+        self.service.walking_graph.attach(self.service.carpark_data)
+
+        results = asyncio.run(self.service._find_at(self.lat, self.lng, 3, None, None, "walking", 1000, None))
+        numbers = [cp["carpark_number"] for cp in results]
+        self.assertEqual(numbers, [cp["carpark_number"] for cp in nearest[1:4]])
+        self.assertEqual([cp["walking_distance"] for cp in results], sorted(cp["walking_distance"] for cp in results))
+
+        everything = asyncio.run(self.service.find_nearest_by_walking(self.lat, self.lng, 8))
+        self.assertEqual(everything[-1]["carpark_number"], nearest[0]["carpark_number"])
+        self.assertIsNone(everything[-1]["walking_distance"])  # beyond WALKING_MAX_M
+
+
+if __name__ == "__main__":
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -2,6 +2,9 @@ import requests, math, json, os, asyncio, logging, time
 from datetime import datetime
 from startup import update_realtime_availability_task, load_HDB_carpark_data, load_URA_carpark_data, parse_ura_feature
 from ura_availability import update_URA_availability
+from circuit_breaker import CircuitOpenError, fetch_json, onemap_breaker, ONEMAP_BASE_URL
+from deadline import DeadlineExceeded
+from fastapi import HTTPException
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -25,15 +28,14 @@ class OneMapTokenManager:
 
     async def get_token(self) -> str:
         if self._access_token and self._expiry > time.time() + 300:
-            logger.info("Using cached OneMap token.")
+            logger.debug("Using cached OneMap token.")
             return self._access_token
 
         logger.info("Requesting new OneMap token...")
-        url = "https://www.onemap.gov.sg/api/auth/post/getToken"
+        url = f"{ONEMAP_BASE_URL}/api/auth/post/getToken"
         try:
-            resp = requests.post(url, json={"email": self.username, "password": self.password})
-            resp.raise_for_status()
-            data = resp.json()
+            data = await fetch_json(onemap_breaker, url, method="POST",
+                                    json={"email": self.username, "password": self.password})
             token = data.get("access_token")
             expiry = data.get("expiry_timestamp")
 
@@ -44,6 +46,8 @@ class OneMapTokenManager:
             self._expiry = int(expiry) / 1000.0
             logger.info(f"OneMap token obtained, expires at {time.ctime(self._expiry)}")
             return token
+        except (CircuitOpenError, DeadlineExceeded):
+            raise
         except Exception as e:
             logger.error(f"Failed to get OneMap token: {e}")
             raise HTTPException(status_code=500, detail="OneMap authentication failed")
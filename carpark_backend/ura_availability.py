@@ -5,11 +5,14 @@ from dotenv import load_dotenv
 import json
 import asyncio
 from fastapi import HTTPException
+from circuit_breaker import CircuitOpenError, fetch_json, ura_breaker, URA_BASE_URL
+from metrics import POLL_SECONDS
 
 load_dotenv()
 URA_ACCESS_KEY = os.getenv('URA_ACCESS_KEY')
 URA_TOKEN = None
 URA_TOKEN_EXPIRY = 0
+URA_POLL_INTERVAL = float(os.getenv("URA_POLL_INTERVAL", "300"))  # seconds
 
 async def get_access_token():
     global URA_TOKEN, URA_TOKEN_EXPIRY
@@ -21,7 +24,7 @@ async def get_access_token():
 
     print("Requesting new URA access token...")
     try:
-        token_url = "https://eservice.ura.gov.sg/uraDataService/insertNewToken/v1"
+        token_url = f"{URA_BASE_URL}/uraDataService/insertNewToken/v1"
             
         headers = {
             "AccessKey": URA_ACCESS_KEY,
@@ -32,17 +35,12 @@ async def get_access_token():
             "Origin": "https://eservice.ura.gov.sg"
             }
 
-        response = requests.get(token_url, headers=headers, timeout=10)
-        print(f"URA Token API Response Status: {response.status_code}")
-        print(f"URA Token API Raw Response Text: '{response.text}'")
-        response.raise_for_status()
-
-        token_data = response.json()
+        token_data = await fetch_json(ura_breaker, token_url, headers=headers)
             
         if token_data and token_data.get('Status') == 'Success' and token_data.get('Result'):
             ura_access_token = token_data['Result'] # The token itself
 
-            ura_token_expiry = time.time() + (3600 * 24) # not sure if it's 24 hours or 12am Singapore time
+            URA_TOKEN_EXPIRY = time.time() + (3600 * 24) # not sure if it's 24 hours or 12am Singapore time
                 
             print(f"Successfully obtained URA access token.")
             URA_TOKEN = ura_access_token
@@ -57,14 +55,32 @@ async def get_access_token():
         raise HTTPException(status_code=500, detail="Failed to parse URA token response.")
 
 
-async def update_URA_availability(dictionary):
-    
+def apply_URA_availability(dictionary, result) -> dict:
+    """Writes a Car_Park_Availability result into dictionary; returns {carpark_number: (total_lots, available_lots)} that changed."""
+    changes = {}
+    for carpark in result:
+        # One entry per lot type (C car, M motorcycle, H heavy vehicle) for the same carparkNo; only car lots
+        # are what we serve, and letting the others through would overwrite them with whichever comes last
+        if carpark.get('lotType') != 'C':
+            continue
+        carpark_number = carpark.get('carparkNo')
+        if carpark_number and carpark_number in dictionary:
+            available_lots = carpark.get('lotsAvailable', 'N/A')
+            current = dictionary[carpark_number]
+            if current.get('available_lots') != available_lots:
+                changes[carpark_number] = (current.get('total_lots', 0), available_lots)
+            current['available_lots'] = available_lots
+    return changes
+
+
+async def update_URA_availability(dictionary, on_update=None):
+    # on_update(source, changes) is called after each poll is applied, with {carpark_number: (total_lots, available_lots)}
+    # for the carparks whose numbers changed
     while True:
-        print("Requesting Real-Time URA carpark availability data...")
         try:
             global URA_ACCESS_KEY, URA_TOKEN
             URA_TOKEN = await get_access_token()
-            url = "https://eservice.ura.gov.sg/uraDataService/invokeUraDS/v1?service=Car_Park_Availability"
+            url = f"{URA_BASE_URL}/uraDataService/invokeUraDS/v1?service=Car_Park_Availability"
                 
             headers = {
                 "AccessKey": URA_ACCESS_KEY,
@@ -76,26 +92,24 @@ async def update_URA_availability(dictionary):
                 "Origin": "https://eservice.ura.gov.sg"
                 }
 
-            response = requests.get(url, headers=headers, timeout=10)
-            print(f"URA Token API Response Status: {response.status_code}")
-            # print(f"URA Token API Raw Response Text: '{response.text}'") # Keep for debugging
-            response.raise_for_status()
+            with POLL_SECONDS.labels("URA", "fetch").time():
+                token_data = await fetch_json(ura_breaker, url, headers=headers)
+            apply_started = time.perf_counter()
 
-            token_data = response.json()
-                
             if token_data and token_data.get('Status') == 'Success' and token_data.get('Result'):
-                print("Successfully obtained URA carpark availability data.")
-                result = token_data['Result']
-                for carpark in result:
-                    carpark_number = carpark.get('carparkNo')
-                    if carpark_number and carpark_number in dictionary:
-                        dictionary[carpark_number]['available_lots'] = carpark.get('lotsAvailable', 'N/A')
+                changes = apply_URA_availability(dictionary, token_data['Result'])
+                if on_update:
+                    on_update("URA", changes)
+                POLL_SECONDS.labels("URA", "apply").observe(time.perf_counter() - apply_started)
             else:
                 raise ValueError(f"URA access token response indicates failure: {token_data}")
+        # Keep polling through upstream trouble; the last-known availability stays in place meanwhile
+        except CircuitOpenError as e:
+            print(f"Skipping URA availability poll, keeping last-known data: {e}")
+        except HTTPException as e:
+            print(f"URA availability poll failed: {e.detail}")
         except requests.exceptions.RequestException as e:
-            print(f"Failed to get URA access token: {e}")
-            raise HTTPException(status_code=500, detail="Failed to authenticate with URA API.")
+            print(f"Failed to fetch URA carpark availability: {e}")
         except (ValueError, KeyError, TypeError, json.JSONDecodeError) as e: # Add JSONDecodeError to catch specific parsing issues
-            print(f"Error parsing URA token response: {e}")
-            raise HTTPException(status_code=500, detail="Failed to parse URA token response.")
-        await asyncio.sleep(300)
+            print(f"Error parsing URA availability response: {e}")
+        await asyncio.sleep(URA_POLL_INTERVAL)
@@ -0,0 +1,294 @@
+# Walking distances over a pedestrian graph, for ranking carparks by how far they are on foot.
+# Straight-line distance points people at carparks across expressways, canals and fenced estates;
+# /find-carpark?sort=walking takes the usual nearest-by-haversine shortlist and re-ranks it by the
+# shortest walk instead.
+#
+# The graph is a local file (PEDESTRIAN_GRAPH_FILE, .npz with node lat / lng and undirected edges u, v,
+# length in metres), built from OpenStreetMap footpaths with `python walking_graph.py build`. Carparks are
+# snapped to their nearest graph node once at load. A query snaps the search point, then runs Dijkstra from
+# it that stops as soon as the nearest `limit` carparks by walk are settled: nothing unsettled can be closer.
+# The distances to every carpark node it settled are cached per start node, so repeat searches from the
+# same spot (the same postcode, mostly) skip the graph search entirely.
+#
+#   python walking_graph.py build footpaths.geojson data/pedestrian_graph.npz
+#
+# footpaths.geojson: LineStrings of walkable ways, e.g. an Overpass export of highway=footway|path|
+# pedestrian|steps|living_street|residential|service plus sidewalks and crossings.
+
+import argparse
+import bisect
+import heapq
+import json
+import logging
+import math
+import os
+from array import array
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from spatial_index import SpatialIndex, haversine
+
+logger = logging.getLogger(__name__)
+
+PEDESTRIAN_GRAPH_FILE = os.getenv("PEDESTRIAN_GRAPH_FILE", "./data/pedestrian_graph.npz")
+WALKING_MAX_M = float(os.getenv("WALKING_MAX_M", "3000"))  # longer walks are treated as unreachable
+WALKING_MAX_SNAP_M = float(os.getenv("WALKING_MAX_SNAP_M", "250"))  # to the nearest graph node
+WALKING_SHORTLIST = int(os.getenv("WALKING_SHORTLIST", "4"))  # haversine shortlist = this x limit
+WALKING_CACHE_SIZE = int(os.getenv("WALKING_CACHE_SIZE", "5000"))  # start nodes with cached distances
+
+
+class WalkingGraph:
+    def __init__(self, lat: np.ndarray, lng: np.ndarray, u: np.ndarray, v: np.ndarray, length: np.ndarray,
+                 max_snap_m: float = WALKING_MAX_SNAP_M, cache_size: int = WALKING_CACHE_SIZE):
+        self.n = len(lat)
+        self.max_snap_m = max_snap_m
+        self.cache_size = cache_size
+        # Adjacency as CSR in compact stdlib arrays: no Python object per node or edge, and indexing
+        # them in the search loop is much cheaper than indexing numpy arrays
+        heads = np.concatenate([u, v]).astype(np.int64)
+        tails = np.concatenate([v, u]).astype(np.int64)
+        weights = np.concatenate([length, length]).astype(np.float64)
+        order = np.argsort(heads, kind="stable")
+        indptr = np.zeros(self.n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(heads, minlength=self.n), out=indptr[1:])
+        self.indptr = array("q", indptr.tobytes())
+        self.neighbours = array("i", tails[order].astype(np.int32).tobytes())
+        self.weights = array("d", weights[order].tobytes())
+
+        self.nodes = SpatialIndex(cell_m=100)
+        for i, (node_lat, node_lng) in enumerate(zip(lat.tolist(), lng.tolist())):
+            self.nodes.insert(i, node_lat, node_lng)
+
+        self.carparks = {}  # carpark_number -> (node, snap metres)
+        self.carpark_nodes = set()
+        self.cache = OrderedDict()  # start node -> (distances to carpark nodes, complete below this distance)
+        self.searches = 0
+        self.cache_hits = 0
+
+    @classmethod
+    def load(cls, path: str = PEDESTRIAN_GRAPH_FILE, **kwargs) -> Optional["WalkingGraph"]:
+        """The graph in path, or None if there's no such file (walking ranking is then unavailable)."""
+        if not path or not os.path.exists(path):
+            logger.info(f"No pedestrian graph at {path}, sort=walking disabled")
+            return None
+        with np.load(path) as f:
+            graph = cls(f["lat"], f["lng"], f["u"], f["v"], f["length"], **kwargs)
+        logger.info(f"Loaded pedestrian graph: {graph.n} nodes, {len(graph.neighbours) // 2} edges")
+        return graph
+
+    def snap(self, lat: float, lng: float) -> Optional[tuple]:
+        """(nearest node, metres to it), or None if no node is within max_snap_m."""
+        for distance, node in self.nodes.nearest(lat, lng):
+            return (node, distance) if distance <= self.max_snap_m else None
+        return None
+
+    def attach(self, carpark_data: dict):
+        """Snaps every carpark to the graph, once per dataset load."""
+        self.carparks, self.cache = {}, OrderedDict()
+        for cp_number, cp_info in carpark_data.items():
+            lat, lng = cp_info["coordinates"]
+            snapped = None if lat is None or lng is None else self.snap(lat, lng)
+            if snapped is not None:
+                self.carparks[cp_number] = snapped
+        self.carpark_nodes = {node for node, _ in self.carparks.values()}
+        logger.info(f"{len(self.carparks)} of {len(carpark_data)} carparks snapped to the pedestrian graph")
+
+    def walking_distances(self, lat: float, lng: float, cp_numbers: list, enough: Optional[int] = None,
+                          max_m: float = WALKING_MAX_M) -> dict:
+        """
+        {carpark_number: walking metres} from (lat, lng) for those of cp_numbers reachable within max_m.
+        With enough=k the search stops once the k nearest of them by walk are certain, so farther ones
+        may be missing. Empty if (lat, lng) is too far from the graph.
+        """
+        start = self.snap(lat, lng)
+        if start is None:
+            return {}
+        start_node, start_snap = start
+        targets = {cp: self.carparks[cp] for cp in cp_numbers if cp in self.carparks}
+        budget = max_m - start_snap
+
+        cached = self.cache.get(start_node)
+        if cached is not None and self._answers(cached, targets, enough, budget):
+            self.cache.move_to_end(start_node)
+            self.cache_hits += 1
+        else:
+            found = self._search(start_node, targets, enough, budget)
+            if cached is not None:
+                # Both are exact; together they're complete up to the farther of the two
+                found = ({**cached[0], **found[0]}, max(cached[1], found[1]))
+            cached = self.cache[start_node] = found
+            self.cache.move_to_end(start_node)
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+        distances, _ = cached
+        walks = {}
+        for cp_number, (node, snap) in targets.items():
+            if node in distances:
+                walk = start_snap + distances[node] + snap
+                if walk <= max_m:
+                    walks[cp_number] = walk
+        return walks
+
+    @staticmethod
+    def _answers(cached: tuple, targets: dict, enough: Optional[int], budget: float) -> bool:
+        distances, complete_below = cached
+        if complete_below > budget or all(node in distances for node, _ in targets.values()):
+            return True
+        # Unsettled targets are at least complete_below away, so these k are the k nearest
+        certain = sum(1 for node, snap in targets.values()
+                      if node in distances and distances[node] + snap <= complete_below)
+        return enough is not None and certain >= enough
+
+    def _search(self, start: int, targets: dict, enough: Optional[int], budget: float) -> tuple:
+        """Dijkstra from start; returns ({carpark node: metres}, distance below which that is complete)."""
+        self.searches += 1
+        indptr, neighbours, weights = self.indptr, self.neighbours, self.weights
+        carpark_nodes = self.carpark_nodes
+        snaps = {}
+        for node, snap in targets.values():
+            snaps.setdefault(node, []).append(snap)
+        remaining = len(snaps)
+        totals = []  # walk to each settled target carpark (minus the start snap), kept sorted
+
+        best = {start: 0.0}
+        settled = set()
+        found = {}
+        heap = [(0.0, start)]
+        while heap:
+            d, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            if d > budget:
+                return found, d
+            if enough is not None and len(totals) >= enough and totals[enough - 1] <= d:
+                return found, d
+            settled.add(node)
+            if node in carpark_nodes:
+                found[node] = d
+                if node in snaps:
+                    for snap in snaps[node]:
+                        bisect.insort(totals, d + snap)
+                    remaining -= 1
+                    if remaining == 0:
+                        return found, d
+            for j in range(indptr[node], indptr[node + 1]):
+                next_node, nd = neighbours[j], d + weights[j]
+                if nd < best.get(next_node, math.inf):
+                    best[next_node] = nd
+                    heapq.heappush(heap, (nd, next_node))
+        return found, math.inf
+
+    def stats(self) -> dict:
+        return {
+            "nodes": self.n,
+            "carparks_snapped": len(self.carparks),
+            "searches": self.searches,
+            "cache_hits": self.cache_hits,
+            "cached_starts": len(self.cache),
+        }
+
+
+# --- building the graph file ------------------------------------------------------------------------
+
+def build_graph(lines: list, max_merged_edge_m: float = 100.0) -> tuple:
+    """
+    (lat, lng, u, v, length) arrays from polylines [[(lat, lng), ...], ...]: vertices shared by lines are
+    joined, only the largest connected piece is kept, and chains of degree-2 nodes are merged into single
+    edges up to max_merged_edge_m long (longer edges would make carparks snap to far-away nodes).
+    """
+    ids, coords, edges = {}, [], {}
+    for line in lines:
+        prev = None
+        for lat, lng in line:
+            key = (round(lat, 7), round(lng, 7))
+            node = ids.setdefault(key, len(ids))
+            if node == len(coords):
+                coords.append(key)
+            if prev is not None and prev != node:
+                pair = (min(prev, node), max(prev, node))
+                length = haversine(*coords[prev], *coords[node])
+                edges[pair] = min(edges.get(pair, math.inf), length)
+            prev = node
+
+    adjacency = {}
+    for (a, b), length in edges.items():
+        adjacency.setdefault(a, {})[b] = length
+        adjacency.setdefault(b, {})[a] = length
+
+    # Largest connected component
+    component, seen = [], set()
+    for root in adjacency:
+        if root in seen:
+            continue
+        seen.add(root)
+        members, stack = [root], [root]
+        while stack:
+            for nxt in adjacency[stack.pop()]:
+                if nxt not in seen:
+                    seen.add(nxt)
+                    members.append(nxt)
+                    stack.append(nxt)
+        if len(members) > len(component):
+            component = members
+    keep = set(component)
+    adjacency = {node: nbrs for node, nbrs in adjacency.items() if node in keep}
+
+    # Merge degree-2 chains
+    for node in list(adjacency):
+        nbrs = adjacency.get(node)
+        if nbrs is None or len(nbrs) != 2:
+            continue
+        (a, wa), (b, wb) = nbrs.items()
+        if wa + wb > max_merged_edge_m:
+            continue
+        merged = min(wa + wb, adjacency[a].get(b, math.inf))
+        del adjacency[a][node], adjacency[b][node], adjacency[node]
+        adjacency[a][b] = adjacency[b][a] = merged
+
+    index = {node: i for i, node in enumerate(adjacency)}
+    lat = np.array([coords[node][0] for node in adjacency], dtype=np.float64)
+    lng = np.array([coords[node][1] for node in adjacency], dtype=np.float64)
+    pairs = [(index[a], index[b], w) for a, nbrs in adjacency.items() for b, w in nbrs.items() if a < b]
+    u = np.array([p[0] for p in pairs], dtype=np.int32)
+    v = np.array([p[1] for p in pairs], dtype=np.int32)
+    length = np.array([p[2] for p in pairs], dtype=np.float32)
+    return lat, lng, u, v, length
+
+
+def lines_from_geojson(path: str) -> list:
+    """[[(lat, lng), ...]] for every LineString / MultiLineString part in a GeoJSON file."""
+    with open(path, "r", encoding="utf-8") as f:
+        features = json.load(f).get("features", [])
+    lines = []
+    for feature in features:
+        geometry = feature.get("geometry") or {}
+        if geometry.get("type") == "LineString":
+            parts = [geometry["coordinates"]]
+        elif geometry.get("type") == "MultiLineString":
+            parts = geometry["coordinates"]
+        else:
+            continue
+        lines += [[(point[1], point[0]) for point in part] for part in parts]  # GeoJSON is (lng, lat)
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pedestrian graph tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build the graph file from GeoJSON footpath lines")
+    build.add_argument("geojson")
+    build.add_argument("output", nargs="?", default=PEDESTRIAN_GRAPH_FILE)
+    build.add_argument("--max-merged-edge-m", type=float, default=100.0)
+    args = parser.parse_args(argv)
+
+    lat, lng, u, v, length = build_graph(lines_from_geojson(args.geojson), args.max_merged_edge_m)
+    np.savez_compressed(args.output, lat=lat, lng=lng, u=u, v=v, length=length)
+    print(f"Wrote {args.output}: {len(lat)} nodes, {len(u)} edges")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()